@@ -0,0 +1,40 @@
+"""
+Atomic file replacement for results, presets and exports: data is written
+to a temporary file next to the target and moved over it in one step, so
+readers never see a partial file.
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+
+
+def _read_umask():
+    """The process umask; there is no way to read it without setting it"""
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+# Read once at import: changing the umask later from a worker thread would
+# briefly apply the wrong one to files other threads create
+_UMASK = _read_umask()
+
+
+@contextmanager
+def atomic_open(path, mode='wb'):
+    """
+    Open a temporary file for writing and move it over path when the block
+    completes; on an error the temporary file is removed and path is left
+    untouched. The file gets the permissions open() would have given it
+    instead of the owner-only mode of temporary files.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
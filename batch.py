@@ -0,0 +1,384 @@
+"""
+Headless batch processing entry point.
+
+Runs the same Chain of Responsibility used by the GUI over whole directories
+of images on a pool of worker processes, without importing Tk.
+
+Example:
+    python batch.py photos/ "more/*.jpg" --seeds seeds.json --output out/ --workers 8
+
+The seed file is JSON. Top-level "background"/"object" lists are shared by
+every image; entries under "images" (keyed by file name or path) override them:
+
+    {
+        "background": [[10, 10], [20, 15]],
+        "object": [[200, 180]],
+        "images": {"shoe_01.jpg": {"object": [[310, 240]]}}
+    }
+
+With --preset, every image is labeled with a color model saved from the GUI
+instead of being fitted on seeds, and no seed file is needed:
+
+    python batch.py photos/ --preset backdrop.json --output out/
+
+With --format seg, each image is written as one small layered result
+holding its masks and a reference to the source instead of three
+composites; with --alpha, the composites keep removed pixels transparent.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from model import ImageProcessingModel
+from chain_handlers import ProcessingPipeline
+from tiled import TiledSegmenter, DEFAULT_MEMORY_BUDGET
+from result_cache import SegmentationCache
+from instrumentation import tracer, span, ChromeTraceWriter
+from engines import available_engines, DEFAULT_ENGINE
+from presets import Preset
+from layers import LAYERS_EXTENSION
+from export import supports_alpha
+from imagefiles import collect_images
+from startup import BASE_MODULES, heavy_modules, import_modules
+
+
+OUTPUT_TYPES = ('object', 'background', 'eroded')
+
+# --format value writing one layered result per image
+LAYERS_FORMAT = LAYERS_EXTENSION.lstrip('.')
+
+# Pipeline instance owned by each worker process
+_worker_pipeline = None
+
+# Trace collector of each worker process when tracing is enabled
+_worker_trace = None
+
+# Band-parallel threads per worker process, so processes x threads fits the cores
+_worker_threads = None
+
+# Preset applied by each worker process instead of fitting on seeds
+_worker_preset = None
+
+
+def load_seeds(seed_path):
+    """Load the seed file"""
+    with open(seed_path) as f:
+        seeds = json.load(f)
+    if not isinstance(seeds, dict):
+        raise ValueError("Seed file must contain a JSON object")
+    return seeds
+
+
+def seeds_for_image(seeds, image_path):
+    """Resolve the background/object points for one image"""
+    per_image = seeds.get('images', {})
+    override = (per_image.get(image_path)
+                or per_image.get(os.path.basename(image_path))
+                or per_image.get(os.path.splitext(os.path.basename(image_path))[0])
+                or {})
+    background = override.get('background', seeds.get('background', []))
+    obj = override.get('object', seeds.get('object', []))
+    return ([tuple(int(v) for v in p) for p in background],
+            [tuple(int(v) for v in p) for p in obj])
+
+
+def output_stems(image_paths):
+    """
+    Map each image path to the stem of its output files: the file name
+    without extension, or for images whose names collide, the path below
+    their common directory, with the extension kept when only that differs
+    (a/img.png and b/img.png give a_img and b_img; img.png and img.jpg give
+    img_png and img_jpg). Raises ValueError if the stems still collide.
+    """
+    groups = {}
+    for path in dict.fromkeys(image_paths):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        groups.setdefault(os.path.normcase(stem), []).append(path)
+    
+    stems = {}
+    for group in groups.values():
+        if len(group) == 1:
+            stems[group[0]] = os.path.splitext(os.path.basename(group[0]))[0]
+            continue
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in group])
+        names = [os.path.relpath(os.path.abspath(p), root) for p in group]
+        without_extension = [os.path.splitext(name)[0] for name in names]
+        if len({os.path.normcase(name) for name in without_extension}) == len(group):
+            names = without_extension
+        for path, name in zip(group, names):
+            stems[path] = name.replace(os.sep, '_').replace('.', '_')
+    
+    owners = {}
+    for path, stem in stems.items():
+        other = owners.setdefault(os.path.normcase(stem), path)
+        if other != path:
+            raise ValueError(f"{other} and {path} would both be written as '{stem}'")
+    return stems
+
+
+def output_path(output_dir, stem, image_type, extension):
+    """Build the output file name for one result image from its output stem"""
+    return os.path.join(output_dir, f"{stem}_{image_type}.{extension}")
+
+
+def _init_worker(cache_dir=None, trace=False, engine=DEFAULT_ENGINE, threads=None, preset=None,
+                 trace_allocations=False):
+    """
+    Create the per-process pipeline, sharing the on-disk result cache if
+    configured, and start collecting trace events if requested, with the
+    bytes allocated in each span if trace_allocations is set.
+    """
+    global _worker_pipeline, _worker_trace, _worker_threads, _worker_preset
+    _worker_threads = threads
+    _worker_preset = preset
+    cache = SegmentationCache(cache_dir=cache_dir) if cache_dir else None
+    _worker_pipeline = ProcessingPipeline(cache=cache, engine=engine)
+    if trace and _worker_trace is None:
+        _worker_trace = tracer.subscribe(ChromeTraceWriter())
+        tracer.enable(trace_allocations=trace_allocations)
+
+
+def _stop_worker_trace():
+    """Stop the tracing started by _init_worker in this process"""
+    global _worker_trace
+    if _worker_trace is not None:
+        tracer.unsubscribe(_worker_trace)
+        tracer.disable()
+        _worker_trace = None
+
+
+def process_one(task):
+    """Process a single image, attaching the worker's trace events when tracing"""
+    image_path, memory_budget = task[0], task[6]
+    with span('batch.image', path=image_path):
+        if memory_budget:
+            result = process_one_tiled(task)
+        else:
+            result = process_one_in_memory(task)
+    
+    if _worker_trace is not None:
+        result['trace_events'] = _worker_trace.events
+        _worker_trace.events = []
+    return result
+
+
+def process_one_in_memory(task):
+    """Run the pipeline for a single image and write its outputs"""
+    image_path, background, obj, output_dir, stem, extension, memory_budget, engine, alpha = task
+    pipeline = _worker_pipeline or ProcessingPipeline(engine=engine)
+    start = time.perf_counter()
+    try:
+        model = ImageProcessingModel(workers=_worker_threads)
+        model.load_image(image_path)
+        model.use_preset(_worker_preset)
+        for x, y in background:
+            model.add_background_point(x, y)
+        for x, y in obj:
+            model.add_object_point(x, y)
+        
+        layered = extension == LAYERS_FORMAT
+        result = pipeline.process(model, render=not (layered or alpha))
+        if not result['success']:
+            return {'path': image_path, 'success': False, 'error': result.get('error'),
+                    'seconds': time.perf_counter() - start}
+        
+        if layered:
+            model.save_layers(os.path.join(output_dir, stem + LAYERS_EXTENSION), image_path)
+        else:
+            for image_type in OUTPUT_TYPES:
+                image = model.renderer(image_type, True)() if alpha else result[image_type]
+                image.save(output_path(output_dir, stem, image_type, extension))
+    except Exception as e:
+        return {'path': image_path, 'success': False, 'error': str(e),
+                'seconds': time.perf_counter() - start}
+    
+    return {'path': image_path, 'success': True, 'error': None,
+            'seconds': time.perf_counter() - start, 'cached': result['cached']}
+
+
+def process_one_tiled(task):
+    """Segment a single image strip by strip within a memory budget"""
+    image_path, background, obj, output_dir, stem, extension, memory_budget, engine, alpha = task
+    start = time.perf_counter()
+    try:
+        segmenter = TiledSegmenter(memory_budget=memory_budget, engine=engine)
+        paths = {t: output_path(output_dir, stem, t, extension) for t in OUTPUT_TYPES}
+        result = segmenter.segment(image_path, background, obj, paths)
+    except Exception as e:
+        return {'path': image_path, 'success': False, 'error': str(e),
+                'seconds': time.perf_counter() - start}
+    
+    return {'path': image_path, 'success': result['success'], 'error': result.get('error'),
+            'seconds': time.perf_counter() - start}
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(results, wall_seconds):
+    """Compute throughput and latency statistics for a batch run"""
+    latencies = sorted(r['seconds'] for r in results)
+    succeeded = sum(1 for r in results if r['success'])
+    return {
+        'images': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'wall_seconds': wall_seconds,
+        'images_per_second': len(results) / wall_seconds if wall_seconds > 0 else 0.0,
+        'latency_p50': _percentile(latencies, 50),
+        'latency_p95': _percentile(latencies, 95),
+        'cache_hits': sum(1 for r in results if r.get('cached')),
+        'failures': [{'path': r['path'], 'error': r['error']} for r in results if not r['success']],
+    }
+
+
+def run_batch(image_paths, seeds, output_dir, workers=None, extension='png', progress=None,
+              memory_budget=None, cache_dir=None, trace_path=None, engine=DEFAULT_ENGINE,
+              preset=None, alpha=False, trace_allocations=True):
+    """
+    Process a list of images on a pool of worker processes.
+    When memory_budget is set, each image is segmented in tiled mode and
+    every worker stays within that many bytes. When cache_dir is set, masks
+    are reused from and stored in the on-disk result cache. When trace_path is
+    set, per-stage timings from every worker are written there as a Chrome trace,
+    with the bytes allocated in each stage unless trace_allocations is False.
+    engine names the segmentation engine from the registry. With a preset,
+    images are labeled with its color model and seeds are ignored.
+    extension 'seg' writes one layered result per image instead of three
+    composites; alpha writes the composites with a transparent background.
+    Images with the same file name are written under names that include
+    their directory or extension, see output_stems.
+    Returns the summary statistics dictionary.
+    """
+    if preset is not None and memory_budget:
+        raise ValueError("Presets are not supported in tiled mode")
+    if memory_budget and (alpha or extension == LAYERS_FORMAT):
+        raise ValueError("Layered and transparent outputs are not supported in tiled mode")
+    if alpha and not supports_alpha(f"image.{extension}"):
+        raise ValueError(f"'{extension}' output cannot store a transparent background")
+    stems = output_stems(image_paths)
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = []
+    for path, stem in stems.items():
+        background, obj = seeds_for_image(seeds, path) if preset is None else ([], [])
+        tasks.append((path, background, obj, output_dir, stem, extension, memory_budget, engine, alpha))
+    
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, min(16, len(tasks) // (workers * 4)))
+    trace = ChromeTraceWriter() if trace_path else None
+    results = []
+    
+    def collect(result):
+        if trace is not None:
+            trace.extend(result.pop('trace_events', []))
+        results.append(result)
+        if progress:
+            progress(result, len(results), len(tasks))
+    
+    start = time.perf_counter()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    if workers == 1:
+        _init_worker(cache_dir, trace is not None, engine, threads, preset, trace_allocations)
+        try:
+            for task in tasks:
+                collect(process_one(task))
+        finally:
+            _stop_worker_trace()
+    else:
+        # Forked workers inherit modules imported here instead of each importing them again
+        import_modules(heavy_modules(engine) if preset is None else BASE_MODULES)
+        with Pool(processes=workers, initializer=_init_worker,
+                  initargs=(cache_dir, trace is not None, engine, threads, preset,
+                            trace_allocations)) as pool:
+            for result in pool.imap_unordered(process_one, tasks, chunksize=chunksize):
+                collect(result)
+    summary = summarize(results, time.perf_counter() - start)
+    
+    if trace is not None:
+        trace.write(trace_path)
+    return summary
+
+
+def _print_progress(result, done, total):
+    """Print one line per processed image"""
+    status = "ok" if result['success'] else f"FAILED: {result['error']}"
+    print(f"[{done}/{total}] {result['path']} ({result['seconds']:.3f}s) {status}")
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Headless batch image segmentation")
+    parser.add_argument('inputs', nargs='+', help="Input directories or glob patterns")
+    parser.add_argument('--seeds', help="JSON seed file (shared and/or per-image points)")
+    parser.add_argument('--preset', help="Segmentation preset saved from the GUI; replaces --seeds")
+    parser.add_argument('--output', required=True, help="Output directory")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--format', default='png',
+                        help=f"Output file extension, or '{LAYERS_FORMAT}' for layered results (default: png)")
+    parser.add_argument('--alpha', action='store_true',
+                        help="Make removed pixels transparent instead of white (png/webp/tiff)")
+    parser.add_argument('--engine', default=DEFAULT_ENGINE, choices=available_engines(),
+                        help="Segmentation engine (default: %(default)s)")
+    parser.add_argument('--tiled', action='store_true',
+                        help="Stream each image in strips with bounded memory (png/ppm/npy output)")
+    parser.add_argument('--memory-budget', type=int, default=DEFAULT_MEMORY_BUDGET // (1024 * 1024),
+                        help="Per-worker memory budget in MiB for --tiled (default: %(default)s)")
+    parser.add_argument('--cache-dir', help="Directory of the persistent segmentation result cache")
+    parser.add_argument('--trace', help="Write per-handler and per-stage timings to this Chrome trace file")
+    parser.add_argument('--no-trace-allocations', action='store_true',
+                        help="Leave allocation sizes out of --trace, which makes tracing cheaper")
+    parser.add_argument('--report', help="Write the summary statistics to this JSON file")
+    parser.add_argument('--quiet', action='store_true', help="Only print the final summary")
+    args = parser.parse_args(argv)
+    if not args.seeds and not args.preset:
+        parser.error("one of --seeds or --preset is required")
+    if args.preset and args.tiled:
+        parser.error("--preset cannot be combined with --tiled")
+    if args.tiled and (args.alpha or args.format == LAYERS_FORMAT):
+        parser.error(f"--alpha and --format {LAYERS_FORMAT} cannot be combined with --tiled")
+    if args.alpha and not supports_alpha(f"image.{args.format}"):
+        parser.error(f"--alpha needs a format with transparency, not '{args.format}'")
+    
+    image_paths = collect_images(args.inputs)
+    if not image_paths:
+        print("No input images found", file=sys.stderr)
+        return 2
+    
+    seeds = load_seeds(args.seeds) if args.seeds else {}
+    preset = Preset.load(args.preset) if args.preset else None
+    try:
+        summary = run_batch(image_paths, seeds, args.output, workers=args.workers,
+                            extension=args.format,
+                            progress=None if args.quiet else _print_progress,
+                            memory_budget=args.memory_budget * 1024 * 1024 if args.tiled else None,
+                            cache_dir=args.cache_dir, trace_path=args.trace, engine=args.engine,
+                            preset=preset, alpha=args.alpha,
+                            trace_allocations=not args.no_trace_allocations)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    
+    print(f"Processed {summary['images']} images in {summary['wall_seconds']:.2f}s "
+          f"({summary['images_per_second']:.2f} images/s), "
+          f"{summary['failed']} failed, {summary['cache_hits']} served from cache")
+    print(f"Latency per image: p50 {summary['latency_p50']:.3f}s, "
+          f"p95 {summary['latency_p95']:.3f}s")
+    
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=2)
+    
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+Benchmark suite for the segmentation pipeline.
+
+Generates synthetic images with known ground-truth masks (and optionally
+reads fixture images), times every stage of the model for each labeling
+engine, records peak memory and mask accuracy, and writes the results as
+JSON. Peak memory comes from tracemalloc, which does not see the buffers
+PIL and OpenCV allocate. When a baseline file is given, regressions make
+the run fail.
+
+Example:
+    python benchmark.py --sizes 0.25 1 4 --output results.json
+    python benchmark.py --baseline results.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+from model import ImageProcessingModel
+from engines import get_engine, available_engines
+
+
+DEFAULT_SIZES = (0.25, 1, 4, 16)
+FULL_SIZES = (0.25, 1, 4, 16, 24, 100)
+
+STAGES = ('load_image', 'kmeans_fit', 'predict', 'mask_build', 'apply_erosion',
+          'render', 'save_image')
+
+# tracemalloc only sees allocations made through Python's allocator (NumPy included)
+PEAK_MEMORY_NOTE = ("peak_bytes is the tracemalloc peak: Python and NumPy allocations only; "
+                    "buffers allocated inside PIL and OpenCV are not counted")
+
+# Besides the registry engines, 'kmeans-predict' runs the K-Means engine
+# but labels every pixel with a direct predict, as a reference point
+REFERENCE_ENGINE = 'kmeans-predict'
+ENGINES = available_engines() + [REFERENCE_ENGINE]
+
+# Differences below these floors are noise, not regressions
+MIN_SECONDS_DELTA = 0.005
+MIN_BYTES_DELTA = 1024 * 1024
+MAX_ACCURACY_DROP = 0.001
+
+
+def synthetic_image(megapixels, seed=0):
+    """
+    Generate a product-shot-like image: a noisy gradient background with a
+    noisy elliptical object. Returns (image_array, truth_mask).
+    """
+    rng = np.random.default_rng(seed)
+    w = int(round((megapixels * 1e6 * 4 / 3) ** 0.5))
+    h = int(round(megapixels * 1e6 / w))
+    
+    image = np.empty((h, w, 3), dtype=np.uint8)
+    truth = np.empty((h, w), dtype=np.uint8)
+    xs = (np.arange(w) - w / 2) / (w * 0.3)
+    ramp = (np.arange(w) * 40 // max(w - 1, 1)).astype(np.uint8)
+    
+    # Build in row bands so even 100 MP images need little temporary memory
+    band = max(1, (1 << 22) // w)
+    for top in range(0, h, band):
+        bottom = min(h, top + band)
+        ys = (np.arange(top, bottom) - h / 2) / (h * 0.35)
+        inside = (xs[np.newaxis, :] ** 2 + ys[:, np.newaxis] ** 2) < 1.0
+        truth[top:bottom] = inside
+        
+        block = image[top:bottom]
+        block[:] = (200, 210, 220)
+        block[..., 0] += ramp
+        block[inside] = (150, 40, 30)
+        noise = rng.integers(-12, 13, size=block.shape, dtype=np.int16)
+        np.clip(block + noise, 0, 255, out=noise)
+        block[:] = noise
+    return image, truth
+
+
+def seeds_from_mask(truth, count=5, seed=0):
+    """Pick deterministic background and object seed points from a ground-truth mask"""
+    rng = np.random.default_rng(seed)
+    points = {}
+    for role, value in (('background', 0), ('object', 1)):
+        ys, xs = np.nonzero(truth[::16, ::16] == value)
+        picks = rng.choice(len(ys), size=min(count, len(ys)), replace=False)
+        points[role] = [(int(xs[i]) * 16, int(ys[i]) * 16) for i in picks]
+    return points['background'], points['object']
+
+
+def load_fixtures(fixture_dir):
+    """Yield (name, image_path, truth_mask) for every <name>.png with a <name>_mask.png"""
+    for name in sorted(os.listdir(fixture_dir)):
+        stem = os.path.splitext(name)[0]
+        if stem.endswith('_mask'):
+            continue
+        mask_path = os.path.join(fixture_dir, stem + '_mask.png')
+        if os.path.exists(mask_path):
+            with Image.open(mask_path) as mask:
+                truth = (np.array(mask.convert('L')) > 127).astype(np.uint8)
+            yield stem, os.path.join(fixture_dir, name), truth
+
+
+class StageRecorder:
+    """Records wall time, and optionally peak traced memory, for each named stage"""
+    
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.peak_bytes = {}
+    
+    @contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        yield
+        self.seconds[name] = time.perf_counter() - start
+        if self.trace_memory:
+            self.peak_bytes[name] = tracemalloc.get_traced_memory()[1]
+
+
+def run_stages(image_path, background_points, object_points, engine, work_dir, recorder):
+    """Run every pipeline stage once under the recorder; returns the object mask"""
+    model = ImageProcessingModel()
+    
+    with recorder.stage('load_image'):
+        model.load_image(image_path)
+    
+    with recorder.stage('kmeans_fit'):
+        segmentation_engine = get_engine('kmeans' if engine == REFERENCE_ENGINE else engine)
+        segmentation_engine.fit(model._gather_seed_pixels(background_points),
+                                model._gather_seed_pixels(object_points))
+    
+    with recorder.stage('predict'):
+        if engine == REFERENCE_ENGINE:
+            pixels = model.image_array.reshape(-1, model.image_array.shape[-1])
+            labels = segmentation_engine.predict(pixels).reshape(model.image_array.shape[:2])
+            del pixels
+        else:
+            labels = segmentation_engine.label(model.image_array, model.band_pool)
+    
+    with recorder.stage('mask_build'):
+        object_mask = segmentation_engine.labels_to_mask(labels, model.band_pool)
+    del labels
+    
+    with recorder.stage('apply_erosion'):
+        eroded_mask = model.apply_erosion(object_mask)
+    model.set_masks(object_mask, eroded_mask)
+    
+    # Compositing the object view, including the Image.fromarray conversion
+    with recorder.stage('render'):
+        model.render('object')
+    
+    with recorder.stage('save_image'):
+        model.save_image('object', os.path.join(work_dir, 'object.png'))
+    return object_mask
+
+
+def measure_peak_memory(image_path, background_points, object_points, engine, work_dir):
+    """
+    Peak traced allocation per stage, measured in a separate untimed pass.
+    Memory that PIL and OpenCV allocate themselves is not traced.
+    """
+    # tracemalloc sees NumPy buffers but slows Python code, so it is kept out of the timing runs
+    recorder = StageRecorder(trace_memory=True)
+    tracemalloc.start()
+    try:
+        run_stages(image_path, background_points, object_points, engine, work_dir, recorder)
+    finally:
+        tracemalloc.stop()
+    return recorder.peak_bytes
+
+
+def mask_accuracy(object_mask, truth):
+    """Intersection-over-union and pixel accuracy of an object mask"""
+    predicted = object_mask.astype(bool)
+    expected = truth.astype(bool)
+    union = np.count_nonzero(predicted | expected)
+    intersection = np.count_nonzero(predicted & expected)
+    return {
+        'iou': intersection / union if union else 1.0,
+        'pixel_accuracy': float(np.count_nonzero(predicted == expected)) / expected.size,
+    }
+
+
+def benchmark_image(name, image_path, truth, engines, repeat, work_dir):
+    """Benchmark one image with every engine"""
+    background_points, object_points = seeds_from_mask(truth)
+    megapixels = truth.size / 1e6
+    results = []
+    for engine in engines:
+        best = None
+        for _ in range(repeat):
+            recorder = StageRecorder()
+            object_mask = run_stages(image_path, background_points, object_points,
+                                     engine, work_dir, recorder)
+            timings = recorder.seconds
+            best = timings if best is None else {s: min(best[s], timings[s]) for s in STAGES}
+        peaks = measure_peak_memory(image_path, background_points, object_points,
+                                    engine, work_dir)
+        results.append({
+            'image': name,
+            'megapixels': round(megapixels, 3),
+            'engine': engine,
+            'stages': {s: {'seconds': best[s], 'peak_bytes': peaks.get(s, 0)} for s in STAGES},
+            'total_seconds': sum(best.values()),
+            'accuracy': mask_accuracy(object_mask, truth),
+        })
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of human-readable regressions against a baseline result set"""
+    reference = {(r['image'], r['engine']): r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        base = reference.get((result['image'], result['engine']))
+        if base is None:
+            continue
+        label = f"{result['image']} [{result['engine']}]"
+        for stage, current in result['stages'].items():
+            previous = base['stages'].get(stage)
+            if previous is None:
+                continue
+            delta = current['seconds'] - previous['seconds']
+            if delta > MIN_SECONDS_DELTA and current['seconds'] > previous['seconds'] * (1 + tolerance):
+                regressions.append(f"{label} {stage}: {previous['seconds']:.4f}s -> "
+                                   f"{current['seconds']:.4f}s")
+            delta = current['peak_bytes'] - previous['peak_bytes']
+            if delta > MIN_BYTES_DELTA and current['peak_bytes'] > previous['peak_bytes'] * (1 + tolerance):
+                regressions.append(f"{label} {stage} peak memory: {previous['peak_bytes']} -> "
+                                   f"{current['peak_bytes']} bytes")
+        for metric, value in result['accuracy'].items():
+            if value < base['accuracy'][metric] - MAX_ACCURACY_DROP:
+                regressions.append(f"{label} {metric}: {base['accuracy'][metric]:.4f} -> {value:.4f}")
+    return regressions
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the segmentation pipeline stages")
+    parser.add_argument('--sizes', type=float, nargs='+', default=None,
+                        help=f"Synthetic image sizes in megapixels (default: {' '.join(map(str, DEFAULT_SIZES))})")
+    parser.add_argument('--full', action='store_true',
+                        help=f"Use the full size range {' '.join(map(str, FULL_SIZES))} MP")
+    parser.add_argument('--fixtures', help="Directory of <name>.png + <name>_mask.png fixture pairs")
+    parser.add_argument('--engines', nargs='+', default=ENGINES, choices=ENGINES)
+    parser.add_argument('--repeat', type=int, default=3, help="Timing runs per image; the fastest counts")
+    parser.add_argument('--output', help="Write the results JSON to this file")
+    parser.add_argument('--baseline', help="Compare against this results JSON and fail on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative slowdown or memory growth (default: 0.25)")
+    args = parser.parse_args(argv)
+    
+    sizes = args.sizes or (FULL_SIZES if args.full else DEFAULT_SIZES)
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for megapixels in sizes:
+            image, truth = synthetic_image(megapixels)
+            image_path = os.path.join(work_dir, 'input.png')
+            Image.fromarray(image).save(image_path, compress_level=1)
+            del image
+            name = f"synthetic-{megapixels:g}mp"
+            print(f"Benchmarking {name}...", file=sys.stderr)
+            results.extend(benchmark_image(name, image_path, truth, args.engines,
+                                           args.repeat, work_dir))
+        
+        if args.fixtures:
+            for name, image_path, truth in load_fixtures(args.fixtures):
+                print(f"Benchmarking fixture {name}...", file=sys.stderr)
+                results.extend(benchmark_image(f"fixture-{name}", image_path, truth,
+                                               args.engines, args.repeat, work_dir))
+    
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'peak_bytes': PEAK_MEMORY_NOTE,
+        },
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Performance regressions against baseline:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print("No regressions against baseline", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
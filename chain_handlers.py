@@ -1,35 +1,66 @@
 from abc import ABC, abstractmethod
 
+from instrumentation import span
+from parallel import Cancelled
+
+
+def cancelled_result():
+    """Result of a job stopped through its cancel event"""
+    return {'success': False, 'cancelled': True, 'error': 'Processing cancelled.'}
+
 
 class Handler(ABC):
     """
     Abstract Handler for Chain of Responsibility pattern.
     Each handler processes a request and passes it to the next handler.
+    Before forwarding, the chain checks the request's cancel event and
+    reports the next stage to the request's progress callback.
     """
     
+    # Human-readable stage name used in progress reports
+    stage_name = "Processing"
+    
     def __init__(self):
         self._next_handler = None
+        self.step = 1
+        self.total_steps = 1
     
     def set_next(self, handler):
         """Set the next handler in the chain"""
         self._next_handler = handler
         return handler
     
+    def start(self, request):
+        """Report this stage and run it, unless the request was cancelled"""
+        cancel_event = request.get('cancel_event')
+        if cancel_event is not None and cancel_event.is_set():
+            return cancelled_result()
+        
+        progress = request.get('progress')
+        if progress:
+            progress(self.stage_name, self.step, self.total_steps)
+        
+        # Handler spans nest, since each handler forwards to the next one
+        with span(f"handler.{type(self).__name__}", category='handler'):
+            return self.handle(request)
+    
     @abstractmethod
     def handle(self, request):
         """Process the request"""
         if self._next_handler:
-            return self._next_handler.handle(request)
+            return self._next_handler.start(request)
         return request
 
 
 class ValidationHandler(Handler):
     """Validate that an image has been loaded"""
     
+    stage_name = "Validating image"
+    
     def handle(self, request):
         model = request.get('model')
         
-        if model.original_image is None:
+        if model.image_array is None:
             return {'success': False, 'error': 'No image loaded. Please upload an image first.'}
         
         return super().handle(request)
@@ -38,9 +69,15 @@ class ValidationHandler(Handler):
 class PointSelectionHandler(Handler):
     """Validate that sufficient points have been selected"""
     
+    stage_name = "Checking points"
+    
     def handle(self, request):
         model = request.get('model')
         
+        # A preset brings its own color model, so no seeds are needed
+        if model.preset is not None:
+            return super().handle(request)
+        
         if not model.background_points:
             return {'success': False, 'error': 'No background points selected. Please select at least one background point.'}
         
@@ -51,35 +88,77 @@ class PointSelectionHandler(Handler):
 
 
 class SegmentationHandler(Handler):
-    """Perform K-Means segmentation"""
+    """Perform K-Means segmentation, reusing cached masks when available"""
+    
+    stage_name = "Segmenting image"
+    
+    def __init__(self, cache=None, engine=None):
+        super().__init__()
+        self.cache = cache
+        self.engine = engine
     
     def handle(self, request):
         model = request.get('model')
         
-        success = model.perform_kmeans_segmentation()
+        # A pipeline-level engine choice overrides the model's
+        if self.engine is not None and self.engine != model.engine_name:
+            model.set_engine(self.engine)
+        
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(model.image_digest(), model.background_points,
+                                      model.object_points, model.segmentation_params())
+            cached = self.cache.get(key)
+            if cached is not None:
+                model.set_masks(*cached)
+                request['cache_hit'] = True
+                return super().handle(request)
+        
+        try:
+            success = model.perform_kmeans_segmentation(on_coarse=request.get('on_coarse'),
+                                                        cancel_event=request.get('cancel_event'))
+        except Cancelled:
+            return cancelled_result()
         
         if not success:
             return {'success': False, 'error': 'Segmentation failed. Please ensure points are properly selected.'}
         
+        if key is not None:
+            self.cache.put(key, model.object_mask, model.eroded_mask)
+        
         return super().handle(request)
 
 
 class ResultGenerationHandler(Handler):
     """Generate final results"""
     
+    stage_name = "Generating results"
+    
     def handle(self, request):
         model = request.get('model')
         
-        object_img = model.get_segmented_object()
-        background_img = model.get_segmented_background()
-        eroded_img = model.get_eroded_object()
+        # Callers that write the masks themselves skip compositing
+        if not request.get('render', True):
+            if model.has_results():
+                return {'success': True, 'cached': request.get('cache_hit', False)}
+            return {'success': False, 'error': 'Failed to generate results.'}
+        
+        # Composite at display resolution when the caller only needs previews
+        size = None
+        if request.get('result_size') and model.has_results():
+            size = model.fit_size(*request['result_size'])
+        
+        object_img = model.get_segmented_object(size)
+        background_img = model.get_segmented_background(size)
+        eroded_img = model.get_eroded_object(size)
         
         if object_img and background_img and eroded_img:
             return {
                 'success': True,
                 'object': object_img,
                 'background': background_img,
-                'eroded': eroded_img
+                'eroded': eroded_img,
+                'cached': request.get('cache_hit', False)
             }
         
         return {'success': False, 'error': 'Failed to generate results.'}
@@ -88,20 +167,40 @@ class ResultGenerationHandler(Handler):
 class ProcessingPipeline:
     """
     Sets up the Chain of Responsibility for image processing.
+    An optional SegmentationCache lets repeated runs skip the segmentation,
+    and engine selects a segmentation engine from the registry by name.
     """
     
-    def __init__(self):
+    def __init__(self, cache=None, engine=None):
         # Create handlers
         self.validation = ValidationHandler()
         self.point_selection = PointSelectionHandler()
-        self.segmentation = SegmentationHandler()
+        self.segmentation = SegmentationHandler(cache, engine)
         self.result_generation = ResultGenerationHandler()
         
         # Chain handlers together
         self.validation.set_next(self.point_selection).set_next(
             self.segmentation).set_next(self.result_generation)
+        
+        self.handlers = [self.validation, self.point_selection,
+                         self.segmentation, self.result_generation]
+        for step, handler in enumerate(self.handlers, start=1):
+            handler.step = step
+            handler.total_steps = len(self.handlers)
     
-    def process(self, model):
-        """Execute the processing pipeline"""
-        request = {'model': model}
-        return self.validation.handle(request)
+    def process(self, model, progress=None, cancel_event=None, result_size=None, on_coarse=None,
+                render=True):
+        """
+        Execute the processing pipeline.
+        progress: optional callable(stage_name, step, total_steps) called as each stage starts.
+        cancel_event: optional threading.Event; once set, the segmentation stops at its
+        next step or band and the remaining stages are skipped.
+        result_size: optional (max_width, max_height) to render the outputs for display
+        instead of at full resolution.
+        on_coarse: optional callable(coarse_mask) receiving the first-pass mask
+        in coarse-to-fine mode.
+        render: if False, only the masks are computed and the result has no images.
+        """
+        request = {'model': model, 'progress': progress, 'cancel_event': cancel_event,
+                   'result_size': result_size, 'on_coarse': on_coarse, 'render': render}
+        return self.validation.start(request)
@@ -1,5 +1,16 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 from model import ImageProcessingModel
+from pyramid import ImagePyramid, load_preview
 from chain_handlers import ProcessingPipeline
+from result_cache import SegmentationCache, DEFAULT_DISK_BUDGET
+from export import ExportQueue, EncoderSettings, format_name, supports_alpha
+from layers import load_layers
+from presets import Preset
+from prefetch import ImageFolder, Prefetcher
+from workspace import Workspace
 
 
 class ImageSegmentationController:
@@ -8,40 +19,410 @@ class ImageSegmentationController:
     Handles user actions and updates the view accordingly.
     """
     
-    def __init__(self, model, view):
+    def __init__(self, model, view, cache_dir=None, disk_budget=DEFAULT_DISK_BUDGET):
+        """
+        cache_dir optionally keeps segmentation masks on disk between
+        sessions, using at most disk_budget bytes; without it masks are
+        only cached in memory.
+        """
         self.model = model
         self.view = view
-        self.pipeline = ProcessingPipeline()
+        self.cache = SegmentationCache(cache_dir=cache_dir, disk_budget=disk_budget)
+        self.pipeline = ProcessingPipeline(cache=self.cache)
+        
+        # Background processing state; a newer job supersedes older ones
+        self._job_id = 0
+        self._cancel_event = None
+        
+        # Image loading state; only the newest load is applied
+        self._load_id = 0
+        self._loading = False
+        
+        # Folder being worked through; its neighbouring images are decoded ahead.
+        # Folders are listed in the background and only the newest listing is used.
+        self.folder = None
+        self._folder_id = 0
+        self.prefetcher = Prefetcher()
+        
+        # Images opened before stay open with their seeds and results
+        self.workspace = Workspace()
+        
+        # Layered result waiting for its source image to finish loading
+        self._pending_layers = None
+        
+        # Live preview state: one worker computes only the newest request,
+        # and only the newest preview is displayed
+        self.live_preview = False
+        self._preview_job_id = 0
+        self._preview_executor = ThreadPoolExecutor(1, thread_name_prefix='preview')
+        self._preview_lock = threading.Lock()
+        self._preview_request = None
+        
+        # Exports are encoded in the background; image_path names "save all" outputs
+        self.exporter = ExportQueue()
+        self.image_path = None
         
         # Set controller reference in view
         self.view.set_controller(self)
     
     def load_image(self, file_path):
-        """Load an image from file path"""
+        """
+        Load an image from file path. Its folder is listed in the background;
+        once that is done, the other images of the folder can be stepped
+        through with next_image and previous_image.
+        """
+        self.folder = ImageFolder([file_path])
+        self._load(file_path)
+        self._list_folder(file_path, self._on_folder_listed)
+    
+    def open_folder(self, directory):
+        """Work through the images of a directory, starting with the first once it is listed"""
+        self._list_folder(directory, self._on_folder_opened)
+    
+    def _list_folder(self, path, on_listed):
+        """
+        List a folder on the read-ahead thread, since large folders take a
+        while, and call on_listed(folder, error) on the UI thread unless
+        another image or folder was opened meanwhile
+        """
+        self._folder_id += 1
+        folder_id = self._folder_id
+        
+        def listed(future):
+            try:
+                folder, error = future.result(), None
+            except Exception as e:
+                folder, error = None, str(e)
+            self.view.run_on_ui_thread(
+                lambda: self._on_folder_result(folder_id, on_listed, folder, error))
+        
+        self.prefetcher.open_folder(path).add_done_callback(listed)
+    
+    def _on_folder_result(self, folder_id, on_listed, folder, error):
+        """Hand a listed folder to its callback if it is still wanted"""
+        if folder_id == self._folder_id:
+            on_listed(folder, error)
+    
+    def _on_folder_listed(self, folder, error):
+        """Step through the folder of an image opened on its own once it is listed"""
+        if folder is None or not _same_file(folder.current, self.folder.current):
+            return
+        self.folder = folder
+        if not self._loading and self.image_path is not None:
+            self._show_folder_position()
+            self._read_ahead()
+    
+    def _on_folder_opened(self, folder, error):
+        """Load the first image of a folder opened by the user"""
+        if folder is None:
+            self.view.show_message("Error", f"Failed to open folder: {error}", "error")
+            return
+        self.folder = folder
+        self._load(folder.current)
+    
+    def next_image(self):
+        """Load the next image of the folder"""
+        self._step(1)
+    
+    def previous_image(self):
+        """Load the previous image of the folder"""
+        self._step(-1)
+    
+    def _step(self, step):
+        """Move through the folder by step images and load the image reached"""
+        if self.folder is None:
+            return
+        file_path = self.folder.move(step)
+        if file_path is None:
+            self.view.show_status("Last image of the folder" if step > 0 else "First image of the folder")
+            return
+        self._load(file_path)
+    
+    def _load(self, file_path):
+        """
+        Load one image of the folder and then read ahead its neighbours.
+        The image shown so far stays open in the workspace. An image that is
+        open or already decoded by the read-ahead is installed at once;
+        otherwise a reduced-resolution preview is painted first when the
+        format allows it, and the full decode and display pyramid are built
+        on a worker thread.
+        """
+        self.cancel_processing()
+        # A preview of the image shown so far must not land on the next one
+        self._preview_job_id += 1
+        if self.image_path is not None and self.model.image_array is not None:
+            self.workspace.store(self.image_path, self.model.get_state())
+        self._load_id += 1
+        load_id = self._load_id
+        canvas_size = self.view.canvas_size()
+        if file_path not in self.workspace and not self.prefetcher.is_ready(file_path):
+            try:
+                preview, original_size = load_preview(file_path, *canvas_size)
+            except Exception as e:
+                self._loading = False
+                self.view.show_message("Error", f"Failed to load image: {str(e)}", "error")
+                return
+            if preview is not None:
+                self.view.display_original_image(preview, original_size)
+        
+        self._loading = True
+        
+        worker = threading.Thread(target=self._decode_image,
+                                  args=(load_id, file_path, canvas_size), daemon=True)
+        worker.start()
+    
+    def _decode_image(self, load_id, file_path, canvas_size):
+        """
+        Worker thread body: page the image back in if it is open, otherwise
+        decode it and build its pyramid
+        """
         try:
-            self.model.load_image(file_path)
-            original_image = self.model.get_original_image()
-            self.view.display_original_image(original_image)
+            # Spill the images opened longest ago first, off the UI thread
+            self.workspace.trim()
+            state = self.workspace.open(file_path)
+            if state is None:
+                image_array, pyramid = self.prefetcher.get(file_path)
+                state = {'image_array': image_array, 'pyramid': pyramid}
+            elif state['pyramid'] is None:
+                state['pyramid'] = ImagePyramid(state['image_array'])
+            display_image = state['pyramid'].fit(*canvas_size)
         except Exception as e:
-            self.view.show_message("Error", f"Failed to load image: {str(e)}", "error")
+            error = str(e)
+            self.view.run_on_ui_thread(lambda: self._on_load_failed(load_id, error))
+            return
+        self.view.run_on_ui_thread(
+            lambda: self._on_image_decoded(load_id, file_path, state, display_image))
+    
+    def _on_image_decoded(self, load_id, file_path, state, display_image):
+        """Install a decoded or reopened image in the model unless a newer load started"""
+        if load_id != self._load_id:
+            return
+        self._loading = False
+        self.model.set_state(state)
+        self.image_path = file_path
+        self.workspace.store(file_path, self.model.get_state(), active=True)
+        self.view.display_original_image(display_image, self.model.pyramid.size)
+        self._show_folder_position()
+        self.view.show_open_images(self.workspace.paths())
+        if self.model.has_results():
+            self._display_results()
+        if len(self.model.background_points) or len(self.model.object_points):
+            self.view.refresh_view()
+        # Read ahead only now, so decoding the neighbours never delays this image
+        self._read_ahead()
+        
+        layers, self._pending_layers = self._pending_layers, None
+        if layers is not None and _same_file(layers['source'], file_path):
+            self._apply_layers(layers)
+    
+    def _show_folder_position(self):
+        """Show where the current image is in its folder"""
+        self.view.show_folder_position(self.folder.index + 1, len(self.folder),
+                                       os.path.basename(self.folder.current))
+    
+    def _read_ahead(self):
+        """Decode the neighbours of the current image; open ones are paged in from the workspace"""
+        self.prefetcher.schedule([p for p in self.folder.neighbours() if p not in self.workspace])
+    
+    def _on_load_failed(self, load_id, error):
+        """Report a failed load unless a newer load started"""
+        if load_id == self._load_id:
+            self._loading = False
+            self.view.show_message("Error", f"Failed to load image: {error}", "error")
+    
+    def render_view(self, box, size, resample):
+        """
+        Render the visible region of the original image and its seeds for
+        the zoomable canvas; None while an image is still loading
+        """
+        if self._loading:
+            return None
+        return self.model.render_view(box, size, resample)
     
     def add_background_point(self, x, y):
         """Add a background point"""
+        self._stop_using_preset()
         self.model.add_background_point(x, y)
+        self._request_preview()
     
     def add_object_point(self, x, y):
         """Add an object point"""
+        self._stop_using_preset()
         self.model.add_object_point(x, y)
+        self._request_preview()
+    
+    def add_background_stroke(self, points, radius):
+        """Add every pixel of a brush stroke as background"""
+        self._stop_using_preset()
+        self.model.add_background_stroke(points, radius)
+        self._request_preview()
+    
+    def add_object_stroke(self, points, radius):
+        """Add every pixel of a brush stroke as object"""
+        self._stop_using_preset()
+        self.model.add_object_stroke(points, radius)
+        self._request_preview()
     
     def clear_points(self):
         """Clear all selected points"""
         self.model.clear_points()
+        self._preview_job_id += 1
+    
+    def save_preset(self, file_path):
+        """Save the color model of the current seeds and the edge settings as a preset"""
+        try:
+            self.model.set_morphology(**self.view.morphology_settings())
+            Preset.from_model(self.model).save(file_path)
+        except (ValueError, TypeError, OSError) as e:
+            self.view.show_message("Error", f"Failed to save preset: {str(e)}", "error")
+            return
+        self.view.show_status(f"Saved preset {os.path.basename(file_path)}")
+    
+    def load_preset(self, file_path):
+        """Segment with a saved preset instead of the seed points"""
+        try:
+            preset = Preset.load(file_path)
+        except (ValueError, OSError) as e:
+            self.view.show_message("Error", f"Failed to load preset: {str(e)}", "error")
+            return
+        self.model.use_preset(preset)
+        self.view.set_morphology_settings(preset.morphology)
+        self.view.show_status(f"Using preset {os.path.basename(file_path)}")
+        if self.model.image_array is not None:
+            self.process_image()
+    
+    def _stop_using_preset(self):
+        """Go back to fitting on seeds once the user places new ones"""
+        if self.model.preset is not None:
+            self.model.use_preset(None)
+            self.view.show_status("Preset cleared, using seed points")
+    
+    def set_coarse_to_fine(self, enabled):
+        """Turn coarse-to-fine labeling with progressive results on or off"""
+        self.model.set_coarse_to_fine(8 if enabled else None)
+    
+    def set_live_preview(self, enabled):
+        """Turn the live segmentation preview on or off"""
+        self.live_preview = enabled
+        if enabled:
+            self._request_preview()
+        else:
+            self._preview_job_id += 1
+            self.view.clear_preview()
+    
+    def _request_preview(self):
+        """
+        Recompute the preview mask on the preview worker. A request replaces
+        the one still waiting, so clicks made during a fit coalesce into one.
+        """
+        if not self.live_preview or self.model.image_array is None:
+            return
+        
+        self._preview_job_id += 1
+        request = (self._preview_job_id, self.model.image_token,
+                   self.model.background_points.copy(), self.model.object_points.copy())
+        with self._preview_lock:
+            waiting = self._preview_request is not None
+            self._preview_request = request
+        if not waiting:
+            self._preview_executor.submit(self._run_preview)
+    
+    def _run_preview(self):
+        """Worker thread body for the live preview: compute the newest request"""
+        with self._preview_lock:
+            request, self._preview_request = self._preview_request, None
+        job_id, image_token, background_points, object_points = request
+        # Superseded since it was requested, by clear_points or an image load
+        if job_id != self._preview_job_id:
+            return
+        try:
+            mask = self.model.compute_preview(background_points, object_points,
+                                              image_token=image_token)
+        except Exception:
+            mask = None
+        self.view.run_on_ui_thread(lambda: self._on_preview(job_id, mask))
+    
+    def _on_preview(self, job_id, mask):
+        """Show a finished preview unless a newer one was requested"""
+        if job_id == self._preview_job_id and mask is not None:
+            self.view.display_preview_mask(mask)
     
     def process_image(self):
-        """Process the image using the Chain of Responsibility pipeline"""
-        result = self.pipeline.process(self.model)
+        """
+        Process the image using the Chain of Responsibility pipeline on a
+        background thread. A job already in flight is cancelled and superseded.
+        """
+        try:
+            self.model.set_morphology(**self.view.morphology_settings())
+        except (ValueError, TypeError) as e:
+            self.view.show_message("Error", f"Invalid edge settings: {str(e)}", "error")
+            return
+        
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+        
+        self._job_id += 1
+        job_id = self._job_id
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+        
+        snapshot = self.model.snapshot()
+        self.view.show_progress("Starting", 0, len(self.pipeline.handlers))
+        worker = threading.Thread(target=self._run_pipeline,
+                                  args=(job_id, snapshot, cancel_event), daemon=True)
+        worker.start()
+    
+    def cancel_processing(self):
+        """Cancel the job in flight, if any"""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self._cancel_event = None
+            self._job_id += 1
+            self.view.hide_progress("Processing cancelled")
+    
+    def _run_pipeline(self, job_id, snapshot, cancel_event):
+        """Worker thread body: run the pipeline and hand the result to the UI thread"""
+        def progress(stage_name, step, total_steps):
+            self.view.run_on_ui_thread(
+                lambda: self._on_progress(job_id, stage_name, step, total_steps))
+        
+        def on_coarse(coarse_mask):
+            self.view.run_on_ui_thread(lambda: self._on_coarse(job_id, coarse_mask))
+        
+        try:
+            result = self.pipeline.process(snapshot, progress=progress, cancel_event=cancel_event,
+                                           result_size=self.view.result_size, on_coarse=on_coarse)
+        except Exception as e:
+            result = {'success': False, 'error': f"Processing failed: {str(e)}"}
+        
+        self.view.run_on_ui_thread(lambda: self._on_finished(job_id, snapshot, result))
+    
+    def _on_progress(self, job_id, stage_name, step, total_steps):
+        """Show stage progress of the current job"""
+        if job_id == self._job_id:
+            self.view.show_progress(stage_name, step, total_steps)
+    
+    def _on_coarse(self, job_id, coarse_mask):
+        """Show the coarse result of the current job while its edges are refined"""
+        if job_id != self._job_id or self.model.image_array is None:
+            return
+        size = self.model.fit_size(*self.view.result_size)
+        self.view.display_results(*self.model.preview_results(coarse_mask, size))
+        self.view.show_status("Refining edges...")
+    
+    def _on_finished(self, job_id, snapshot, result):
+        """Apply the result of a finished job, unless it was superseded"""
+        if job_id != self._job_id:
+            return
+        self._cancel_event = None
+        
+        if result.get('cancelled'):
+            self.view.hide_progress("Processing cancelled")
+            return
         
         if result['success']:
+            self.model.adopt_results(snapshot)
+            self.view.hide_progress("Done")
             # Display results
             self.view.display_results(
                 result['object'],
@@ -50,16 +431,113 @@ class ImageSegmentationController:
             )
             self.view.show_message("Success", "Image processing completed successfully!")
         else:
+            self.view.hide_progress("")
             # Show error message
             self.view.show_message("Error", result.get('error', 'Processing failed'), "error")
     
     def save_image(self, image_type, file_path):
-        """Save a processed image"""
+        """Export one processed image in the background"""
+        alpha = self.view.export_alpha()
+        if alpha and not supports_alpha(file_path):
+            self.view.show_message("Error", "This format cannot store a transparent background", "error")
+            return
+        render = self.model.renderer(image_type, alpha)
+        if render is None:
+            self.view.show_message("Error", "Failed to save image", "error")
+            return
+        self._export([(render, file_path)])
+    
+    def save_all(self, directory, template, extension):
+        """Export the object, background and eroded images at once, named by template"""
+        if not self.model.has_results():
+            self.view.show_message("Error", "Process an image before saving", "error")
+            return
+        alpha = self.view.export_alpha()
+        if alpha and not supports_alpha(f"image.{extension}"):
+            self.view.show_message("Error", "This format cannot store a transparent background", "error")
+            return
+        stem = os.path.splitext(os.path.basename(self.image_path or "image"))[0]
         try:
-            success = self.model.save_image(image_type, file_path)
-            if success:
-                self.view.show_message("Success", f"Image saved successfully to {file_path}")
-            else:
-                self.view.show_message("Error", "Failed to save image", "error")
-        except Exception as e:
-            self.view.show_message("Error", f"Failed to save image: {str(e)}", "error")
+            jobs = [(self.model.renderer(image_type, alpha),
+                     os.path.join(directory, format_name(template, stem, image_type, extension)))
+                    for image_type in self.model.RESULT_TYPES]
+        except ValueError as e:
+            self.view.show_message("Error", str(e), "error")
+            return
+        self._export(jobs)
+    
+    def save_layers(self, file_path):
+        """Save the masks as one compact layered result file referencing the image"""
+        if not self.model.has_results() or self.image_path is None:
+            self.view.show_message("Error", "Process an image before saving", "error")
+            return
+        try:
+            self.model.save_layers(file_path, self.image_path)
+        except OSError as e:
+            self.view.show_message("Error", f"Failed to save layers: {str(e)}", "error")
+            return
+        self.view.show_status(f"Saved {file_path}")
+    
+    def load_layers(self, file_path):
+        """Show a saved layered result, loading its source image first if needed"""
+        try:
+            layers = load_layers(file_path)
+        except (ValueError, OSError) as e:
+            self.view.show_message("Error", f"Failed to load layers: {str(e)}", "error")
+            return
+        if (not self._loading and self.image_path is not None
+                and _same_file(layers['source'], self.image_path)):
+            self._apply_layers(layers)
+            return
+        if not os.path.exists(layers['source']):
+            self.view.show_message("Error", f"Source image not found: {layers['source']}", "error")
+            return
+        self.load_image(layers['source'])
+        self._pending_layers = layers
+    
+    def _apply_layers(self, layers):
+        """Install the masks of a layered result and display the outputs"""
+        self.cancel_processing()
+        try:
+            self.model.apply_layers(layers)
+        except ValueError as e:
+            self.view.show_message("Error", f"Failed to load layers: {str(e)}", "error")
+            return
+        self._display_results()
+        self.view.show_status(f"Loaded layers of {os.path.basename(layers['source'])}")
+    
+    def _display_results(self):
+        """Show the outputs of the model's current masks at display size"""
+        size = self.model.fit_size(*self.view.result_size)
+        self.view.display_results(*(self.model.render(image_type, size)
+                                    for image_type in self.model.RESULT_TYPES))
+    
+    def _export(self, jobs):
+        """Queue export jobs with the encoder settings chosen in the view"""
+        try:
+            settings = EncoderSettings(**self.view.encoder_settings())
+        except (ValueError, TypeError) as e:
+            self.view.show_message("Error", f"Invalid export settings: {str(e)}", "error")
+            return
+        self.view.show_status(f"Saving {len(jobs)} image{'s' if len(jobs) > 1 else ''}...")
+        self.exporter.submit(jobs, settings,
+                             lambda results: self.view.run_on_ui_thread(
+                                 lambda: self._on_exported(results)))
+    
+    def _on_exported(self, results):
+        """Report a finished export group without blocking the window"""
+        failed = [r for r in results if not r['success']]
+        if failed:
+            errors = "\n".join(f"{r['path']}: {r['error']}" for r in failed)
+            self.view.show_status(f"Failed to save {len(failed)} of {len(results)} images")
+            self.view.show_message("Error", f"Failed to save image:\n{errors}", "error")
+        elif len(results) == 1:
+            self.view.show_status(f"Saved {results[0]['path']}")
+        else:
+            self.view.show_status(f"Saved {len(results)} images to "
+                                  f"{os.path.dirname(results[0]['path'])}")
+
+
+def _same_file(path, other):
+    """Whether two paths name the same file"""
+    return os.path.normcase(os.path.abspath(path)) == os.path.normcase(os.path.abspath(other))
@@ -0,0 +1,271 @@
+"""
+Registry of segmentation engines.
+
+An engine is trained on the seed pixel colors and then labels every pixel of
+an image with a cluster index; `object_cluster` tells which index is the
+object. Engines are selected by name, so the pipeline, the batch CLI and the
+tiled mode can switch between them without code changes. scikit-learn is only
+imported by the engines that use it.
+"""
+import numpy as np
+
+from labeling import PaletteLabeler
+from parallel import map_bands
+
+
+_ENGINES = {}
+
+DEFAULT_ENGINE = 'kmeans'
+
+
+def register_engine(name):
+    """Class decorator adding an engine to the registry under name"""
+    def decorator(cls):
+        cls.name = name
+        _ENGINES[name] = cls
+        return cls
+    return decorator
+
+
+def get_engine(name=DEFAULT_ENGINE, **params):
+    """Create an engine by name"""
+    try:
+        cls = _ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown segmentation engine '{name}'. "
+                         f"Available engines: {', '.join(available_engines())}")
+    return cls(**params)
+
+
+def available_engines():
+    """Names of all registered engines"""
+    return sorted(_ENGINES)
+
+
+def required_modules(name=DEFAULT_ENGINE):
+    """Modules an engine imports lazily, for preloading them ahead of use"""
+    return _ENGINES[name].modules
+
+
+class SegmentationEngine:
+    """Base class for engines"""
+    
+    name = None
+    
+    # Heavy modules imported on first fit
+    modules = ()
+    
+    def __init__(self):
+        self.centroids = None
+        self.object_cluster = None
+    
+    def params(self):
+        """Parameters that determine the result, used for cache keys"""
+        return {'engine': self.name}
+    
+    def state(self):
+        """The trained color model as plain data, e.g. for a preset file"""
+        return {'centroids': np.asarray(self.centroids, dtype=np.float64).tolist(),
+                'object_cluster': int(self.object_cluster)}
+    
+    def restore(self, centroids, object_cluster):
+        """Use a color model saved by state() instead of fitting. Returns self."""
+        centroids = np.asarray(centroids, dtype=np.float64)
+        if centroids.ndim != 2 or len(centroids) != 2:
+            raise ValueError("A color model needs exactly two centroids")
+        if object_cluster not in (0, 1):
+            raise ValueError("The object cluster must be 0 or 1")
+        self.centroids = centroids
+        self.object_cluster = int(object_cluster)
+        return self
+    
+    def fit(self, background_pixels, object_pixels, init_centroids=None):
+        """
+        Train on the seed colors. init_centroids optionally warm-starts the
+        fit from previous centroids (background first). Returns self.
+        """
+        raise NotImplementedError
+    
+    def predict(self, pixels):
+        """Cluster index for each row of an (n, channels) pixel array"""
+        raise NotImplementedError
+    
+    def label(self, image_array, pool=None):
+        """
+        Cluster index for every pixel as an (h, w) uint8 array, computed in
+        row bands on pool (a parallel.BandPool) if given
+        """
+        return PaletteLabeler(self.predict).label(image_array, pool)
+    
+    def object_mask(self, image_array, pool=None):
+        """uint8 mask that is 1 where a pixel belongs to the object"""
+        return self.labels_to_mask(self.label(image_array, pool), pool)
+    
+    def labels_to_mask(self, labels, pool=None):
+        """
+        Turn a label array into the uint8 object mask, reusing its buffer
+        when the labels are already uint8
+        """
+        mask = labels if labels.dtype == np.uint8 else np.empty(labels.shape, np.uint8)
+        
+        def compare_band(top, bottom):
+            np.equal(labels[top:bottom], self.object_cluster, out=mask[top:bottom], casting='unsafe')
+        map_bands(pool, compare_band, *labels.shape)
+        return mask
+
+
+class _SklearnEngine(SegmentationEngine):
+    """Shared logic of the scikit-learn clustering engines"""
+    
+    modules = ('sklearn.cluster',)
+    
+    def _make_estimator(self, init_centroids):
+        raise NotImplementedError
+    
+    def fit(self, background_pixels, object_pixels, init_centroids=None):
+        # Create training data with labels
+        X_train = np.concatenate([np.asarray(background_pixels), np.asarray(object_pixels)])
+        
+        self.estimator = self._make_estimator(init_centroids)
+        self.estimator.fit(X_train)
+        self.centroids = self.estimator.cluster_centers_
+        
+        # Determine which cluster is object and which is background
+        # Use majority voting from labeled points
+        bg_cluster_votes = self.estimator.predict(np.array(background_pixels))
+        bg_cluster = np.bincount(bg_cluster_votes).argmax()
+        self.object_cluster = 1 - bg_cluster
+        return self
+    
+    def restore(self, centroids, object_cluster):
+        super().restore(centroids, object_cluster)
+        self.estimator = None
+        return self
+    
+    def predict(self, pixels):
+        if self.estimator is None:
+            # Restored model: the nearest centroid, as KMeans.predict decides it
+            pixels = np.asarray(pixels, dtype=np.float64)
+            distances = (self.centroids * self.centroids).sum(axis=1) - 2 * pixels @ self.centroids.T
+            return distances.argmin(axis=1)
+        return self.estimator.predict(pixels)
+
+
+@register_engine('kmeans')
+class KMeansEngine(_SklearnEngine):
+    """scikit-learn KMeans with 2 clusters; the reference engine"""
+    
+    def __init__(self, n_init=10, random_state=42):
+        super().__init__()
+        self.n_init = n_init
+        self.random_state = random_state
+    
+    def params(self):
+        return {'engine': self.name, 'n_clusters': 2, 'n_init': self.n_init,
+                'random_state': self.random_state}
+    
+    def _make_estimator(self, init_centroids):
+        from sklearn.cluster import KMeans
+        
+        if init_centroids is not None:
+            return KMeans(n_clusters=2, init=np.asarray(init_centroids, dtype=np.float64), n_init=1)
+        return KMeans(n_clusters=2, random_state=self.random_state, n_init=self.n_init)
+
+
+@register_engine('minibatch')
+class MiniBatchKMeansEngine(_SklearnEngine):
+    """scikit-learn MiniBatchKMeans with 2 clusters"""
+    
+    def __init__(self, n_init=3, batch_size=1024, random_state=42):
+        super().__init__()
+        self.n_init = n_init
+        self.batch_size = batch_size
+        self.random_state = random_state
+    
+    def params(self):
+        return {'engine': self.name, 'n_clusters': 2, 'n_init': self.n_init,
+                'batch_size': self.batch_size, 'random_state': self.random_state}
+    
+    def _make_estimator(self, init_centroids):
+        from sklearn.cluster import MiniBatchKMeans
+        
+        if init_centroids is not None:
+            return MiniBatchKMeans(n_clusters=2, init=np.asarray(init_centroids, dtype=np.float64),
+                                   n_init=1, batch_size=self.batch_size,
+                                   random_state=self.random_state)
+        return MiniBatchKMeans(n_clusters=2, n_init=self.n_init, batch_size=self.batch_size,
+                               random_state=self.random_state)
+
+
+@register_engine('numpy')
+class NearestCentroidEngine(SegmentationEngine):
+    """
+    Pure-NumPy engine: the centroids are the mean seed colors and pixels
+    are assigned to the nearest one. Distances are computed in float32, or
+    exactly in int64 on rounded centroids, one cache-sized chunk at a time,
+    so 8-bit images are never upcast to float64. Images with more than 8
+    bits per channel use float64, since float32 cannot hold their squared
+    distances exactly.
+    """
+    
+    def __init__(self, dtype='float32', chunk_size=1 << 16):
+        super().__init__()
+        if dtype not in ('float32', 'int'):
+            raise ValueError("dtype must be 'float32' or 'int'")
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+    
+    def params(self):
+        return {'engine': self.name, 'dtype': self.dtype}
+    
+    def fit(self, background_pixels, object_pixels, init_centroids=None):
+        # The seed means are the exact optimum, so warm starts are not needed
+        self.centroids = np.array([np.mean(np.asarray(background_pixels, dtype=np.float64), axis=0),
+                                   np.mean(np.asarray(object_pixels, dtype=np.float64), axis=0)])
+        self.object_cluster = 1
+        self._prepare()
+        return self
+    
+    def restore(self, centroids, object_cluster):
+        super().restore(centroids, object_cluster)
+        self._prepare()
+        return self
+    
+    def _prepare(self):
+        """Precompute the distance terms of the centroids"""
+        if self.dtype == 'int':
+            # 16-bit channels overflow int32: 2 * 65535 * 65535 > 2**31
+            centroids = np.rint(self.centroids).astype(np.int64)
+            self._weights = (2 * centroids).T
+        else:
+            centroids = self.centroids.astype(np.float32)
+            self._weights = (2 * centroids).T
+        # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c); ||x||^2 is the same for every centroid
+        self._offsets = (centroids * centroids).sum(axis=1)
+    
+    def predict(self, pixels):
+        pixels = np.asarray(pixels)
+        labels = np.empty(len(pixels), dtype=np.uint8)
+        weights, offsets = self._weights, self._offsets
+        if self.dtype == 'int':
+            work_dtype = np.int64
+        elif pixels.dtype.itemsize == 1:
+            work_dtype = np.float32
+        else:
+            work_dtype = np.float64
+            weights, offsets = 2 * self.centroids.T, (self.centroids * self.centroids).sum(axis=1)
+        for start in range(0, len(pixels), self.chunk_size):
+            chunk = pixels[start:start + self.chunk_size].astype(work_dtype)
+            distances = offsets - chunk @ weights
+            labels[start:start + len(chunk)] = distances.argmin(axis=1)
+        return labels
+    
+    def label(self, image_array, pool=None):
+        h, w = image_array.shape[:2]
+        labels = np.empty((h, w), dtype=np.uint8)
+        
+        def label_band(top, bottom):
+            band = image_array[top:bottom]
+            labels[top:bottom] = self.predict(band.reshape((bottom - top) * w, -1)).reshape(bottom - top, w)
+        map_bands(pool, label_band, h, w)
+        return labels
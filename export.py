@@ -0,0 +1,143 @@
+"""
+Background export of result images.
+
+Encoding a large PNG takes seconds, so exports run on a small thread pool
+instead of the UI thread. The outputs of one "save all" are encoded in
+parallel (Pillow releases the GIL while compressing), and the caller is
+notified once the whole group has been written.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from atomicfile import atomic_open
+from instrumentation import span
+
+
+# Default naming template of "save all": one file per output type
+DEFAULT_NAME_TEMPLATE = "{stem}_{type}"
+
+# Formats offered for export, by file extension
+EXPORT_FORMATS = ('png', 'jpg', 'webp')
+
+
+class EncoderSettings:
+    """Encoder options applied to every export"""
+    
+    def __init__(self, png_compress_level=6, jpeg_quality=90, webp_quality=90, webp_lossless=False):
+        if not 0 <= png_compress_level <= 9:
+            raise ValueError("PNG compression level must be between 0 and 9")
+        if not 1 <= jpeg_quality <= 100 or not 1 <= webp_quality <= 100:
+            raise ValueError("Quality must be between 1 and 100")
+        self.png_compress_level = png_compress_level
+        self.jpeg_quality = jpeg_quality
+        self.webp_quality = webp_quality
+        self.webp_lossless = webp_lossless
+    
+    def save_options(self, image_format):
+        """Keyword arguments for Image.save in the given PIL format"""
+        if image_format == 'PNG':
+            return {'compress_level': self.png_compress_level}
+        if image_format == 'JPEG':
+            return {'quality': self.jpeg_quality}
+        if image_format == 'WEBP':
+            return {'quality': self.webp_quality, 'lossless': self.webp_lossless}
+        return {}
+
+
+# PIL formats that keep an alpha channel
+ALPHA_FORMATS = ('PNG', 'WEBP', 'TIFF')
+
+
+def supports_alpha(file_path):
+    """Whether the format chosen by the file extension can store transparency"""
+    extension = os.path.splitext(file_path)[1].lower()
+    return Image.registered_extensions().get(extension) in ALPHA_FORMATS
+
+
+def format_name(template, stem, image_type, extension):
+    """
+    Build a file name from a naming template. Available fields are {stem}
+    (input file name without extension), {type} and {date}.
+    """
+    try:
+        name = template.format(stem=stem, type=image_type, date=time.strftime('%Y%m%d'))
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"Invalid naming template '{template}': {e}")
+    return f"{name}.{extension.lstrip('.')}"
+
+
+def save_image(image, file_path, settings=None):
+    """
+    Encode image to file_path with the encoder settings. The file is written
+    under a temporary name and renamed, so a failed export never leaves a
+    truncated file behind.
+    """
+    settings = settings or EncoderSettings()
+    extension = os.path.splitext(file_path)[1].lower()
+    image_format = Image.registered_extensions().get(extension)
+    if image_format is None:
+        raise ValueError(f"Unsupported file extension '{extension}'")
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    
+    with atomic_open(file_path) as f:
+        image.save(f, format=image_format, **settings.save_options(image_format))
+
+
+class ExportQueue:
+    """Encodes and writes groups of images on background threads"""
+    
+    def __init__(self, workers=3):
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix='export')
+        self._lock = threading.Lock()
+        self.pending = 0
+    
+    def submit(self, jobs, settings=None, on_done=None):
+        """
+        Export a group of images in parallel. jobs is a list of (render, path)
+        pairs where render() returns the PIL Image to write. Once every job
+        has finished, on_done(results) is called on a worker thread with one
+        {'path', 'success', 'error', 'seconds'} dict per job, in job order.
+        """
+        jobs = list(jobs)
+        results = [None] * len(jobs)
+        remaining = [len(jobs)]
+        with self._lock:
+            self.pending += len(jobs)
+        
+        def run(index, render, path):
+            results[index] = self._export(render, path, settings)
+            with self._lock:
+                self.pending -= 1
+                remaining[0] -= 1
+                finished = remaining[0] == 0
+            if finished and on_done is not None:
+                on_done(results)
+        
+        for index, (render, path) in enumerate(jobs):
+            self._executor.submit(run, index, render, path)
+    
+    def shutdown(self, wait=True):
+        """Stop accepting exports; with wait, finish the queued ones first"""
+        self._executor.shutdown(wait=wait)
+    
+    @staticmethod
+    def _export(render, path, settings):
+        """Render and encode one image, capturing any error"""
+        start = time.perf_counter()
+        try:
+            with span('export.render', path=path):
+                image = render()
+            if image is None:
+                raise ValueError("No result to export")
+            with span('export.encode', path=path):
+                save_image(image, path, settings)
+        except Exception as e:
+            return {'path': path, 'success': False, 'error': str(e),
+                    'seconds': time.perf_counter() - start}
+        return {'path': path, 'success': True, 'error': None,
+                'seconds': time.perf_counter() - start}
@@ -0,0 +1,34 @@
+"""
+Finding image files on disk. Shared by the batch tools and the folder
+navigation of the application, so the application does not import the
+command line tools.
+"""
+import glob
+import os
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tif', '.tiff', '.webp')
+
+
+def collect_images(inputs):
+    """Expand directories and glob patterns into a sorted list of image paths"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                candidate = os.path.join(item, name)
+                if os.path.isfile(candidate) and name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(candidate)
+        else:
+            matches = sorted(glob.glob(item))
+            paths.extend(p for p in matches if os.path.isfile(p))
+    
+    # Drop duplicates while keeping order
+    seen = set()
+    unique = []
+    for path in paths:
+        key = os.path.abspath(path)
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
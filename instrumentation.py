@@ -0,0 +1,190 @@
+"""
+Timing and memory instrumentation for the processing pipeline.
+
+Code marks regions with `with span("name"):`. While instrumentation is
+disabled (the default) a span is a shared no-op context manager, so the
+cost is one attribute check. Once enabled, every span produces a structured
+event delivered to the subscribed callbacks; ChromeTraceWriter is a
+subscriber that saves the events in Chrome trace format (chrome://tracing,
+Perfetto).
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+
+class _NullSpan:
+    """Context manager used while instrumentation is disabled"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Measures one region and publishes an event when it exits"""
+    
+    __slots__ = ('instrumentation', 'name', 'category', 'args', 'parent',
+                 '_start', '_cpu_start', '_process_cpu_start', '_alloc_start')
+    
+    def __init__(self, instrumentation, name, category, args):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.category = category
+        self.args = args
+        self.parent = None
+    
+    def __enter__(self):
+        stack = self.instrumentation._stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self._alloc_start = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None
+        self._cpu_start = time.thread_time()
+        self._process_cpu_start = time.process_time()
+        self._start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        cpu_end = time.thread_time()
+        process_cpu_end = time.process_time()
+        self.instrumentation._stack().pop()
+        
+        event = {
+            'name': self.name,
+            'category': self.category,
+            'parent': self.parent,
+            'start': self._start,
+            'wall_seconds': end - self._start,
+            # CPU time of the span's own thread; process CPU time also counts
+            # the band workers it waits on, and anything else running meanwhile
+            'cpu_seconds': cpu_end - self._cpu_start,
+            'process_cpu_seconds': process_cpu_end - self._process_cpu_start,
+            'alloc_bytes': None,
+            'pid': os.getpid(),
+            'thread': threading.get_ident(),
+            'args': self.args,
+            'error': exc_type.__name__ if exc_type else None,
+        }
+        if self._alloc_start is not None and tracemalloc.is_tracing():
+            event['alloc_bytes'] = tracemalloc.get_traced_memory()[0] - self._alloc_start
+        self.instrumentation._publish(event)
+        return False
+
+
+class Instrumentation:
+    """Collects span events and delivers them to subscribers"""
+    
+    def __init__(self):
+        self.enabled = False
+        self._subscribers = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracemalloc = False
+    
+    def enable(self, trace_allocations=False):
+        """
+        Turn instrumentation on. With trace_allocations, tracemalloc is
+        started so events carry the net bytes allocated inside each span.
+        """
+        if trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.enabled = True
+    
+    def disable(self):
+        """Turn instrumentation off"""
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+    
+    def subscribe(self, callback):
+        """Call callback(event) for every finished span"""
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+        return callback
+    
+    def unsubscribe(self, callback):
+        """Stop delivering events to callback"""
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not callback]
+    
+    def span(self, name, category='pipeline', **args):
+        """Context manager timing a named region"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args)
+    
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+    
+    def _publish(self, event):
+        for callback in self._subscribers:
+            callback(event)
+
+
+class ChromeTraceWriter:
+    """Subscriber that accumulates events and writes a Chrome trace JSON file"""
+    
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+    
+    def __call__(self, event):
+        self.add(event)
+    
+    def add(self, event):
+        """Convert one span event to a Chrome 'complete' event"""
+        args = dict(event['args'])
+        args['cpu_ms'] = round(event['cpu_seconds'] * 1000, 3)
+        args['process_cpu_ms'] = round(event['process_cpu_seconds'] * 1000, 3)
+        if event['alloc_bytes'] is not None:
+            args['alloc_bytes'] = event['alloc_bytes']
+        if event['error']:
+            args['error'] = event['error']
+        trace_event = {
+            'name': event['name'],
+            'cat': event['category'],
+            'ph': 'X',
+            'ts': event['start'] * 1e6,
+            'dur': event['wall_seconds'] * 1e6,
+            'pid': event['pid'],
+            'tid': event['thread'],
+            'args': args,
+        }
+        with self._lock:
+            self.events.append(trace_event)
+    
+    def extend(self, trace_events):
+        """Merge already converted events, e.g. collected in worker processes"""
+        with self._lock:
+            self.events.extend(trace_events)
+    
+    def write(self, path):
+        """Save the trace"""
+        with self._lock:
+            events = sorted(self.events, key=lambda e: e['ts'])
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Process-wide instrumentation used by the handlers and the model
+tracer = Instrumentation()
+
+
+def span(name, category='pipeline', **args):
+    """Time a region with the process-wide instrumentation"""
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return _Span(tracer, name, category, args)
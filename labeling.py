@@ -0,0 +1,149 @@
+import numpy as np
+
+from parallel import map_bands
+
+
+class PaletteLabeler:
+    """
+    Labels every pixel of an image by classifying each distinct color once.
+    Photos have far fewer distinct colors than pixels, so the classifier only
+    sees the palette and the per-pixel labels are filled in with a single
+    vectorized gather. The output is identical to predicting every pixel.
+    """
+    
+    # RGB images with at least this many pixels use a full 24-bit lookup table
+    # instead of sorting the packed colors. Filling the 16 MiB table costs a
+    # few milliseconds, which the sort already exceeds at about 0.3 MP.
+    LUT_MIN_PIXELS = 1 << 18
+    
+    def __init__(self, predict, chunk_size=1 << 18):
+        """
+        predict: callable mapping an (n, channels) pixel array to n labels,
+        e.g. a fitted KMeans.predict.
+        """
+        self.predict = predict
+        self.chunk_size = chunk_size
+    
+    def label(self, image_array, pool=None):
+        """
+        Return an (h, w) uint8 label array for the image. With a BandPool,
+        large images are packed and gathered in parallel row bands.
+        """
+        if image_array.ndim == 2:
+            image_array = image_array[:, :, np.newaxis]
+        h, w, channels = image_array.shape
+        
+        if pool is not None and len(pool.bands(h, w)) > 1:
+            return self._label_bands(image_array, pool)
+        
+        if image_array.dtype == np.uint8 and channels <= 4:
+            codes = self._pack(image_array)
+            if channels == 3 and h * w >= self.LUT_MIN_PIXELS:
+                labels = self._label_with_table(codes)
+            else:
+                palette, inverse = np.unique(codes, return_inverse=True)
+                labels = self._predict_colors(self._unpack(palette, channels))[inverse]
+            return labels.reshape(h, w)
+        
+        # Generic fallback for other dtypes: unique rows of the pixel matrix
+        pixels = image_array.reshape(-1, channels)
+        palette, inverse = np.unique(pixels, axis=0, return_inverse=True)
+        return self._predict_colors(palette)[inverse.reshape(-1)].reshape(h, w)
+    
+    def _label_bands(self, image_array, pool):
+        """Parallel labeling; the palette is still classified once for the whole image"""
+        h, w, channels = image_array.shape
+        labels = np.empty((h, w), dtype=np.uint8)
+        
+        if image_array.dtype != np.uint8 or channels != 3:
+            # Without a 24-bit table each band classifies its own palette
+            def label_band(top, bottom):
+                labels[top:bottom] = self.label(image_array[top:bottom])
+            map_bands(pool, label_band, h, w)
+            return labels
+        
+        # Concurrent bands only ever store True, so they can share the presence array
+        present = np.zeros(1 << 24, dtype=bool)
+        
+        def mark_band(top, bottom):
+            present[self._pack(image_array[top:bottom])] = True
+        map_bands(pool, mark_band, h, w)
+        
+        palette = np.flatnonzero(present).astype(np.uint32)
+        del present
+        table = np.zeros(1 << 24, dtype=np.uint8)
+        table[palette] = self._predict_colors(self._unpack(palette, 3))
+        
+        def gather_band(top, bottom):
+            codes = self._pack(image_array[top:bottom])
+            labels[top:bottom] = table[codes].reshape(bottom - top, w)
+        map_bands(pool, gather_band, h, w)
+        return labels
+    
+    def _label_with_table(self, codes):
+        """Classify the colors present in the image and gather through a 24-bit table"""
+        present = np.zeros(1 << 24, dtype=bool)
+        present[codes] = True
+        palette = np.flatnonzero(present).astype(np.uint32)
+        del present
+        
+        table = np.zeros(1 << 24, dtype=np.uint8)
+        table[palette] = self._predict_colors(self._unpack(palette, 3))
+        return table[codes]
+    
+    def _predict_colors(self, colors):
+        """Predict labels for a palette in bounded-size chunks"""
+        labels = np.empty(len(colors), dtype=np.uint8)
+        for start in range(0, len(colors), self.chunk_size):
+            chunk = colors[start:start + self.chunk_size]
+            labels[start:start + len(chunk)] = self.predict(chunk)
+        return labels
+    
+    @staticmethod
+    def _pack(image_array):
+        """Pack uint8 channels into one uint32 code per pixel"""
+        channels = image_array.shape[2]
+        codes = image_array[:, :, 0].astype(np.uint32).reshape(-1)
+        for c in range(1, channels):
+            codes <<= 8
+            codes |= image_array[:, :, c].reshape(-1)
+        return codes
+    
+    @staticmethod
+    def _unpack(codes, channels):
+        """Unpack uint32 codes back into an (n, channels) uint8 color array"""
+        colors = np.empty((len(codes), channels), dtype=np.uint8)
+        for c in range(channels):
+            shift = 8 * (channels - 1 - c)
+            colors[:, c] = (codes >> shift) & 0xFF
+        return colors
+
+
+class ColorTableLabeler(PaletteLabeler):
+    """
+    Labels RGB tiles through a 24-bit color table that persists across calls.
+    Colors are classified the first time they are seen, so streaming an image
+    tile by tile never classifies the same color twice.
+    """
+    
+    UNKNOWN = 255
+    
+    def __init__(self, predict, chunk_size=1 << 18):
+        super().__init__(predict, chunk_size)
+        self.table = np.full(1 << 24, self.UNKNOWN, dtype=np.uint8)
+    
+    def label(self, image_array, pool=None):
+        """Return an (h, w) uint8 label array for an RGB uint8 tile"""
+        if image_array.dtype != np.uint8 or image_array.ndim != 3 or image_array.shape[2] != 3:
+            return super().label(image_array, pool)
+        
+        h, w = image_array.shape[:2]
+        codes = self._pack(image_array)
+        labels = self.table[codes]
+        unknown = labels == self.UNKNOWN
+        if unknown.any():
+            missing = codes[unknown]
+            palette = np.unique(missing)
+            self.table[palette] = self._predict_colors(self._unpack(palette, 3))
+            labels[unknown] = self.table[missing]
+        return labels.reshape(h, w)
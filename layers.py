@@ -0,0 +1,100 @@
+"""
+Compact layered result files.
+
+Instead of three full-size composites, a layered result stores a reference
+to the source image and the object and eroded masks, each run-length
+encoded or bit-packed, whichever is smaller, in one compressed NumPy
+archive. A typical mask of a few large regions shrinks to a few kilobytes,
+and the composites can be rebuilt from the source at any time. The source
+is referenced by a path relative to the result file and by the content
+digest of its pixels, so a reload can tell when the image has changed.
+"""
+import json
+import os
+
+import numpy as np
+
+from atomicfile import atomic_open
+from options import LAYERS_EXTENSION
+
+
+LAYERS_VERSION = 1
+
+
+def encode_mask(mask):
+    """
+    Encode a 0/1 mask as (encoding, data): 'rle' with the lengths of the
+    alternating runs, starting with a run of zeros, or 'packed' with
+    np.packbits, whichever is smaller
+    """
+    flat = mask.ravel()
+    n = len(flat)
+    if n == 0:
+        return 'packed', np.packbits(flat)
+    boundaries = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    if 4 * (len(boundaries) + 2) >= (n + 7) // 8:
+        return 'packed', np.packbits(flat)
+    edges = np.concatenate(([0], boundaries, [n]))
+    runs = np.diff(edges).astype(np.uint32)
+    if flat[0]:
+        runs = np.concatenate((np.zeros(1, np.uint32), runs))
+    return 'rle', runs
+
+
+def decode_mask(encoding, data, shape):
+    """Rebuild a uint8 mask of shape from encode_mask output"""
+    count = int(np.prod(shape))
+    if encoding == 'packed':
+        if len(data) * 8 < count:
+            raise ValueError("Packed mask is shorter than its shape")
+        return np.unpackbits(data, count=count).reshape(shape)
+    if encoding == 'rle':
+        if int(data.sum(dtype=np.int64)) != count:
+            raise ValueError("Run lengths do not add up to the mask size")
+        values = (np.arange(len(data)) & 1).astype(np.uint8)
+        return np.repeat(values, data).reshape(shape)
+    raise ValueError(f"Unknown mask encoding '{encoding}'")
+
+
+def save_layers(path, object_mask, eroded_mask, source_path, source_digest=None):
+    """
+    Write a layered result to path, replacing the file atomically.
+    source_path is stored relative to the result file when possible.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        source = os.path.relpath(os.path.abspath(source_path), directory)
+    except ValueError:
+        # A source on another drive cannot be made relative
+        source = os.path.abspath(source_path)
+    
+    arrays = {}
+    encodings = {}
+    for name, mask in (('object', object_mask), ('eroded', eroded_mask)):
+        encodings[name], arrays[name] = encode_mask(mask)
+    meta = {'version': LAYERS_VERSION, 'source': source, 'digest': source_digest,
+            'shape': list(object_mask.shape), 'encodings': encodings}
+    
+    with atomic_open(path) as f:
+        np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def load_layers(path):
+    """
+    Read a layered result as a dict with 'source' (absolute path), 'digest',
+    'object_mask' and 'eroded_mask'. Raises ValueError if the file is invalid.
+    """
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            if not isinstance(meta, dict) or meta.get('version') != LAYERS_VERSION:
+                raise ValueError(f"Not a version {LAYERS_VERSION} layered result")
+            shape = tuple(meta['shape'])
+            masks = {name: decode_mask(meta['encodings'][name], data[name], shape)
+                     for name in ('object', 'eroded')}
+    except (KeyError, TypeError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid layered result: {e}")
+    
+    source = os.path.join(os.path.dirname(os.path.abspath(path)), meta['source'])
+    return {'source': os.path.normpath(source), 'digest': meta.get('digest'),
+            'object_mask': masks['object'], 'eroded_mask': masks['eroded']}
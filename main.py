@@ -1,21 +1,95 @@
-from tkinterdnd2 import TkinterDnD
-from model import ImageProcessingModel
-from view import ImageSegmentationView
-from controller import ImageSegmentationController
+import time
+
+_START = time.perf_counter()
+
+import os
+
+from instrumentation import tracer, span, ChromeTraceWriter
+from startup import StartupProfile, heavy_modules, preload_modules
+
+# Set to a file path to record a Chrome trace of every processing run
+TRACE_ENV_VAR = "IMAGE_DECOMPOSER_TRACE"
+
+# Set to any value to print import and first-paint timings to stderr
+PROFILE_ENV_VAR = "IMAGE_DECOMPOSER_PROFILE_STARTUP"
+
+# Directory keeping segmentation masks between sessions, or "off" to only
+# cache them in memory; defaults to ~/.cache/image-decomposer
+CACHE_DIR_ENV_VAR = "IMAGE_DECOMPOSER_CACHE_DIR"
+
+# Size limit of that directory in megabytes
+CACHE_SIZE_ENV_VAR = "IMAGE_DECOMPOSER_CACHE_MB"
+
+
+def cache_settings(environ=os.environ):
+    """Return (cache_dir, disk_budget) for the controller from the environment"""
+    from result_cache import DEFAULT_CACHE_DIR, DEFAULT_DISK_BUDGET
+    
+    cache_dir = environ.get(CACHE_DIR_ENV_VAR) or DEFAULT_CACHE_DIR
+    if cache_dir.lower() == 'off':
+        cache_dir = None
+    disk_budget = DEFAULT_DISK_BUDGET
+    if environ.get(CACHE_SIZE_ENV_VAR):
+        try:
+            disk_budget = int(float(environ[CACHE_SIZE_ENV_VAR]) * 1024 * 1024)
+        except ValueError:
+            raise SystemExit(f"{CACHE_SIZE_ENV_VAR} must be a number of megabytes")
+    return cache_dir, disk_budget
 
 
 def main():
     """Main entry point for the application"""
+    trace_path = os.environ.get(TRACE_ENV_VAR)
+    trace = None
+    if trace_path:
+        trace = tracer.subscribe(ChromeTraceWriter())
+        tracer.enable(trace_allocations=True)
+    
+    profile = None
+    if os.environ.get(PROFILE_ENV_VAR):
+        profile = tracer.subscribe(StartupProfile(start=_START))
+        if not tracer.enabled:
+            tracer.enable()
+    
+    # Draw the window first; the model and its dependencies are imported after
+    with span("import gui", category='startup'):
+        from tkinterdnd2 import TkinterDnD
+        from view import ImageSegmentationView
+    
     # Create root window with drag-and-drop support
-    root = TkinterDnD.Tk()
+    with span("create window", category='startup'):
+        root = TkinterDnD.Tk()
+        view = ImageSegmentationView(root)
+        root.update()
+    if profile is not None:
+        profile.mark("first paint")
     
     # Create MVC components
+    with span("import model", category='startup'):
+        from model import ImageProcessingModel
+        from controller import ImageSegmentationController
     model = ImageProcessingModel()
-    view = ImageSegmentationView(root)
-    controller = ImageSegmentationController(model, view)
+    cache_dir, disk_budget = cache_settings()
+    controller = ImageSegmentationController(model, view, cache_dir, disk_budget)
+    if profile is not None:
+        profile.mark("interactive")
+    
+    # Load OpenCV and the engine's libraries while the user picks an image
+    on_done = None
+    if profile is not None:
+        def on_done():
+            profile.mark("preload finished")
+            profile.print_report()
+            tracer.unsubscribe(profile)
+            if trace is None:
+                tracer.disable()
+    preload_modules(heavy_modules(model.engine_name), on_done)
     
     # Start the application
     root.mainloop()
+    
+    if trace is not None:
+        trace.write(trace_path)
 
 
 if __name__ == "__main__":
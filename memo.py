@@ -0,0 +1,41 @@
+"""
+Stage-level memoization of the segmentation pipeline.
+
+Each stage keeps its last output together with a key describing every
+input it depended on. Keys are cumulative: the label key contains the fit
+key, the erosion key contains the label key, so changing the seeds
+invalidates everything downstream while changing the erosion settings only
+reruns erosion and compositing. Re-running with nothing changed reuses
+every stage.
+"""
+import threading
+
+
+class StageMemo:
+    """Last output of each stage, keyed by the inputs it was computed from"""
+    
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+    
+    def get(self, stage, key):
+        """The memoized output of stage for key, or None if its inputs changed"""
+        with self._lock:
+            entry = self._entries.get(stage)
+            if entry is not None and entry[0] == key:
+                self.hits[stage] = self.hits.get(stage, 0) + 1
+                return entry[1]
+            self.misses[stage] = self.misses.get(stage, 0) + 1
+            return None
+    
+    def put(self, stage, key, value):
+        """Remember the output of stage, replacing the previous one"""
+        with self._lock:
+            self._entries[stage] = (key, value)
+    
+    def clear(self):
+        """Forget every stage output, e.g. when a new image is loaded"""
+        with self._lock:
+            self._entries.clear()
@@ -1,7 +1,68 @@
+import hashlib
+import json
+import warnings
+from collections import OrderedDict
+
 import numpy as np
 from PIL import Image
-from sklearn.cluster import KMeans
-import cv2
+
+from engines import get_engine, DEFAULT_ENGINE
+from pyramid import ImagePyramid
+from parallel import get_band_pool, map_bands, cancellable, check_cancelled
+from multiresolution import coarse_to_fine_mask
+from morphology import Morphology
+from seeds import SeedSet, brush_stroke, seed_pixels, seed_digest, rasterize_seeds
+from memo import StageMemo
+from layers import save_layers
+from instrumentation import span
+
+
+def decode_image(image_path):
+    """Decode an image file into a NumPy array"""
+    with span('load.decode'), Image.open(image_path) as image:
+        return np.array(image)
+
+
+def composite(pixels, mask, keep_value, pool=None):
+    """Copy the pixels where mask equals keep_value and paint the rest white"""
+    output = np.empty_like(pixels)
+    
+    def composite_band(top, bottom):
+        keep = mask[top:bottom] == keep_value
+        band = output[top:bottom]
+        band.fill(255)
+        np.copyto(band, pixels[top:bottom], where=keep[..., np.newaxis] if pixels.ndim == 3 else keep)
+    
+    map_bands(pool, composite_band, *mask.shape)
+    return output
+
+
+def composite_alpha(pixels, mask, keep_value, pool=None):
+    """
+    RGBA copy of the pixels where mask equals keep_value; the rest is fully
+    transparent black, so removed pixels neither leak into nor bloat the file
+    """
+    h, w = mask.shape
+    output = np.empty((h, w, 4), np.uint8)
+    
+    def composite_band(top, bottom):
+        keep = mask[top:bottom] == keep_value
+        source = pixels[top:bottom]
+        band = output[top:bottom]
+        band.fill(0)
+        if source.ndim == 2:
+            np.copyto(band[..., 0], source, where=keep)
+            band[..., 1] = band[..., 0]
+            band[..., 2] = band[..., 0]
+        else:
+            np.copyto(band[..., :3], source[..., :3], where=keep[..., np.newaxis])
+        alpha = band[..., 3]
+        np.multiply(keep, 255, out=alpha, casting='unsafe')
+        if source.ndim == 3 and source.shape[2] == 4:
+            np.minimum(alpha, source[..., 3], out=alpha)
+    
+    map_bands(pool, composite_band, h, w)
+    return output
 
 
 class ImageProcessingModel:
@@ -10,164 +71,568 @@ class ImageProcessingModel:
     Handles image loading, K-Means clustering, and erosion operations.
     """
     
-    def __init__(self):
-        self.original_image = None
+    # Output views composited from the source pixels and the masks
+    RESULT_TYPES = ('object', 'background', 'eroded')
+    
+    def __init__(self, render_cache_limit=64 * 1024 * 1024, engine=DEFAULT_ENGINE, workers=None):
         self.image_array = None
-        self.background_points = []
-        self.object_points = []
-        self.segmented_object = None
-        self.segmented_background = None
-        self.eroded_object = None
+        self._pyramid = None
+        self.background_points = SeedSet()
+        self.object_points = SeedSet()
+        self._image_digest = None
+        
+        # Identity of the loaded image for the stage memo; a new object per image
+        self._image_token = None
+        
+        # Last output of every segmentation stage, shared with snapshots so
+        # a rerun only recomputes the stages whose inputs changed
+        self.memo = StageMemo()
+        
+        # Segmentation engine, selected by registry name
+        self.engine_name = engine
+        self.engine_params = {}
+        
+        # Threads for band-parallel labeling, erosion and compositing
+        # (all cores if None, serial if 1)
+        self.workers = workers
+        self.band_pool = get_band_pool(workers)
+        
+        # Coarse-to-fine labeling: reduction factor of the first pass, or None
+        self.coarse_factor = None
+        
+        # Morphology applied to the object mask for the serrated edge effect
+        self.morphology = Morphology()
+        
+        # Saved color model used instead of fitting on the seeds, or None
+        self.preset = None
+        
+        # Segmentation results: 1 where the pixel belongs to the object;
+        # result_key identifies the stage inputs they were computed from
+        self.object_mask = None
+        self.eroded_mask = None
+        self.result_key = None
+        
+        # Composited views keyed by (image type, size), evicted least recently used
+        self.render_cache_limit = render_cache_limit
+        self._render_cache = OrderedDict()
+        self._render_cache_bytes = 0
+        
+        # Live preview state: display-resolution proxy and last centroids
+        self._preview_proxy = None
+        self._preview_size = None
+        self.preview_centroids = None
         
     def load_image(self, image_path):
         """Load an image from file path"""
-        self.original_image = Image.open(image_path)
-        self.image_array = np.array(self.original_image)
-        self.background_points = []
-        self.object_points = []
+        return self.set_image(decode_image(image_path))
+    
+    def set_image(self, image_array, pyramid=None):
+        """
+        Use an already decoded image. Without a pyramid, the display pyramid
+        is built on first use, so headless runs that never display or
+        downsample the image do not pay for it.
+        """
+        self.image_array = image_array
+        self._pyramid = pyramid
+        self._image_digest = None
+        self._image_token = object()
+        self.memo.clear()
+        self.set_masks(None, None)
+        self.background_points = SeedSet()
+        self.object_points = SeedSet()
+        self._preview_proxy = None
+        self.preview_centroids = None
         return True
     
+    def get_state(self):
+        """The image, its seeds and results, e.g. to keep the image open in a workspace"""
+        return {'image_array': self.image_array, 'pyramid': self._pyramid,
+                'image_digest': self._image_digest,
+                'background_points': self.background_points, 'object_points': self.object_points,
+                'object_mask': self.object_mask, 'eroded_mask': self.eroded_mask}
+    
+    def set_state(self, state):
+        """
+        Switch to a state from get_state. Only image_array is required; the
+        pyramid is rebuilt on first use if it is missing.
+        """
+        self.set_image(state['image_array'], state.get('pyramid'))
+        self._image_digest = state.get('image_digest')
+        if state.get('background_points') is not None:
+            self.background_points = state['background_points']
+        if state.get('object_points') is not None:
+            self.object_points = state['object_points']
+        if state.get('object_mask') is not None and state.get('eroded_mask') is not None:
+            self.set_masks(state['object_mask'], state['eroded_mask'])
+        return True
+    
+    @property
+    def image_token(self):
+        """Identity of the loaded image; a new object whenever another image is installed"""
+        return self._image_token
+    
+    @property
+    def pyramid(self):
+        """Display pyramid of the image, built on first use"""
+        if self._pyramid is None and self.image_array is not None:
+            with span('load.pyramid'):
+                self._pyramid = ImagePyramid(self.image_array)
+        return self._pyramid
+    
     def add_background_point(self, x, y):
         """Add a point marked as background"""
         if self.image_array is not None:
-            self.background_points.append((x, y))
+            self.background_points.add(x, y)
             return True
         return False
     
     def add_object_point(self, x, y):
         """Add a point marked as object"""
         if self.image_array is not None:
-            self.object_points.append((x, y))
+            self.object_points.add(x, y)
+            return True
+        return False
+    
+    def add_background_stroke(self, points, radius):
+        """Mark every pixel within radius of a brush stroke through points as background"""
+        if self.image_array is not None:
+            self.background_points.extend(brush_stroke(points, radius))
+            return True
+        return False
+    
+    def add_object_stroke(self, points, radius):
+        """Mark every pixel within radius of a brush stroke through points as object"""
+        if self.image_array is not None:
+            self.object_points.extend(brush_stroke(points, radius))
             return True
         return False
     
     def clear_points(self):
         """Clear all selected points"""
-        self.background_points = []
-        self.object_points = []
+        self.background_points = SeedSet()
+        self.object_points = SeedSet()
+        self.preview_centroids = None
     
-    def perform_kmeans_segmentation(self):
+    def _gather_seed_pixels(self, points):
         """
-        Perform K-Means clustering based on selected points.
-        Returns True if successful, False otherwise.
+        Return the pixel colors under the given seeds that lie inside the
+        image, deduplicated and subsampled for fitting
         """
-        if not self.background_points or not self.object_points:
-            return False
-        
-        if self.image_array is None:
-            return False
-        
-        h, w = self.image_array.shape[:2]
-        
-        # Prepare training data from selected points
-        background_pixels = []
-        for x, y in self.background_points:
-            if 0 <= y < h and 0 <= x < w:
-                background_pixels.append(self.image_array[y, x])
-        
-        object_pixels = []
-        for x, y in self.object_points:
-            if 0 <= y < h and 0 <= x < w:
-                object_pixels.append(self.image_array[y, x])
-        
-        if not background_pixels or not object_pixels:
-            return False
+        return seed_pixels(self.image_array, points)
+    
+    def get_preview_proxy(self, max_size=600):
+        """Return a downsampled copy of the image no larger than max_size on either side"""
+        proxy, token = self._preview_proxy, self._image_token
+        if proxy is None or self._preview_size != max_size:
+            proxy = np.asarray(self.pyramid.fit(max_size, max_size, Image.Resampling.BOX))
+            if self._image_token is token:
+                self._preview_proxy = proxy
+                self._preview_size = max_size
+        return proxy
+    
+    def compute_preview(self, background_points, object_points, max_size=600, image_token=None):
+        """
+        Segment a display-resolution proxy of the image for live preview.
+        The fit is warm-started from the previous preview centroids (or the
+        seed color means on the first call). Returns the proxy object mask
+        as a uint8 array, or None if there are not enough seeds or another
+        image was installed since image_token was taken or during the fit.
+        """
+        image_array, token = self.image_array, self._image_token
+        if image_array is None or (image_token is not None and image_token is not token):
+            return None
         
-        # Create training data with labels
-        X_train = np.array(background_pixels + object_pixels)
-        y_train = np.array([0] * len(background_pixels) + [1] * len(object_pixels))
+        background_pixels = seed_pixels(image_array, background_points)
+        object_pixels = seed_pixels(image_array, object_points)
+        if not len(background_pixels) or not len(object_pixels):
+            return None
         
-        # Reshape image for clustering
-        pixels = self.image_array.reshape(-1, self.image_array.shape[-1])
+        init = self.preview_centroids
+        if init is None:
+            init = [np.mean(background_pixels, axis=0), np.mean(object_pixels, axis=0)]
         
-        # Train K-Means with 2 clusters
-        kmeans = KMeans(n_clusters=2, random_state=42, n_init=10)
-        kmeans.fit(X_train)
+        with warnings.catch_warnings():
+            # Few or duplicate seeds make K-Means warn about convergence
+            warnings.simplefilter("ignore")
+            engine = self.create_engine().fit(background_pixels, object_pixels,
+                                              init_centroids=init)
+        proxy = self.get_preview_proxy(max_size)
+        # Runs on a worker thread: the centroids and proxy of a replaced image must not leak
+        if self._image_token is not token:
+            return None
+        self.preview_centroids = engine.centroids
+        return engine.object_mask(proxy)
+    
+    def snapshot(self):
+        """
+        Return a copy of the model that can be processed on a worker thread.
+        The image is shared read-only; seeds are copied and results start empty.
+        """
+        snapshot = ImageProcessingModel(self.render_cache_limit, self.engine_name, self.workers)
+        snapshot.engine_params = dict(self.engine_params)
+        snapshot.coarse_factor = self.coarse_factor
+        snapshot.morphology = self.morphology
+        snapshot.preset = self.preset
+        snapshot.image_array = self.image_array
+        snapshot._pyramid = self._pyramid
+        snapshot._image_digest = self._image_digest
+        snapshot._image_token = self._image_token
+        snapshot.memo = self.memo
+        snapshot.background_points = self.background_points.copy()
+        snapshot.object_points = self.object_points.copy()
+        return snapshot
+    
+    def adopt_results(self, other):
+        """Take over the segmentation results computed on a snapshot"""
+        if other.image_array is self.image_array and self._image_digest is None:
+            self._image_digest = other._image_digest
+        self.set_masks(other.object_mask, other.eroded_mask, other.result_key)
+    
+    def set_masks(self, object_mask, eroded_mask, result_key=None):
+        """Replace the segmentation masks and drop views rendered from the old ones"""
+        self.object_mask = object_mask
+        self.eroded_mask = eroded_mask
+        self.result_key = result_key
+        self._render_cache.clear()
+        self._render_cache_bytes = 0
+    
+    def has_results(self):
+        """Check whether a segmentation result is available"""
+        return self.object_mask is not None and self.eroded_mask is not None
+    
+    def image_digest(self):
+        """Content hash of the decoded image, computed once per loaded image"""
+        if self._image_digest is None and self.image_array is not None:
+            digest = hashlib.blake2b(digest_size=20)
+            digest.update(repr((self.image_array.shape, self.image_array.dtype.str)).encode('ascii'))
+            digest.update(np.ascontiguousarray(self.image_array).data)
+            self._image_digest = digest.hexdigest()
+        return self._image_digest
+    
+    def set_engine(self, name, **params):
+        """Select the segmentation engine by registry name"""
+        get_engine(name, **params)
+        self.engine_name = name
+        self.engine_params = params
+    
+    def create_engine(self):
+        """Create an untrained instance of the selected engine"""
+        return get_engine(self.engine_name, **self.engine_params)
+    
+    def _color_model_params(self):
+        """Parameters that determine the trained color model besides image and seeds"""
+        if self.preset is not None:
+            return {'engine': self.preset.engine, 'preset': self.preset.create_engine().state()}
+        return self.create_engine().params()
+    
+    def segmentation_params(self):
+        """Parameters that determine the segmentation result besides image and seeds"""
+        params = self._color_model_params()
+        params.update(self.morphology.params())
+        if self.coarse_factor:
+            params['coarse_factor'] = self.coarse_factor
+        return params
+    
+    def stage_keys(self):
+        """
+        Memo keys of the fit, label and erode stages. Each key contains the
+        key of the stage before it, so a change invalidates everything
+        downstream of it.
+        """
+        if self.preset is not None:
+            seeds = None
+        else:
+            seeds = (seed_digest(self.background_points), seed_digest(self.object_points))
+        fit = (self._image_token, seeds, json.dumps(self._color_model_params(), sort_keys=True))
+        label = (fit, self.coarse_factor)
+        erode = (label, json.dumps(self.morphology.params(), sort_keys=True))
+        return {'fit': fit, 'label': label, 'erode': erode}
+    
+    def use_preset(self, preset):
+        """
+        Label with a saved color model instead of fitting on the seeds, and
+        take over its edge settings; None goes back to the seeds
+        """
+        self.preset = preset
+        if preset is not None:
+            self.morphology = preset.morphology
+    
+    def set_morphology(self, operation='erode', shape='rect', size=3, iterations=1):
+        """Configure the edge stage: erode, open or close with the given kernel"""
+        self.morphology = Morphology(operation, shape, size, iterations)
+    
+    def set_coarse_to_fine(self, factor=8):
+        """
+        Label a copy reduced by factor (a power of two) first and only the
+        edges at full resolution; None labels every pixel
+        """
+        if factor is not None and (factor < 2 or factor & (factor - 1)):
+            raise ValueError("Coarse factor must be a power of two of at least 2")
+        self.coarse_factor = factor
+    
+    def _coarse_level(self):
+        """Pyramid level index for the coarse pass, or 0 if the image is too small"""
+        if not self.coarse_factor:
+            return 0
+        return min(self.coarse_factor.bit_length() - 1, len(self.pyramid.levels) - 1)
+    
+    def fit_engine(self):
+        """
+        Train the selected engine on the seed colors, or take the color model
+        of the preset in use. Returns the engine, or None without usable seeds.
+        """
+        if self.image_array is None:
+            return None
         
-        # Predict labels for all pixels
-        labels = kmeans.predict(pixels)
+        if self.preset is not None:
+            return self.preset.create_engine()
         
-        # Determine which cluster is object and which is background
-        # Use majority voting from labeled points
-        bg_cluster_votes = kmeans.predict(background_pixels)
-        bg_cluster = np.bincount(bg_cluster_votes).argmax()
-        obj_cluster = 1 - bg_cluster
+        if not self.background_points or not self.object_points:
+            return None
         
-        # Create mask
-        mask = labels.reshape(h, w)
-        object_mask = (mask == obj_cluster).astype(np.uint8)
-        background_mask = (mask == bg_cluster).astype(np.uint8)
+        # Prepare training data from selected points
+        with span('segmentation.gather_seeds'):
+            background_pixels = self._gather_seed_pixels(self.background_points)
+            object_pixels = self._gather_seed_pixels(self.object_points)
         
-        # Create segmented images
-        self.segmented_object = self.image_array.copy()
-        self.segmented_background = self.image_array.copy()
+        if not len(background_pixels) or not len(object_pixels):
+            return None
         
-        # Set background pixels to white in object image
-        self.segmented_object[background_mask == 1] = [255, 255, 255]
+        with span('segmentation.fit', engine=self.engine_name):
+            return self.create_engine().fit(background_pixels, object_pixels)
+    
+    def perform_kmeans_segmentation(self, on_coarse=None, cancel_event=None):
+        """
+        Perform K-Means clustering based on selected points, using the
+        selected segmentation engine (scikit-learn K-Means by default),
+        or label with the preset in use without fitting.
+        In coarse-to-fine mode, on_coarse(coarse_mask) receives the
+        low-resolution mask before the edges are refined.
+        Once cancel_event is set, parallel.Cancelled is raised between the
+        fit, label and erode stages and between bands; stages cut short
+        are not memoized.
+        Returns True if successful, False otherwise.
+        """
+        keys = self.stage_keys()
+        pool = cancellable(self.band_pool, cancel_event)
+        engine = self.memo.get('fit', keys['fit'])
+        if engine is None:
+            check_cancelled(cancel_event)
+            engine = self.fit_engine()
+            if engine is None:
+                return False
+            self.memo.put('fit', keys['fit'], engine)
         
-        # Set object pixels to white in background image
-        self.segmented_background[object_mask == 1] = [255, 255, 255]
+        object_mask = self.memo.get('label', keys['label'])
+        if object_mask is None:
+            check_cancelled(cancel_event)
+            object_mask = self._label(engine, on_coarse, pool)
+            self.memo.put('label', keys['label'], object_mask)
         
-        # Apply erosion to object for serrated edge effect
-        self.apply_erosion(object_mask)
+        eroded_mask = self.memo.get('erode', keys['erode'])
+        if eroded_mask is None:
+            check_cancelled(cancel_event)
+            # Apply erosion to object for serrated edge effect
+            eroded_mask = self.apply_erosion(object_mask, pool=pool)
+            self.memo.put('erode', keys['erode'], eroded_mask)
         
+        self.set_masks(object_mask, eroded_mask, keys['erode'])
         return True
     
-    def apply_erosion(self, object_mask):
-        """Apply erosion to create serrated edge effect"""
-        # Create erosion kernel
-        kernel = np.ones((3, 3), np.uint8)
+    def _label(self, engine, on_coarse=None, pool=None):
+        """Object mask of the image from a trained engine, computed on pool (default: band_pool)"""
+        pool = pool or self.band_pool
+        level = self._coarse_level()
+        if level:
+            # Coarse pass on a pyramid level, then the edges at full resolution
+            with span('segmentation.coarse_to_fine', engine=self.engine_name, factor=1 << level):
+                object_mask, _ = coarse_to_fine_mask(engine, self.image_array,
+                                                     np.asarray(self.pyramid.level(level)),
+                                                     1 << level, pool, on_coarse)
+        else:
+            # Predict labels for all pixels
+            with span('segmentation.predict', engine=self.engine_name):
+                labels = engine.label(self.image_array, pool)
+            
+            # Create mask
+            with span('segmentation.mask'):
+                object_mask = engine.labels_to_mask(labels, pool)
+        return object_mask
+    
+    def apply_erosion(self, object_mask, out=None, pool=None):
+        """
+        Apply the configured morphology to create the serrated edge effect;
+        returns the eroded mask, written into out if given
+        """
+        # Border pixels removed by erosion become background
+        with span('erosion.erode', operation=self.morphology.operation):
+            return self.morphology.apply(object_mask, pool or self.band_pool, out)
+    
+    def fit_size(self, max_width, max_height):
+        """Largest (width, height) of the image that fits the box without upscaling"""
+        return self.pyramid.fit_size(max_width, max_height)
+    
+    def render(self, image_type, size=None):
+        """
+        Composite one output view as a PIL Image, or None if there is no result.
+        image_type is 'object', 'background' or 'eroded'; size is an optional
+        (width, height) to render at display resolution instead of full size.
+        Removed pixels are painted white.
+        """
+        if image_type not in self.RESULT_TYPES or not self.has_results():
+            return None
         
-        # Erode the mask
-        eroded_mask = cv2.erode(object_mask, kernel, iterations=1)
+        h, w = self.image_array.shape[:2]
+        if size is not None and tuple(size) == (w, h):
+            size = None
+        key = (image_type, tuple(size) if size else None)
+        if key in self._render_cache:
+            self._render_cache.move_to_end(key)
+            return self._render_cache[key][0]
         
-        # Create eroded object image
-        self.eroded_object = self.image_array.copy()
+        # Display-size views of an unchanged result are reused across runs
+        memo_stage = f'render.{image_type}'
+        memo_key = (self.result_key, key[1]) if self.result_key is not None and size else None
+        if memo_key is not None:
+            memoized = self.memo.get(memo_stage, memo_key)
+            if memoized is not None:
+                self._cache_render(key, *memoized)
+                return memoized[0]
         
-        # Find border pixels (pixels that were removed by erosion)
-        border_pixels = object_mask - eroded_mask
+        pixels, object_mask, eroded_mask = self.image_array, self.object_mask, self.eroded_mask
+        if size is not None:
+            pixels = np.asarray(self.pyramid.resize(size))
+            object_mask = np.asarray(Image.fromarray(object_mask).resize(size, Image.Resampling.NEAREST))
+            eroded_mask = np.asarray(Image.fromarray(eroded_mask).resize(size, Image.Resampling.NEAREST))
         
-        # Set border pixels to white (background color)
-        self.eroded_object[border_pixels == 1] = [255, 255, 255]
+        mask, keep_value = self._composite_mask(image_type, object_mask, eroded_mask)
+        with span('render.composite', image_type=image_type):
+            output = composite(pixels, mask, keep_value, self.band_pool)
+        with span('render.fromarray', image_type=image_type):
+            image = Image.fromarray(output)
+        self._cache_render(key, image, output.nbytes)
+        if memo_key is not None:
+            self.memo.put(memo_stage, memo_key, (image, output.nbytes))
+        return image
+    
+    def preview_results(self, object_mask, size):
+        """
+        Render the three views at size from a mask of any resolution, e.g.
+        the coarse mask of a coarse-to-fine run; returns (object, background, eroded)
+        """
+        pixels = np.asarray(self.pyramid.resize(size))
+        object_mask = np.asarray(Image.fromarray(object_mask).resize(size, Image.Resampling.NEAREST))
+        eroded_mask = self.morphology.apply(object_mask)
+        return tuple(Image.fromarray(composite(pixels, *self._composite_mask(t, object_mask, eroded_mask)))
+                     for t in self.RESULT_TYPES)
+    
+    @staticmethod
+    def _composite_mask(image_type, object_mask, eroded_mask):
+        """The mask and mask value of the pixels an output view keeps"""
+        if image_type == "object":
+            return object_mask, 1
+        if image_type == "background":
+            return object_mask, 0
+        return eroded_mask, 1
+    
+    def renderer(self, image_type, alpha=False):
+        """
+        Return a callable that renders the full-size view as a PIL Image
+        without touching the model, so it can run on another thread while
+        the model moves on; None if there is no result. With alpha, removed
+        pixels are transparent in an RGBA image instead of painted white.
+        """
+        if image_type not in self.RESULT_TYPES or not self.has_results():
+            return None
+        key = (image_type, None)
+        if key in self._render_cache and not alpha:
+            image = self._render_cache[key][0]
+            return lambda: image
         
-        # Set background pixels to white
-        self.eroded_object[object_mask == 0] = [255, 255, 255]
+        pixels, pool = self.image_array, self.band_pool
+        mask, keep_value = self._composite_mask(image_type, self.object_mask, self.eroded_mask)
+        if alpha:
+            return lambda: Image.fromarray(composite_alpha(pixels, mask, keep_value, pool), 'RGBA')
+        return lambda: Image.fromarray(composite(pixels, mask, keep_value, pool))
     
-    def get_original_image(self):
-        """Get original image as PIL Image"""
-        if self.original_image:
-            return self.original_image
-        return None
+    def save_layers(self, file_path, source_path):
+        """
+        Save the masks as a compact layered result referencing the source
+        image file; False if there is no result
+        """
+        if not self.has_results():
+            return False
+        with span('save.layers'):
+            save_layers(file_path, self.object_mask, self.eroded_mask, source_path,
+                        self.image_digest())
+        return True
+    
+    def apply_layers(self, layers):
+        """
+        Use the masks of a layered result read by layers.load_layers.
+        Raises ValueError if they were saved for a different image.
+        """
+        if self.image_array is None:
+            raise ValueError("Load the source image first")
+        if layers['object_mask'].shape != self.image_array.shape[:2]:
+            raise ValueError("The layered result does not match the size of the image")
+        if layers['digest'] is not None and layers['digest'] != self.image_digest():
+            raise ValueError("The layered result was saved for a different image")
+        self.set_masks(layers['object_mask'], layers['eroded_mask'])
     
-    def get_segmented_object(self):
+    def _cache_render(self, key, image, nbytes):
+        """Keep a rendered view, evicting the least recently used ones over the limit"""
+        if nbytes > self.render_cache_limit:
+            return
+        self._render_cache[key] = (image, nbytes)
+        self._render_cache_bytes += nbytes
+        while self._render_cache_bytes > self.render_cache_limit:
+            _, (_, evicted_bytes) = self._render_cache.popitem(last=False)
+            self._render_cache_bytes -= evicted_bytes
+    
+    def render_view(self, box, size, resample=Image.Resampling.BILINEAR):
+        """
+        The part of the image inside box (left, top, right, bottom) at size,
+        and an RGBA layer of the seeds in it, for a zoomed or panned canvas
+        """
+        if self.pyramid is None:
+            return None
+        with span('view.render', width=size[0], height=size[1]):
+            image = self.pyramid.render_region(box, size, resample)
+            seeds = Image.fromarray(rasterize_seeds(self.background_points, self.object_points,
+                                                    box, size), 'RGBA')
+        return image, seeds
+    
+    def get_original_image(self, max_size=None):
+        """
+        Get original image as PIL Image.
+        With max_size (width, height) the image is fitted to that box from
+        the nearest pyramid level instead of the full-resolution pixels.
+        """
+        if self.image_array is None:
+            return None
+        if max_size is not None:
+            return self.pyramid.fit(*max_size)
+        return Image.fromarray(self.image_array)
+    
+    def get_segmented_object(self, size=None):
         """Get segmented object image as PIL Image"""
-        if self.segmented_object is not None:
-            return Image.fromarray(self.segmented_object)
-        return None
+        return self.render("object", size)
     
-    def get_segmented_background(self):
+    def get_segmented_background(self, size=None):
         """Get segmented background image as PIL Image"""
-        if self.segmented_background is not None:
-            return Image.fromarray(self.segmented_background)
-        return None
+        return self.render("background", size)
     
-    def get_eroded_object(self):
+    def get_eroded_object(self, size=None):
         """Get eroded object image with serrated edges as PIL Image"""
-        if self.eroded_object is not None:
-            return Image.fromarray(self.eroded_object)
-        return None
+        return self.render("eroded", size)
     
     def save_image(self, image_type, file_path):
         """Save a specific image type to file"""
-        image = None
-        if image_type == "object":
-            image = self.get_segmented_object()
-        elif image_type == "background":
-            image = self.get_segmented_background()
-        elif image_type == "eroded":
-            image = self.get_eroded_object()
+        image = self.render(image_type)
         
         if image:
-            image.save(file_path)
+            with span('save.encode', image_type=image_type):
+                image.save(file_path)
             return True
         return False
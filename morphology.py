@@ -0,0 +1,129 @@
+"""
+Morphology stage applied to the object mask.
+
+The operation only runs inside the bounding box of the object grown by the
+reach of the kernel, so a small product in a huge frame costs as much as
+the product itself. Outside that box the result is known without looking:
+erosion and opening never add object pixels, and closing never adds pixels
+beyond the reach of the kernel, which the box already covers. Repeated
+rectangular kernels are fused into one larger kernel, which OpenCV applies
+as two separable 1-D passes.
+"""
+import numpy as np
+
+from options import OPERATIONS, KERNEL_SHAPES
+from parallel import map_bands
+
+
+def bounding_box(mask):
+    """(top, bottom, left, right) of the nonzero pixels of a 2-D mask, or None if empty"""
+    rows = np.flatnonzero(mask.max(axis=1))
+    if not len(rows):
+        return None
+    top, bottom = rows[0], rows[-1] + 1
+    cols = np.flatnonzero(mask[top:bottom].max(axis=0))
+    return int(top), int(bottom), int(cols[0]), int(cols[-1]) + 1
+
+
+class Morphology:
+    """A morphological operation on binary masks: kernel shape and size, iterations"""
+    
+    def __init__(self, operation='erode', shape='rect', size=3, iterations=1):
+        if operation not in OPERATIONS:
+            raise ValueError(f"Unknown morphology operation '{operation}'. "
+                             f"Available: {', '.join(OPERATIONS)}")
+        if shape not in KERNEL_SHAPES:
+            raise ValueError(f"Unknown kernel shape '{shape}'. "
+                             f"Available: {', '.join(KERNEL_SHAPES)}")
+        if size < 1 or size % 2 == 0:
+            raise ValueError("Kernel size must be a positive odd number")
+        if iterations < 0:
+            raise ValueError("Iterations must not be negative")
+        self.operation = operation
+        self.shape = shape
+        self.size = size
+        self.iterations = iterations
+    
+    def params(self):
+        """Parameters that determine the result, for cache keys"""
+        params = {'erosion_kernel': self.size, 'erosion_iterations': self.iterations}
+        if self.operation != 'erode':
+            params['erosion_operation'] = self.operation
+        if self.shape != 'rect':
+            params['erosion_shape'] = self.shape
+        return params
+    
+    def kernel(self):
+        """Structuring element and iteration count to apply, fused when exact"""
+        import cv2
+        
+        size, iterations = self.size, self.iterations
+        if self.shape == 'rect' and iterations > 1:
+            # n passes of a k x k box equal one pass of an n(k-1)+1 box
+            size, iterations = iterations * (size - 1) + 1, 1
+        kernel = cv2.getStructuringElement(getattr(cv2, KERNEL_SHAPES[self.shape]), (size, size))
+        return kernel, iterations
+    
+    def reach(self):
+        """How far, in pixels, the result can depend on the mask"""
+        reach = self.iterations * (self.size // 2)
+        return reach if self.operation == 'erode' else 2 * reach
+    
+    def apply(self, mask, pool=None, out=None):
+        """
+        Apply the operation to a 0/1 mask, writing into out (a uint8 buffer of
+        the same shape that is reused when given) and returning it as uint8
+        """
+        import cv2
+        
+        # OpenCV morphology does not take int32/int64 labels or bool masks
+        if mask.dtype == np.bool_:
+            mask = mask.view(np.uint8)
+        elif mask.dtype != np.uint8:
+            mask = mask.astype(np.uint8)
+        
+        fresh = out is None
+        if fresh:
+            # Zeroed pages are only touched where the region is written
+            out = np.zeros(mask.shape, np.uint8)
+        elif out.shape != mask.shape:
+            raise ValueError(f"Output buffer is {out.shape}, expected {mask.shape}")
+        if self.iterations == 0 or self.size == 1:
+            np.copyto(out, mask)
+            return out
+        
+        box = bounding_box(mask)
+        if box is None:
+            out.fill(0)
+            return out
+        
+        # Work region: the object box grown by the reach, clipped to the frame
+        reach = self.reach()
+        height, width = mask.shape
+        top, bottom = max(0, box[0] - reach), min(height, box[1] + reach)
+        left, right = max(0, box[2] - reach), min(width, box[3] + reach)
+        if not fresh:
+            self._clear_outside(out, top, bottom, left, right)
+        
+        kernel, iterations = self.kernel()
+        op = {'erode': cv2.MORPH_ERODE, 'open': cv2.MORPH_OPEN, 'close': cv2.MORPH_CLOSE}[self.operation]
+        region = mask[top:bottom, left:right]
+        target = out[top:bottom, left:right]
+        
+        # Each band also reads the rows the operation reaches beyond it, so
+        # the seams match a single pass over the region
+        def apply_band(band_top, band_bottom):
+            read_top, read_bottom = max(0, band_top - reach), min(bottom - top, band_bottom + reach)
+            result = cv2.morphologyEx(region[read_top:read_bottom], op, kernel, iterations=iterations)
+            target[band_top:band_bottom] = result[band_top - read_top:band_bottom - read_top]
+        
+        map_bands(pool, apply_band, bottom - top, right - left)
+        return out
+    
+    @staticmethod
+    def _clear_outside(out, top, bottom, left, right):
+        """Zero the buffer around the work region"""
+        out[:top].fill(0)
+        out[bottom:].fill(0)
+        out[top:bottom, :left].fill(0)
+        out[top:bottom, right:].fill(0)
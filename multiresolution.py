@@ -0,0 +1,59 @@
+"""
+Coarse-to-fine segmentation.
+
+A downsampled copy of the image is labeled first. Only the blocks along the
+boundary between object and background in that coarse result are labeled
+again at full resolution; every other block takes its coarse label. Product
+shots are mostly object interior and plain background, so most pixels are
+never classified individually, while real edges come out as in a
+full-resolution run.
+"""
+import numpy as np
+
+
+def boundary_cells(coarse_mask, margin=1):
+    """
+    Cells of a coarse mask with both labels within 1 + margin cells,
+    i.e. the blocks that may contain an edge
+    """
+    import cv2
+    
+    kernel = np.ones((3, 3), np.uint8)
+    grown = cv2.dilate(coarse_mask, kernel, iterations=1 + margin)
+    shrunk = cv2.erode(coarse_mask, kernel, iterations=1 + margin)
+    return grown != shrunk
+
+
+def upsample_cells(cells, factor, shape):
+    """Expand a per-cell array to full resolution; edge cells may be partial"""
+    rows = np.arange(shape[0]) // factor
+    cols = np.arange(shape[1]) // factor
+    return cells[rows][:, cols]
+
+
+def coarse_to_fine_mask(engine, image_array, coarse_array, factor, pool=None,
+                        on_coarse=None, margin=1):
+    """
+    Object mask of image_array computed coarse to fine. coarse_array is the
+    image reduced by factor, with partial blocks at the right and bottom
+    edges rounded up. on_coarse(coarse_mask) is called as soon as the coarse
+    result exists. Returns (object_mask, fraction of pixels labeled at full
+    resolution).
+    """
+    h, w = image_array.shape[:2]
+    expected = (-(-h // factor), -(-w // factor))
+    if coarse_array.shape[:2] != expected:
+        raise ValueError(f"Coarse image is {coarse_array.shape[:2]}, expected {expected}")
+    
+    coarse_mask = engine.object_mask(coarse_array)
+    if on_coarse is not None:
+        on_coarse(coarse_mask)
+    
+    object_mask = upsample_cells(coarse_mask, factor, (h, w))
+    refine = upsample_cells(boundary_cells(coarse_mask, margin), factor, (h, w))
+    pixels = image_array[refine]
+    if len(pixels):
+        # Label the boundary pixels as a one-column image
+        labels = engine.label(pixels.reshape(len(pixels), 1, -1), pool)
+        object_mask[refine] = engine.labels_to_mask(labels, pool).reshape(-1)
+    return object_mask, len(pixels) / float(h * w)
@@ -0,0 +1,18 @@
+"""
+Option values and file extensions shared by the window and the processing
+modules. Kept free of NumPy and the engines, so the window can be built
+from them before any of the processing code is imported.
+"""
+
+
+# Morphology operations: erosion, erosion then dilation, dilation then erosion
+OPERATIONS = ('erode', 'open', 'close')
+
+# Structuring element shapes, by their OpenCV constant name
+KERNEL_SHAPES = {'rect': 'MORPH_RECT', 'ellipse': 'MORPH_ELLIPSE', 'cross': 'MORPH_CROSS'}
+
+# File extension of presets, used by the open and save dialogs
+PRESET_EXTENSION = '.json'
+
+# File extension of layered results
+LAYERS_EXTENSION = '.seg'
@@ -0,0 +1,122 @@
+"""
+Band-parallel execution of per-pixel work.
+
+Labeling, mask building, erosion and compositing all work row by row, so
+large images are split into horizontal bands that run on a thread pool.
+NumPy, OpenCV and the scikit-learn predict release the GIL in their inner
+loops, so bands run truly in parallel. Every band writes into a slice of a
+preallocated output buffer; results are identical to processing the whole
+frame at once.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Bands smaller than this are not worth a task switch
+MIN_BAND_PIXELS = 1 << 18
+
+
+class Cancelled(Exception):
+    """Raised when work is stopped through its cancel event"""
+
+
+def check_cancelled(cancel_event):
+    """Raise Cancelled once cancel_event (a threading.Event or None) is set"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise Cancelled()
+
+
+class BandPool:
+    """Runs a function over the row bands of an image on a shared thread pool"""
+    
+    def __init__(self, workers=None, min_band_pixels=MIN_BAND_PIXELS):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.min_band_pixels = min_band_pixels
+        self._executor = None
+        self._lock = threading.Lock()
+    
+    def bands(self, height, width):
+        """Split height rows into (top, bottom) bands, one per worker at most"""
+        count = min(self.workers, height, max(1, height * width // self.min_band_pixels))
+        return [(height * i // count, height * (i + 1) // count) for i in range(count)]
+    
+    def map(self, func, height, width):
+        """
+        Call func(top, bottom) for every band and return the results in band
+        order. Small images run inline as a single band.
+        """
+        bands = self.bands(height, width)
+        if len(bands) == 1:
+            return [func(*bands[0])]
+        return list(self._get_executor().map(lambda band: func(*band), bands))
+    
+    def shutdown(self):
+        """Stop the worker threads; the pool restarts them on next use"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+    
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='band')
+            return self._executor
+
+
+# Pools shared by every model in the process, keyed by worker count
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_band_pool(workers=None):
+    """
+    Shared pool with the given number of worker threads (all cores if None),
+    or None for serial execution when workers is 1.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1:
+        return None
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            pool = _pools[workers] = BandPool(workers)
+        return pool
+
+
+class CancellablePool:
+    """
+    Runs bands like the wrapped pool (or serially if it is None), but checks
+    cancel_event before each band and raises Cancelled once it is set, so a
+    superseded job stops at the next band
+    """
+    
+    def __init__(self, pool, cancel_event):
+        self.pool = pool
+        self.cancel_event = cancel_event
+    
+    def bands(self, height, width):
+        if self.pool is None:
+            return [(0, height)]
+        return self.pool.bands(height, width)
+    
+    def map(self, func, height, width):
+        def run(top, bottom):
+            check_cancelled(self.cancel_event)
+            return func(top, bottom)
+        return map_bands(self.pool, run, height, width)
+
+
+def cancellable(pool, cancel_event):
+    """pool wrapped to stop between bands once cancel_event is set; pool itself without an event"""
+    if cancel_event is None:
+        return pool
+    return CancellablePool(pool, cancel_event)
+
+
+def map_bands(pool, func, height, width):
+    """Run func(top, bottom) over row bands on pool, or once over all rows if pool is None"""
+    if pool is None:
+        return [func(0, height)]
+    return pool.map(func, height, width)
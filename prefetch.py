@@ -0,0 +1,205 @@
+"""
+Folder navigation with background read-ahead.
+
+When an operator works through a folder, the next images are decoded and
+their display pyramids built on a background thread while the current one
+is being seeded, so "next image" installs an already decoded image instead
+of paying the decode on every switch. Read-ahead is bounded by a memory
+budget: images are decoded in order of priority (the next ones, then the
+previous one) and an image that would exceed the budget is left for a
+regular load. The current image is never read ahead, since the workspace
+already holds it. Listing the folder also runs on the read-ahead thread, so
+a folder of thousands of files never stalls the window.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+from imagefiles import collect_images
+from instrumentation import span
+from model import decode_image
+from pyramid import ImagePyramid
+
+
+# Memory held by decoded images that are not displayed yet
+DEFAULT_PREFETCH_BUDGET = 1 << 30
+
+# Images decoded ahead of the current one
+DEFAULT_READ_AHEAD = 2
+
+
+def decode_entry(path):
+    """Decode an image file and build its display pyramid, as (image_array, pyramid)"""
+    image_array = decode_image(path)
+    with span('load.pyramid'):
+        pyramid = ImagePyramid(image_array)
+    return image_array, pyramid
+
+
+def entry_bytes(entry):
+    """Memory held by a decoded (image_array, pyramid)"""
+    image_array, pyramid = entry
+    return image_array.nbytes + pyramid.nbytes
+
+
+def estimate_bytes(path):
+    """Memory a decoded image will hold, from its header; the pyramid adds a third"""
+    with Image.open(path) as image:
+        return len(image.getbands()) * image.size[0] * image.size[1] * 4 // 3
+
+
+class ImageFolder:
+    """Ordered list of image paths with a current position"""
+    
+    def __init__(self, paths, index=0):
+        if not paths:
+            raise ValueError("No images found")
+        self.paths = list(paths)
+        self.index = min(max(index, 0), len(self.paths) - 1)
+    
+    @classmethod
+    def open(cls, path):
+        """The images of a directory, or of the directory containing an image file"""
+        if os.path.isdir(path):
+            return cls(collect_images([path]))
+        paths = collect_images([os.path.dirname(os.path.abspath(path))])
+        keys = [os.path.abspath(p) for p in paths]
+        key = os.path.abspath(path)
+        if key not in keys:
+            return cls([path])
+        return cls(paths, keys.index(key))
+    
+    @property
+    def current(self):
+        return self.paths[self.index]
+    
+    def move(self, step):
+        """Move step images forward (negative: back); returns the new path or None at an end"""
+        index = self.index + step
+        if not 0 <= index < len(self.paths):
+            return None
+        self.index = index
+        return self.current
+    
+    def neighbours(self, read_ahead=DEFAULT_READ_AHEAD):
+        """Paths to read ahead, most wanted first: the next ones, then the previous one"""
+        ahead = self.paths[self.index + 1:self.index + 1 + read_ahead]
+        behind = self.paths[self.index - 1:self.index] if self.index else []
+        return ahead + behind
+    
+    def __len__(self):
+        return len(self.paths)
+
+
+class Prefetcher:
+    """
+    Decodes images on one background thread ahead of use and keeps them
+    within a memory budget
+    """
+    
+    def __init__(self, budget=DEFAULT_PREFETCH_BUDGET, load=decode_entry):
+        self.budget = budget
+        self._load = load
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        # path -> Future of (image_array, pyramid), or of None when over budget
+        self._futures = {}
+        self._costs = {}
+        self.used = 0
+    
+    def schedule(self, paths):
+        """
+        Keep paths decoded, in order of priority, and drop every other image.
+        Decoding starts in the background; call again whenever the position
+        in the folder changes.
+        """
+        keys = [os.path.abspath(p) for p in paths]
+        with self._lock:
+            for key in list(self._futures):
+                if key not in keys:
+                    self._futures.pop(key).cancel()
+                    self.used -= self._costs.pop(key, 0)
+            for key in keys:
+                if key not in self._futures:
+                    self._futures[key] = self._executor.submit(self._read_ahead, key)
+    
+    def open_folder(self, path):
+        """
+        List the images of a directory, or of the directory containing an
+        image file, on the read-ahead thread. Returns a Future of the
+        ImageFolder.
+        """
+        return self._executor.submit(ImageFolder.open, path)
+    
+    def get(self, path):
+        """
+        The decoded (image_array, pyramid) of path: taken from the read-ahead
+        when it is ready or in progress, decoded on the calling thread otherwise
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            future = self._futures.get(key)
+        # A queued decode is cancelled and done here instead of waiting behind others
+        if future is not None and not future.cancel():
+            try:
+                entry = future.result()
+            except Exception:
+                entry = None
+            if entry is not None:
+                return entry
+        entry = self._load(path)
+        self._keep(key, entry)
+        return entry
+    
+    def is_ready(self, path):
+        """Whether path is decoded and can be installed without waiting"""
+        with self._lock:
+            future = self._futures.get(os.path.abspath(path))
+        return (future is not None and future.done() and not future.cancelled()
+                and future.exception() is None and future.result() is not None)
+    
+    def clear(self):
+        """Drop every decoded image"""
+        self.schedule([])
+    
+    def _read_ahead(self, key):
+        """Background thread body: decode one image if it fits the budget"""
+        try:
+            estimate = estimate_bytes(key)
+        except Exception:
+            return None
+        with self._lock:
+            if key not in self._futures or self.used + estimate > self.budget:
+                return None
+            self._costs[key] = estimate
+            self.used += estimate
+        
+        try:
+            with span('prefetch', path=key):
+                entry = self._load(key)
+        except Exception:
+            with self._lock:
+                self.used -= self._costs.pop(key, 0)
+            return None
+        
+        with self._lock:
+            if key in self._costs:
+                # Account the real size instead of the estimate
+                cost = entry_bytes(entry)
+                self.used += cost - self._costs[key]
+                self._costs[key] = cost
+        return entry
+    
+    def _keep(self, key, entry):
+        """Hold an image decoded outside the read-ahead if it is still wanted and fits"""
+        cost = entry_bytes(entry)
+        with self._lock:
+            if key not in self._futures or key in self._costs or self.used + cost > self.budget:
+                return
+            future = Future()
+            future.set_result(entry)
+            self._futures[key] = future
+            self._costs[key] = cost
+            self.used += cost
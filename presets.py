@@ -0,0 +1,89 @@
+"""
+Segmentation presets.
+
+For a catalog shoot against a fixed backdrop, the color model trained on
+one image holds for the whole series. A preset stores that model (the two
+centroids and which one is the object) together with the edge settings in
+a small JSON file. Applying it labels an image in one vectorized pass with
+no seeds and no fitting, so a batch only pays for decoding, labeling and
+encoding.
+    
+    {
+        "version": 1,
+        "engine": "kmeans",
+        "centroids": [[48.0, 189.0, 71.5], [248.0, 19.0, 0.0]],
+        "object_cluster": 1,
+        "morphology": {"operation": "erode", "shape": "rect", "size": 3, "iterations": 1}
+    }
+"""
+import json
+
+from atomicfile import atomic_open
+from engines import get_engine
+from morphology import Morphology
+
+
+PRESET_VERSION = 1
+
+
+class Preset:
+    """A trained color model and edge settings, reusable across images"""
+    
+    def __init__(self, engine, centroids, object_cluster, morphology=None):
+        self.engine = engine
+        self.morphology = morphology or Morphology()
+        # Restoring validates the engine name and the color model
+        self._engine = get_engine(engine).restore(centroids, object_cluster)
+    
+    @classmethod
+    def from_model(cls, model):
+        """Train the model's engine on its seeds and capture it as a preset"""
+        engine = model.fit_engine()
+        if engine is None:
+            raise ValueError("Select background and object points before saving a preset")
+        name = model.preset.engine if model.preset is not None else model.engine_name
+        return cls(name, engine.centroids, engine.object_cluster, model.morphology)
+    
+    def create_engine(self):
+        """An engine labeling with the preset's color model, without fitting"""
+        return self._engine
+    
+    def apply(self, image_array, pool=None):
+        """Return the (object_mask, eroded_mask) of an image, labeled in one pass"""
+        object_mask = self._engine.object_mask(image_array, pool)
+        return object_mask, self.morphology.apply(object_mask, pool)
+    
+    def to_dict(self):
+        """The preset as plain data"""
+        morphology = self.morphology
+        data = {'version': PRESET_VERSION, 'engine': self.engine}
+        data.update(self._engine.state())
+        data['morphology'] = {'operation': morphology.operation, 'shape': morphology.shape,
+                              'size': morphology.size, 'iterations': morphology.iterations}
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Build a preset from plain data, raising ValueError if it is invalid"""
+        if not isinstance(data, dict) or data.get('version') != PRESET_VERSION:
+            raise ValueError(f"Not a version {PRESET_VERSION} segmentation preset")
+        try:
+            return cls(data['engine'], data['centroids'], data['object_cluster'],
+                       Morphology(**data.get('morphology', {})))
+        except (KeyError, TypeError) as e:
+            raise ValueError(f"Invalid segmentation preset: {e}")
+    
+    def save(self, path):
+        """Write the preset as JSON, replacing the file atomically"""
+        with atomic_open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+    
+    @classmethod
+    def load(cls, path):
+        """Read a preset file"""
+        with open(path) as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid segmentation preset: {e}")
+        return cls.from_dict(data)
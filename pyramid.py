@@ -0,0 +1,108 @@
+import math
+
+from PIL import Image
+
+
+class ImagePyramid:
+    """
+    Mipmap pyramid of an image for display.
+    Level 0 is the full-resolution image; each further level halves both
+    dimensions with a box filter. Rendering for a canvas or thumbnail picks
+    the smallest level that is still at least as large as the target, so a
+    resize never has to touch the full-resolution pixels again.
+    """
+    
+    def __init__(self, image_array, min_size=64):
+        self.image_array = image_array
+        self.size = (image_array.shape[1], image_array.shape[0])
+        
+        # Level 0 is created from the array only when it is actually needed
+        self.levels = [None]
+        level = Image.fromarray(image_array)
+        while min(level.size) // 2 >= min_size:
+            level = level.reduce(2)
+            self.levels.append(level)
+    
+    @property
+    def nbytes(self):
+        """Memory held by the reduced levels; level 0 is the image array itself"""
+        return sum(len(level.getbands()) * level.size[0] * level.size[1]
+                   for level in self.levels[1:])
+    
+    def level(self, index):
+        """Return one pyramid level as a PIL Image"""
+        if index == 0:
+            return Image.fromarray(self.image_array)
+        return self.levels[index]
+    
+    def level_for_size(self, size):
+        """Index of the smallest level at least as large as size (width, height)"""
+        index = 0
+        for i in range(1, len(self.levels)):
+            width, height = self.levels[i].size
+            if width >= size[0] and height >= size[1]:
+                index = i
+            else:
+                break
+        return index
+    
+    def fit_size(self, max_width, max_height):
+        """Largest size that fits the box without upscaling"""
+        scale = min(max_width / self.size[0], max_height / self.size[1], 1.0)
+        return (max(1, int(self.size[0] * scale)), max(1, int(self.size[1] * scale)))
+    
+    def resize(self, size, resample=Image.Resampling.LANCZOS):
+        """Render the image at size (width, height) from the nearest level"""
+        size = tuple(size)
+        source = self.level(self.level_for_size(size))
+        if source.size == size:
+            return source
+        return source.resize(size, resample)
+    
+    def fit(self, max_width, max_height, resample=Image.Resampling.LANCZOS):
+        """Render the image to fit the box, as the canvases display it"""
+        return self.resize(self.fit_size(max_width, max_height), resample)
+    
+    def render_region(self, box, size, resample=Image.Resampling.BILINEAR):
+        """
+        Render the part of the image inside box (left, top, right, bottom, in
+        full-resolution pixels) at size (width, height). Only the pixels of
+        the box are read, from the smallest level that still has at least
+        the target resolution, so zoomed-in views never convert the whole
+        full-resolution image.
+        """
+        left, top, right, bottom = box
+        scale = min(size[0] / (right - left), size[1] / (bottom - top))
+        index = 0
+        while index + 1 < len(self.levels) and scale * (1 << (index + 1)) <= 1:
+            index += 1
+        
+        if index == 0:
+            # Convert just the covered pixels of the full-resolution array
+            x0, y0 = int(left), int(top)
+            x1, y1 = min(self.size[0], math.ceil(right)), min(self.size[1], math.ceil(bottom))
+            source = Image.fromarray(self.image_array[y0:y1, x0:x1])
+            source_box = (left - x0, top - y0, right - x0, bottom - y0)
+        else:
+            source = self.levels[index]
+            sx, sy = source.size[0] / self.size[0], source.size[1] / self.size[1]
+            source_box = (left * sx, top * sy, right * sx, bottom * sy)
+        return source.resize(tuple(size), resample, box=source_box)
+
+
+def load_preview(image_path, max_width, max_height):
+    """
+    Decode a quick preview of an image file for first paint.
+    JPEG files use PIL draft mode, which decodes at a reduced DCT scale
+    instead of full resolution. Returns (preview, original_size), or
+    (None, original_size) when the format has no reduced decoding.
+    """
+    with Image.open(image_path) as image:
+        original_size = image.size
+        if image.format != 'JPEG':
+            return None, original_size
+        image.draft('RGB', (max_width, max_height))
+        preview = image.convert('RGB')
+    scale = min(max_width / original_size[0], max_height / original_size[1], 1.0)
+    size = (max(1, int(original_size[0] * scale)), max(1, int(original_size[1] * scale)))
+    return preview.resize(size, Image.Resampling.BILINEAR), original_size
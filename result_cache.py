@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Default location of the persistent tier for the desktop application
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'image-decomposer')
+
+# Default size of the persistent tier; the least recently used entries are deleted beyond it
+DEFAULT_DISK_BUDGET = 512 * 1024 * 1024
+
+# Part of every key. Bump it when a change to labeling, seed sampling, erosion
+# or the entry format changes the masks stored for the same inputs, so masks
+# written by older versions are no longer served.
+CACHE_FORMAT_VERSION = 1
+
+
+class SegmentationCache:
+    """
+    Content-addressed cache of segmentation masks.
+    Entries are keyed by the image content hash, the normalized seed set and
+    the engine parameters. A byte-bounded in-memory LRU tier sits in front of
+    an optional persistent on-disk tier that survives restarts and is shared
+    between processes, bounded by disk_budget bytes. Cached masks are
+    read-only, since they are shared by every caller that hits the entry.
+    """
+    
+    def __init__(self, memory_budget=256 * 1024 * 1024, cache_dir=None,
+                 disk_budget=DEFAULT_DISK_BUDGET):
+        self.memory_budget = memory_budget
+        self.cache_dir = cache_dir
+        self.disk_budget = disk_budget
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        # Bytes of the disk tier, counted on the first write
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def make_key(image_digest, background_points, object_points, params):
+        """
+        Build the cache key. Seeds are normalized to their sorted unique
+        coordinates, so neither the order in which they were added nor
+        duplicates (which the fit drops) matter. The key includes
+        CACHE_FORMAT_VERSION.
+        """
+        payload = json.dumps({'version': CACHE_FORMAT_VERSION, 'image': image_digest,
+                              'params': params}, sort_keys=True)
+        digest = hashlib.sha256(payload.encode('utf-8'))
+        for points in (background_points, object_points):
+            coords = np.unique(np.asarray(points, dtype=np.int64).reshape(-1, 2), axis=0)
+            digest.update(len(coords).to_bytes(8, 'little'))
+            digest.update(coords.astype('<i8').tobytes())
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """Return (object_mask, eroded_mask) for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store(key, entry)
+        return entry
+    
+    def put(self, key, object_mask, eroded_mask):
+        """Store the masks for key in both tiers; they become read-only"""
+        entry = _freeze(object_mask, eroded_mask)
+        with self._lock:
+            self._store(key, entry)
+        self._write_disk(key, entry)
+    
+    def stats(self):
+        """Hit/miss/eviction counters and current memory use"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions,
+                'entries': len(self._entries),
+                'memory_bytes': self._memory_bytes,
+            }
+    
+    def disk_bytes(self):
+        """Size of the disk tier"""
+        if not self.cache_dir:
+            return 0
+        return sum(size for _, size, _ in self._disk_entries())
+    
+    def clear(self):
+        """Drop the in-memory tier (the disk tier is kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+    
+    def _store(self, key, entry):
+        """Insert into the memory tier and evict least recently used entries; lock held"""
+        size = sum(mask.nbytes for mask in entry)
+        if size > self.memory_budget:
+            return
+        if key in self._entries:
+            self._memory_bytes -= sum(mask.nbytes for mask in self._entries.pop(key))
+        self._entries[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= sum(mask.nbytes for mask in evicted)
+            self.evictions += 1
+    
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+    
+    def _read_disk(self, key):
+        """Load an entry from the disk tier, or None"""
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with np.load(path) as data:
+                shape = tuple(data['shape'])
+                count = shape[0] * shape[1]
+                object_mask = np.unpackbits(data['object'], count=count).reshape(shape)
+                eroded_mask = np.unpackbits(data['eroded'], count=count).reshape(shape)
+        except (OSError, KeyError, ValueError):
+            return None
+        try:
+            # Eviction deletes the entries read longest ago first
+            os.utime(path)
+        except OSError:
+            pass
+        return _freeze(object_mask, eroded_mask)
+    
+    def _write_disk(self, key, entry):
+        """Write an entry to the disk tier as bit-packed masks"""
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        object_mask, eroded_mask = entry
+        
+        # Write to a temporary file first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, shape=np.array(object_mask.shape),
+                         object=np.packbits(object_mask), eroded=np.packbits(eroded_mask))
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._account_disk(os.path.getsize(path))
+    
+    def _account_disk(self, added):
+        """Count a new disk entry and trim the tier once it exceeds the budget"""
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self.disk_bytes()
+            else:
+                self._disk_bytes += added
+            if self._disk_bytes <= self.disk_budget:
+                return
+            # Other processes share the directory, so trim from a fresh listing
+            entries = sorted(self._disk_entries(), key=lambda e: e[2])
+            self._disk_bytes = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if self._disk_bytes <= self.disk_budget:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+    
+    def _disk_entries(self):
+        """(path, size, mtime) of every entry of the disk tier"""
+        entries = []
+        for directory in os.scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith('.npz'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+
+def _freeze(*masks):
+    """Make masks read-only, so a caller cannot change what the cache hands to others"""
+    for mask in masks:
+        mask.setflags(write=False)
+    return masks
@@ -0,0 +1,188 @@
+"""
+Seed storage for point and brush seeding.
+
+A brush stroke contributes every pixel it covers, easily tens of thousands
+of seeds, so seeds are kept as an (n, 2) integer array of (x, y) coordinates
+instead of a list of tuples. Their colors are read with a single fancy
+index, duplicates from overlapping strokes are dropped, and large sets are
+subsampled evenly across color bins before fitting, so a long stroke over a
+flat area does not drown out a short one over a rarer color.
+"""
+import hashlib
+
+import numpy as np
+
+
+# Seed colors per class kept for fitting; larger sets are subsampled
+MAX_SEED_SAMPLES = 2048
+
+# Bits per channel of the color bins used to stratify the subsample
+STRATUM_BITS = 3
+
+
+class SeedSet:
+    """Growable array of (x, y) seed coordinates"""
+    
+    def __init__(self, coords=None):
+        self._coords = np.empty((64, 2), np.int32)
+        self._count = 0
+        if coords is not None:
+            self.extend(coords)
+    
+    @property
+    def array(self):
+        """The seeds as an (n, 2) array of (x, y); a view, not to be modified"""
+        return self._coords[:self._count]
+    
+    def add(self, x, y):
+        """Add one seed"""
+        self._reserve(1)
+        self._coords[self._count] = (x, y)
+        self._count += 1
+    
+    def extend(self, coords):
+        """Add an (n, 2) array or sequence of (x, y) seeds"""
+        coords = np.asarray(coords, dtype=np.int32).reshape(-1, 2)
+        self._reserve(len(coords))
+        self._coords[self._count:self._count + len(coords)] = coords
+        self._count += len(coords)
+    
+    def copy(self):
+        """Independent copy, e.g. for a worker thread"""
+        return SeedSet(self.array)
+    
+    def _reserve(self, extra):
+        if self._count + extra > len(self._coords):
+            # Grow geometrically so adding seeds one by one stays amortized O(1)
+            grown = np.empty((max(2 * len(self._coords), self._count + extra), 2), np.int32)
+            grown[:self._count] = self.array
+            self._coords = grown
+    
+    def __len__(self):
+        return self._count
+    
+    def __iter__(self):
+        return iter(map(tuple, self.array.tolist()))
+    
+    def __array__(self, dtype=None, copy=None):
+        # np.asarray(seeds) reads the coordinates without iterating
+        return np.array(self.array, dtype=dtype, copy=True if copy else None)
+
+
+def brush_stroke(points, radius):
+    """
+    Coordinates of every pixel within radius of the polyline through points,
+    a sequence of (x, y), as an (n, 2) array without duplicates
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return np.empty((0, 2), np.int32)
+    radius = max(0, int(round(radius)))
+    
+    # Centers one pixel apart along every segment
+    centers = [points[:1]]
+    for start, end in zip(points[:-1], points[1:]):
+        steps = int(np.ceil(np.abs(end - start).max()))
+        if steps:
+            t = np.arange(1, steps + 1)[:, np.newaxis] / steps
+            centers.append(start + t * (end - start))
+    centers = np.rint(np.concatenate(centers)).astype(np.int32)
+    
+    # Stamp a disk of offsets at every center
+    offsets = np.mgrid[-radius:radius + 1, -radius:radius + 1].reshape(2, -1).T
+    offsets = offsets[(offsets ** 2).sum(axis=1) <= radius * radius].astype(np.int32)
+    covered = (centers[:, np.newaxis] + offsets[np.newaxis]).reshape(-1, 2)
+    return np.unique(covered, axis=0)
+
+
+def unique_seeds(coords, shape):
+    """The (x, y) seeds inside an image of shape (h, w, ...), deduplicated, as (xs, ys)"""
+    coords = np.asarray(coords, dtype=np.int64).reshape(-1, 2)
+    h, w = shape[:2]
+    xs, ys = coords[:, 0], coords[:, 1]
+    inside = (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+    flat = np.unique(ys[inside] * w + xs[inside])
+    return flat % w, flat // w
+
+
+def stratified_sample(pixels, max_samples=MAX_SEED_SAMPLES, bits=STRATUM_BITS):
+    """
+    At most about max_samples rows of an (n, channels) pixel array, taken
+    evenly from every color bin in proportion to its size, with at least one
+    row per bin. Deterministic, so the same seeds always fit the same way.
+    """
+    n = len(pixels)
+    if n <= max_samples:
+        return pixels
+    
+    # Color bin of every pixel from the top bits of each channel
+    quantized = (np.asarray(pixels).reshape(n, -1).astype(np.int64) >> (8 - bits))
+    keys = np.zeros(n, np.int64)
+    for channel in quantized.T:
+        keys = (keys << bits) | channel
+    
+    order = np.argsort(keys, kind='stable')
+    _, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+    quotas = np.maximum(1, counts * max_samples // n)
+    
+    # Rank of every pixel within its bin; keep the ones where the scaled rank steps
+    bin_index = np.repeat(np.arange(len(counts)), counts)
+    rank = np.arange(n) - starts[bin_index]
+    quota, count = quotas[bin_index], counts[bin_index]
+    keep = (rank * quota) // count != ((rank - 1) * quota) // count
+    return pixels[np.sort(order[keep])]
+
+
+def seed_pixels(image_array, coords, max_samples=MAX_SEED_SAMPLES):
+    """
+    Colors under the seeds that lie inside the image, deduplicated and
+    subsampled to about max_samples, as an (n, channels) array
+    """
+    xs, ys = unique_seeds(coords, image_array.shape)
+    pixels = image_array[ys, xs]
+    if max_samples is None:
+        return pixels
+    return stratified_sample(pixels, max_samples)
+
+
+# Display colors of background and object seeds
+SEED_COLORS = ((255, 0, 0, 255), (0, 0, 255, 255))
+
+
+def rasterize_seeds(background, object_seeds, box, size, marker_radius=3):
+    """
+    RGBA array of size (width, height) showing the seeds inside box (left,
+    top, right, bottom in image pixels), background red and object blue.
+    Seeds are drawn as dots of marker_radius, or as the full block of
+    canvas pixels they cover once the view is zoomed in further than that.
+    """
+    import cv2
+    
+    left, top, right, bottom = box
+    width, height = size
+    sx, sy = width / (right - left), height / (bottom - top)
+    cell = int(np.ceil(min(sx, sy)))
+    if cell >= 2 * marker_radius + 1:
+        # Spread each seed from its top left corner over its cell
+        kernel, anchor, shift = np.ones((cell, cell), np.uint8), (cell - 1, cell - 1), 0.0
+    else:
+        diameter = 2 * marker_radius + 1
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (diameter, diameter))
+        anchor, shift = (-1, -1), 0.5
+    
+    layer = np.zeros((height, width, 4), np.uint8)
+    for points, color in zip((background, object_seeds), SEED_COLORS):
+        coords = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        xs = np.floor((coords[:, 0] + shift - left) * sx).astype(np.int64)
+        ys = np.floor((coords[:, 1] + shift - top) * sy).astype(np.int64)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        hits = np.zeros((height, width), np.uint8)
+        hits[ys[inside], xs[inside]] = 1
+        layer[cv2.dilate(hits, kernel, anchor=anchor) > 0] = color
+    return layer
+
+
+def seed_digest(points):
+    """Hash of the unique seed coordinates, independent of their order and duplicates"""
+    coords = np.unique(np.asarray(points, dtype=np.int64).reshape(-1, 2), axis=0)
+    return hashlib.sha256(coords.astype('<i8').tobytes()).hexdigest()
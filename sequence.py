@@ -0,0 +1,429 @@
+"""
+Sequence mode: segment every frame of a video or a multi-frame image.
+
+Seeds are placed once on a keyframe. The engine is trained on the keyframe
+and reused for the following frames, or warm-started from the previous
+centroids at a fixed interval. Each frame is compared tile by tile with the
+pixels its labels were computed from, and only tiles that changed are
+labeled again. Decoding, segmentation and encoding run on separate threads
+so they overlap.
+
+Example:
+    python sequence.py turntable.mp4 --seeds seeds.json --output out/
+    python sequence.py spin.gif --seeds seeds.json --output out/ --format mp4
+
+The seed file uses the same format as batch.py; points refer to the keyframe.
+Frame outputs go to <stem>_<type>/frame_00000.png directories, or to
+<stem>_<type>.mp4 / .avi videos when --format is a video format. Inputs
+with the same stem are told apart as in batch.py.
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from batch import load_seeds, seeds_for_image, output_stems
+from engines import get_engine, available_engines, DEFAULT_ENGINE
+from labeling import ColorTableLabeler
+from morphology import Morphology
+from seeds import seed_pixels
+from instrumentation import span
+
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm')
+OUTPUT_TYPES = ('object', 'background', 'eroded')
+
+# Codec used for each video output format
+VIDEO_FOURCC = {'mp4': 'mp4v', 'mov': 'mp4v', 'avi': 'MJPG'}
+
+# Frame rate assumed when the source does not report one
+DEFAULT_FPS = 25.0
+
+# Frames buffered between the decode, segment and encode stages
+QUEUE_DEPTH = 4
+
+# Edge length of the tiles compared between frames
+TILE_SIZE = 64
+
+# Per-channel difference below which a tile counts as unchanged; lossy codecs
+# change pixels of a static scene by a few levels from frame to frame
+CHANGE_THRESHOLD = 8
+
+# Share of changed tiles above which the whole frame is labeled in one call,
+# which is faster than labeling that many tiles one at a time
+FULL_FRAME_FRACTION = 0.5
+
+# Marks the end of a frame queue
+_END = object()
+
+
+def is_video(path):
+    """Check whether a path is read with OpenCV rather than PIL"""
+    return path.lower().endswith(VIDEO_EXTENSIONS)
+
+
+class FrameSource:
+    """Reads the frames of a video file or a multi-frame image as RGB uint8 arrays"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.video = is_video(path)
+        if self.video:
+            import cv2
+            
+            capture = cv2.VideoCapture(path)
+            if not capture.isOpened():
+                raise ValueError(f"Cannot open video {path}")
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+            self.frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+            capture.release()
+        else:
+            with Image.open(path) as image:
+                self.frame_count = getattr(image, 'n_frames', 1)
+                duration = image.info.get('duration')
+                self.fps = 1000.0 / duration if duration else DEFAULT_FPS
+    
+    def frames(self, start=0):
+        """Yield (index, frame) pairs from frame start on"""
+        if self.video:
+            import cv2
+            
+            capture = cv2.VideoCapture(self.path)
+            try:
+                if start:
+                    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+                index = start
+                while True:
+                    ok, frame = capture.read()
+                    if not ok:
+                        break
+                    yield index, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    index += 1
+            finally:
+                capture.release()
+        else:
+            with Image.open(self.path) as image:
+                for index in range(start, self.frame_count):
+                    image.seek(index)
+                    yield index, np.array(image.convert('RGB'))
+    
+    def read(self, index):
+        """Decode a single frame"""
+        for _, frame in self.frames(index):
+            return frame
+        raise IndexError(f"{os.path.basename(self.path)} has no frame {index}")
+
+
+class FrameDirectoryWriter:
+    """Writes every frame as a numbered image file in a directory"""
+    
+    def __init__(self, directory, extension='png'):
+        self.directory = directory
+        self.extension = extension
+        os.makedirs(directory, exist_ok=True)
+    
+    def write(self, index, frame):
+        Image.fromarray(frame).save(os.path.join(self.directory, f"frame_{index:05d}.{self.extension}"))
+    
+    def close(self):
+        pass
+
+
+class VideoFileWriter:
+    """Encodes frames into a video file with OpenCV"""
+    
+    def __init__(self, path, fps, size, fourcc='mp4v'):
+        import cv2
+        
+        self._cv2 = cv2
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+        if not self._writer.isOpened():
+            raise ValueError(f"Cannot write video {path}")
+    
+    def write(self, index, frame):
+        self._writer.write(self._cv2.cvtColor(frame, self._cv2.COLOR_RGB2BGR))
+    
+    def close(self):
+        self._writer.release()
+
+
+def open_sequence_writer(output_dir, stem, image_type, extension, fps, size):
+    """Create the writer for one output sequence"""
+    if extension in VIDEO_FOURCC:
+        path = os.path.join(output_dir, f"{stem}_{image_type}.{extension}")
+        return VideoFileWriter(path, fps, size, VIDEO_FOURCC[extension])
+    return FrameDirectoryWriter(os.path.join(output_dir, f"{stem}_{image_type}"), extension)
+
+
+def _get(frame_queue, stop):
+    """Get from a queue, returning the end marker once stop is set"""
+    while not stop.is_set():
+        try:
+            return frame_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _END
+
+
+def _put(frame_queue, item, stop):
+    """Put into a bounded queue, giving up once stop is set"""
+    while not stop.is_set():
+        try:
+            frame_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+class SequenceSegmenter:
+    """
+    Segments every frame of a sequence with seeds placed once on a keyframe.
+    Labels are only recomputed for tiles whose pixels changed by more than
+    change_threshold (per channel) since they were last labeled; 0 means any
+    change. When most tiles changed, the whole frame is labeled at once.
+    With refit_interval, the engine is refitted every that many
+    frames on the pixels under the seeds, warm-started from the previous
+    centroids.
+    """
+    
+    def __init__(self, engine=DEFAULT_ENGINE, refit_interval=None, change_threshold=CHANGE_THRESHOLD,
+                 tile_size=TILE_SIZE, erosion_iterations=1):
+        self.engine = engine
+        self.refit_interval = refit_interval
+        self.change_threshold = change_threshold
+        self.tile_size = tile_size
+        self.erosion_iterations = erosion_iterations
+        self.morphology = Morphology(iterations=erosion_iterations)
+    
+    def segment(self, source_path, background_points, object_points, output_dir,
+                extension='png', keyframe=0, progress=None, stem=None):
+        """
+        Segment every frame of source_path and write the object, background
+        and eroded sequences to output_dir, named after stem (by default the
+        file name without extension). progress(frames_done) is called after
+        each frame. Returns a result dictionary in the same style as the
+        pipeline.
+        """
+        start = time.perf_counter()
+        source = FrameSource(source_path)
+        with span('sequence.decode', frame=keyframe):
+            key = source.read(keyframe)
+        
+        h, w = key.shape[:2]
+        background_points = [(x, y) for x, y in background_points if 0 <= y < h and 0 <= x < w]
+        object_points = [(x, y) for x, y in object_points if 0 <= y < h and 0 <= x < w]
+        if not background_points or not object_points:
+            return {'success': False, 'error': 'Segmentation failed. Please ensure points are properly selected.'}
+        
+        with span('sequence.fit', frame=keyframe):
+            engine = self._fit(key, background_points, object_points)
+        
+        stem = stem or os.path.splitext(os.path.basename(source_path))[0]
+        os.makedirs(output_dir, exist_ok=True)
+        frames = queue.Queue(QUEUE_DEPTH)
+        outputs = queue.Queue(QUEUE_DEPTH)
+        stop = threading.Event()
+        errors = []
+        
+        def decode():
+            try:
+                for index, frame in source.frames():
+                    if not _put(frames, (index, frame), stop):
+                        return
+            except Exception as e:
+                errors.append(e)
+            _put(frames, _END, stop)
+        
+        def encode():
+            writers = {}
+            try:
+                while True:
+                    item = outputs.get()
+                    if item is _END:
+                        break
+                    index, results = item
+                    with span('sequence.encode', frame=index):
+                        if not writers:
+                            size = results['object'].shape[1::-1]
+                            for image_type in OUTPUT_TYPES:
+                                writers[image_type] = open_sequence_writer(
+                                    output_dir, stem, image_type, extension, source.fps, size)
+                        for image_type in OUTPUT_TYPES:
+                            writers[image_type].write(index, results[image_type])
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                for writer in writers.values():
+                    writer.close()
+        
+        threads = [threading.Thread(target=decode, name='sequence-decode', daemon=True),
+                   threading.Thread(target=encode, name='sequence-encode', daemon=True)]
+        for thread in threads:
+            thread.start()
+        
+        state = {'reference': None, 'object_mask': None, 'eroded_mask': None}
+        labeler = ColorTableLabeler(engine.predict)
+        stats = {'frames': 0, 'unchanged_frames': 0, 'full_frames': 0, 'labeled_tiles': 0,
+                 'total_tiles': 0, 'refits': 0}
+        try:
+            while True:
+                # The decoder does not queue the end marker once stopped
+                item = _get(frames, stop)
+                if item is _END:
+                    break
+                index, frame = item
+                
+                if self.refit_interval and index != keyframe and index % self.refit_interval == 0:
+                    with span('sequence.fit', frame=index):
+                        engine = self._fit(frame, background_points, object_points,
+                                           init_centroids=engine.centroids)
+                    labeler = ColorTableLabeler(engine.predict)
+                    state['reference'] = None
+                    stats['refits'] += 1
+                
+                with span('sequence.segment', frame=index):
+                    results = self._segment_frame(frame, engine, labeler, state, stats)
+                if not _put(outputs, (index, results), stop):
+                    break
+                stats['frames'] += 1
+                if progress:
+                    progress(stats['frames'])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            # The end marker only fails to go in if the encoder already stopped
+            _put(outputs, _END, stop)
+            stop.set()
+            for thread in threads:
+                thread.join()
+        
+        if errors:
+            return {'success': False, 'error': str(errors[0]), 'frames': stats['frames']}
+        
+        stats.update({'success': True, 'error': None, 'fps': source.fps,
+                      'seconds': time.perf_counter() - start})
+        return stats
+    
+    def _fit(self, frame, background_points, object_points, init_centroids=None):
+        """Train the engine on the seed pixels of one frame"""
+        return get_engine(self.engine).fit(seed_pixels(frame, background_points),
+                                           seed_pixels(frame, object_points),
+                                           init_centroids=init_centroids)
+    
+    def _changed_tiles(self, frame, reference):
+        """Boolean grid of the tiles that differ from the reference by more than the threshold"""
+        import cv2
+        
+        h, w = frame.shape[:2]
+        difference = cv2.absdiff(frame, reference).max(axis=2)
+        rows = np.arange(0, h, self.tile_size)
+        cols = np.arange(0, w, self.tile_size)
+        tile_max = np.maximum.reduceat(np.maximum.reduceat(difference, rows, axis=0), cols, axis=1)
+        return tile_max > self.change_threshold
+    
+    def _segment_frame(self, frame, engine, labeler, state, stats):
+        """Update the masks for one frame and composite its three outputs"""
+        import cv2
+        
+        reference = state['reference']
+        tile = self.tile_size
+        tiles = -(-frame.shape[0] // tile) * -(-frame.shape[1] // tile)
+        stats['total_tiles'] += tiles
+        
+        changed = None
+        if reference is not None and reference.shape == frame.shape:
+            changed = self._changed_tiles(frame, reference)
+            changed_count = int(np.count_nonzero(changed))
+        
+        if changed is None or changed_count > tiles * FULL_FRAME_FRACTION:
+            # First frame after a (re)fit, or too many tiles changed: label everything
+            object_mask = (labeler.label(frame) == engine.object_cluster).astype(np.uint8)
+            state['reference'] = frame.copy()
+            changed_count = tiles
+            stats['full_frames'] += 1
+        else:
+            object_mask = state['object_mask']
+            for ty, tx in zip(*np.nonzero(changed)):
+                rows = slice(ty * tile, (ty + 1) * tile)
+                cols = slice(tx * tile, (tx + 1) * tile)
+                object_mask[rows, cols] = labeler.label(frame[rows, cols]) == engine.object_cluster
+                reference[rows, cols] = frame[rows, cols]
+        stats['labeled_tiles'] += changed_count
+        
+        if changed_count:
+            state['eroded_mask'] = self.morphology.apply(object_mask)
+        else:
+            stats['unchanged_frames'] += 1
+        state['object_mask'] = object_mask
+        eroded_mask = state['eroded_mask']
+        
+        # New arrays every frame, since the encoder thread still holds the previous ones
+        results = {}
+        for image_type, mask, keep in (('object', object_mask, 1), ('background', object_mask, 0),
+                                       ('eroded', eroded_mask, 1)):
+            output = frame.copy()
+            output[mask != keep] = [255, 255, 255]
+            results[image_type] = output
+        return results
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Segment every frame of videos or multi-frame images")
+    parser.add_argument('inputs', nargs='+', help="Video files or multi-frame images (GIF, TIFF)")
+    parser.add_argument('--seeds', required=True, help="JSON seed file; points refer to the keyframe")
+    parser.add_argument('--output', required=True, help="Output directory")
+    parser.add_argument('--format', default='png',
+                        help="Frame image extension, or mp4/mov/avi for video output (default: png)")
+    parser.add_argument('--keyframe', type=int, default=0, help="Frame the seeds were placed on")
+    parser.add_argument('--engine', default=DEFAULT_ENGINE, choices=available_engines(),
+                        help="Segmentation engine (default: %(default)s)")
+    parser.add_argument('--refit-interval', type=int, default=None,
+                        help="Refit the engine every N frames, warm-started (default: keyframe fit only)")
+    parser.add_argument('--change-threshold', type=int, default=CHANGE_THRESHOLD,
+                        help="Per-channel difference below which a tile is not relabeled "
+                             "(default: %(default)s)")
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE,
+                        help="Tile size for change detection (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    seeds = load_seeds(args.seeds)
+    try:
+        # Inputs such as clip.gif and clip.avi would write the same outputs
+        stems = output_stems(args.inputs)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    segmenter = SequenceSegmenter(engine=args.engine, refit_interval=args.refit_interval,
+                                  change_threshold=args.change_threshold, tile_size=args.tile_size)
+    failed = 0
+    for path in args.inputs:
+        background, obj = seeds_for_image(seeds, path)
+        try:
+            result = segmenter.segment(path, background, obj, args.output,
+                                       extension=args.format.lower(), keyframe=args.keyframe,
+                                       stem=stems[path])
+        except Exception as e:
+            result = {'success': False, 'error': str(e)}
+        
+        if not result['success']:
+            failed += 1
+            print(f"{path}: FAILED: {result['error']}", file=sys.stderr)
+            continue
+        tiles = result['total_tiles'] or 1
+        print(f"{path}: {result['frames']} frames in {result['seconds']:.2f}s "
+              f"({result['frames'] / result['seconds']:.1f} frames/s), "
+              f"{result['unchanged_frames']} unchanged, "
+              f"{100.0 * result['labeled_tiles'] / tiles:.1f}% of tiles labeled")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
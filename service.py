@@ -0,0 +1,498 @@
+"""
+Local HTTP service exposing the segmentation pipeline to other tools.
+
+An asyncio front end accepts requests into a bounded queue and answers 503
+when it is full, so callers back off instead of piling up work. A dispatcher
+feeds a pool of worker processes that run ProcessingPipeline; small images
+are grouped into micro-batches so one round trip to a worker serves several
+requests. Requests that wait longer than the timeout get 504. Only the
+standard library is used, so the service runs anywhere the batch CLI runs.
+
+Endpoints:
+    POST /segment   JSON request:
+                        {"image": "<base64 image file>",
+                         "background": [[x, y], ...], "object": [[x, y], ...],
+                         "outputs": ["object", "background", "eroded",
+                                     "object_mask", "eroded_mask"],
+                         "engine": "kmeans"}
+                    "outputs" and "engine" are optional; seeds outside the
+                    image are answered with 422. The response carries
+                    each requested output as a base64 PNG:
+                        {"success": true, "error": null, "cached": false,
+                         "outputs": {"object": "<base64 PNG>", ...}}
+    GET /metrics    Queue depth, latency histogram and throughput
+    GET /health     Liveness check
+
+Example:
+    python service.py --port 8765 --workers 4
+    curl -s localhost:8765/metrics
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from model import ImageProcessingModel, decode_image
+from chain_handlers import ProcessingPipeline
+from result_cache import SegmentationCache
+from engines import available_engines, DEFAULT_ENGINE
+from startup import heavy_modules, import_modules
+
+
+RESULT_OUTPUTS = ('object', 'background', 'eroded')
+MASK_OUTPUTS = ('object_mask', 'eroded_mask')
+OUTPUTS = RESULT_OUTPUTS + MASK_OUTPUTS
+
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_TIMEOUT = 30.0
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Images up to this many pixels are grouped into micro-batches
+DEFAULT_BATCH_PIXELS = 1 << 20
+DEFAULT_BATCH_MAX = 8
+DEFAULT_BATCH_WAIT = 0.005
+
+# Upper bounds of the latency histogram buckets in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Window over which throughput is averaged
+THROUGHPUT_WINDOW = 60.0
+
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 422: 'Unprocessable Entity',
+               500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+# Pipeline and thread count owned by each worker process
+_worker_pipeline = None
+_worker_threads = None
+
+
+def _init_worker(threads=None):
+    """Create the per-process pipeline with an in-memory result cache"""
+    global _worker_pipeline, _worker_threads
+    _worker_pipeline = ProcessingPipeline(cache=SegmentationCache())
+    _worker_threads = threads
+
+
+def process_jobs(jobs):
+    """Run a micro-batch of jobs in a worker process; returns one result per job"""
+    return [_process_job(job) for job in jobs]
+
+
+def _process_job(job):
+    """Segment one image and encode the requested outputs as PNG bytes"""
+    start = time.perf_counter()
+    try:
+        model = ImageProcessingModel(engine=job['engine'], workers=_worker_threads)
+        model.set_image(decode_image(io.BytesIO(job['image'])))
+        for x, y in job['background']:
+            model.add_background_point(x, y)
+        for x, y in job['object']:
+            model.add_object_point(x, y)
+        
+        result = (_worker_pipeline or ProcessingPipeline()).process(model)
+        if not result['success']:
+            return {'success': False, 'error': result.get('error')}
+        
+        outputs = {}
+        for name in job['outputs']:
+            if name in RESULT_OUTPUTS:
+                image = result[name]
+            else:
+                mask = model.object_mask if name == 'object_mask' else model.eroded_mask
+                image = Image.fromarray(mask * 255)
+            buffer = io.BytesIO()
+            image.save(buffer, format='PNG')
+            outputs[name] = buffer.getvalue()
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+    
+    return {'success': True, 'error': None, 'cached': result['cached'], 'outputs': outputs,
+            'worker_seconds': time.perf_counter() - start}
+
+
+class HttpError(Exception):
+    """Error answered with an HTTP status and a JSON error body"""
+    
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class Metrics:
+    """Request counters, latency histogram and throughput of the service"""
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counts = {'total': 0, 'succeeded': 0, 'failed': 0, 'rejected': 0, 'timed_out': 0}
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.batches = 0
+        self.batched_jobs = 0
+        self._recent_latencies = deque(maxlen=1024)
+        self._completions = deque()
+    
+    def observe(self, outcome, seconds=None):
+        """Count one finished request; outcome is a key of counts"""
+        self.counts['total'] += 1
+        self.counts[outcome] += 1
+        if seconds is None:
+            return
+        milliseconds = seconds * 1000
+        index = 0
+        while index < len(LATENCY_BUCKETS_MS) and milliseconds > LATENCY_BUCKETS_MS[index]:
+            index += 1
+        self.buckets[index] += 1
+        self.latency_sum += seconds
+        self._recent_latencies.append(seconds)
+        self._completions.append(time.monotonic())
+    
+    def observe_batch(self, size):
+        """Count one batch sent to a worker"""
+        self.batches += 1
+        self.batched_jobs += size
+    
+    def snapshot(self, queue_depth, queue_capacity, in_flight, workers):
+        """Current metrics as a JSON-serializable dict"""
+        now = time.monotonic()
+        while self._completions and now - self._completions[0] > THROUGHPUT_WINDOW:
+            self._completions.popleft()
+        window = min(THROUGHPUT_WINDOW, now - self.started) or 1.0
+        
+        latencies = sorted(self._recent_latencies)
+        
+        def percentile(pct):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(pct / 100.0 * len(latencies)))] * 1000, 3)
+        
+        # Cumulative bucket counts, as in Prometheus histograms
+        histogram = {}
+        total = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + ('+Inf',), self.buckets):
+            total += count
+            histogram[str(bound)] = total
+        
+        return {
+            'uptime_seconds': round(now - self.started, 3),
+            'queue_depth': queue_depth,
+            'queue_capacity': queue_capacity,
+            'in_flight': in_flight,
+            'workers': workers,
+            'requests': dict(self.counts),
+            'batches': {'count': self.batches,
+                        'mean_size': self.batched_jobs / self.batches if self.batches else 0.0},
+            'latency_ms': {'histogram': histogram,
+                           'sum': round(self.latency_sum * 1000, 3),
+                           'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99)},
+            'throughput_per_second': len(self._completions) / window,
+        }
+
+
+class _Job:
+    """A queued request and the future its handler waits on"""
+    
+    __slots__ = ('payload', 'pixels', 'future')
+    
+    def __init__(self, payload, pixels, future):
+        self.payload = payload
+        self.pixels = pixels
+        self.future = future
+
+
+class SegmentationService:
+    """Asyncio HTTP front end feeding a process pool through a bounded queue"""
+    
+    def __init__(self, workers=None, queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT,
+                 batch_max=DEFAULT_BATCH_MAX, batch_pixels=DEFAULT_BATCH_PIXELS,
+                 batch_wait=DEFAULT_BATCH_WAIT, engine=DEFAULT_ENGINE, max_body=MAX_BODY_BYTES):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.batch_max = batch_max
+        self.batch_pixels = batch_pixels
+        self.batch_wait = batch_wait
+        self.engine = engine
+        self.max_body = max_body
+        self.metrics = Metrics()
+        self.in_flight = 0
+        self._queue = None
+        self._slots = None
+        self._executor = None
+        self._dispatcher = None
+        self._server = None
+        self._held = None
+    
+    async def start(self, host='127.0.0.1', port=DEFAULT_PORT):
+        """Start the worker pool and begin listening; returns the asyncio server"""
+        # Forked workers inherit modules imported here instead of each importing them again
+        import_modules(heavy_modules(self.engine))
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(threads,))
+        self._queue = asyncio.Queue(self.queue_size)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._server = await asyncio.start_server(self._handle_connection, host, port)
+        return self._server
+    
+    async def close(self):
+        """Stop listening and shut the worker pool down"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+    
+    async def submit(self, payload, pixels):
+        """Queue one job and wait for its result; raises HttpError on backpressure or timeout"""
+        job = _Job(payload, pixels, asyncio.get_running_loop().create_future())
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.metrics.observe('rejected')
+            raise HttpError(503, "Queue is full, retry later", {'Retry-After': '1'})
+        
+        start = time.monotonic()
+        try:
+            # On timeout the future is cancelled, so a job still queued is skipped
+            result = await asyncio.wait_for(job.future, self.timeout)
+        except asyncio.TimeoutError:
+            self.metrics.observe('timed_out', time.monotonic() - start)
+            raise HttpError(504, f"Request timed out after {self.timeout:g}s")
+        
+        self.metrics.observe('succeeded' if result['success'] else 'failed', time.monotonic() - start)
+        return result
+    
+    async def _next_job(self, timeout=None):
+        """Next queued job that is still waited for, or None when timeout expires"""
+        while True:
+            if self._held is not None:
+                job, self._held = self._held, None
+            elif timeout is None:
+                job = await self._queue.get()
+            else:
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    return None
+            if not job.future.done():
+                return job
+    
+    async def _dispatch(self):
+        """Group queued jobs into batches and hand them to free workers"""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free worker first so the backlog stays in the bounded queue
+            await self._slots.acquire()
+            batch = [await self._next_job()]
+            if batch[0].pixels <= self.batch_pixels:
+                deadline = loop.time() + self.batch_wait
+                while len(batch) < self.batch_max:
+                    job = await self._next_job(max(0.0, deadline - loop.time()))
+                    if job is None:
+                        break
+                    if job.pixels > self.batch_pixels:
+                        # Large images go alone, in the next batch
+                        self._held = job
+                        break
+                    batch.append(job)
+            self.metrics.observe_batch(len(batch))
+            asyncio.create_task(self._run_batch(batch))
+    
+    async def _run_batch(self, batch):
+        """Run one batch on the worker pool and resolve the waiting futures"""
+        loop = asyncio.get_running_loop()
+        batch = [job for job in batch if not job.future.done()]
+        self.in_flight += len(batch)
+        try:
+            if batch:
+                results = await loop.run_in_executor(self._executor, process_jobs,
+                                                     [job.payload for job in batch])
+                for job, result in zip(batch, results):
+                    if not job.future.done():
+                        job.future.set_result(result)
+        except Exception as e:
+            for job in batch:
+                if not job.future.done():
+                    job.future.set_result({'success': False, 'error': f"Worker failed: {e}"})
+        finally:
+            self.in_flight -= len(batch)
+            self._slots.release()
+    
+    async def _handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection, keeping it alive when asked"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    status, payload, extra_headers = await self._route(method, path, body)
+                except HttpError as e:
+                    keep_alive = False
+                    status, payload, extra_headers = e.status, {'success': False, 'error': str(e)}, e.headers
+                await self._write_response(writer, status, payload, extra_headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _read_request(self, reader):
+        """Parse one request; returns (method, path, headers, body) or None at end of stream"""
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise HttpError(400, "Request header too large")
+        
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > self.max_body:
+            raise HttpError(413, f"Request body exceeds {self.max_body} bytes")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target.split('?', 1)[0], headers, body
+    
+    async def _route(self, method, path, body):
+        """Dispatch a request; returns (status, JSON payload, extra headers)"""
+        if path == '/health':
+            return 200, {'status': 'ok'}, {}
+        if path == '/metrics':
+            return 200, self.metrics.snapshot(self._queue.qsize(), self.queue_size,
+                                              self.in_flight, self.workers), {}
+        if path != '/segment':
+            raise HttpError(404, f"Unknown path {path}")
+        if method != 'POST':
+            raise HttpError(405, "Use POST for /segment", {'Allow': 'POST'})
+        
+        payload, pixels = self._parse_segment_request(body)
+        result = await self.submit(payload, pixels)
+        if not result['success']:
+            return 422, {'success': False, 'error': result['error']}, {}
+        outputs = {name: base64.b64encode(data).decode('ascii')
+                   for name, data in result['outputs'].items()}
+        return 200, {'success': True, 'error': None, 'cached': result['cached'],
+                     'outputs': outputs}, {}
+    
+    def _parse_segment_request(self, body):
+        """Validate a /segment body; returns the worker payload and the image pixel count"""
+        try:
+            request = json.loads(body)
+            image = base64.b64decode(request['image'], validate=True)
+            background = [(int(x), int(y)) for x, y in request.get('background', [])]
+            obj = [(int(x), int(y)) for x, y in request.get('object', [])]
+        except (ValueError, KeyError, TypeError) as e:
+            raise HttpError(400, f"Invalid request: {e}")
+        
+        outputs = request.get('outputs') or list(RESULT_OUTPUTS)
+        if not isinstance(outputs, list):
+            raise HttpError(400, "'outputs' must be a list of output names")
+        unknown = [name for name in outputs if name not in OUTPUTS]
+        if unknown:
+            raise HttpError(400, f"Unknown outputs: {', '.join(map(str, unknown))}")
+        engine = request.get('engine') or self.engine
+        if engine not in available_engines():
+            raise HttpError(400, f"Unknown engine '{engine}'")
+        
+        # Only the header is read here; the worker decodes the pixels
+        try:
+            with Image.open(io.BytesIO(image)) as header:
+                width, height = header.size
+        except Exception:
+            raise HttpError(400, "Image data could not be read")
+        
+        # Negative coordinates would index from the far edge instead of failing
+        for x, y in background + obj:
+            if not (0 <= x < width and 0 <= y < height):
+                raise HttpError(422, f"Seed point ({x}, {y}) is outside the {width}x{height} image")
+        
+        return {'image': image, 'background': background, 'object': obj,
+                'outputs': outputs, 'engine': engine}, width * height
+    
+    async def _write_response(self, writer, status, payload, extra_headers, keep_alive):
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Content-Length': str(len(body)),
+                   'Connection': 'keep-alive' if keep_alive else 'close'}
+        headers.update(extra_headers)
+        head = f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+        head += ''.join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await writer.drain()
+
+
+async def serve(service, host, port):
+    """Run the service until interrupted"""
+    server = await service.start(host, port)
+    print(f"Listening on http://{host}:{port} with {service.workers} workers", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Serve the segmentation pipeline over HTTP")
+    parser.add_argument('--host', default='127.0.0.1', help="Interface to bind (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help="Requests waiting for a worker before 503 is returned (default: %(default)s)")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help="Seconds a request may wait for its result (default: %(default)s)")
+    parser.add_argument('--batch-max', type=int, default=DEFAULT_BATCH_MAX,
+                        help="Most small images sent to a worker at once (default: %(default)s)")
+    parser.add_argument('--batch-megapixels', type=float, default=DEFAULT_BATCH_PIXELS / 1e6,
+                        help="Images up to this size are micro-batched (default: %(default).2f)")
+    parser.add_argument('--batch-wait-ms', type=float, default=DEFAULT_BATCH_WAIT * 1000,
+                        help="How long a batch waits to fill up (default: %(default)g)")
+    parser.add_argument('--engine', default=DEFAULT_ENGINE, choices=available_engines(),
+                        help="Default segmentation engine (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    service = SegmentationService(workers=args.workers, queue_size=args.queue_size,
+                                  timeout=args.timeout, batch_max=args.batch_max,
+                                  batch_pixels=int(args.batch_megapixels * 1e6),
+                                  batch_wait=args.batch_wait_ms / 1000.0, engine=args.engine)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
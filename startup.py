@@ -0,0 +1,90 @@
+"""
+Startup helpers: background preloading of heavy modules and a startup profile.
+
+The application draws its window before importing the model, and scikit-learn
+and OpenCV are only imported where they are used. preload_modules() imports
+them on a background thread after first paint, so the first processing run
+does not pay for them either. For per-module detail beyond the phases
+reported here, run with `python -X importtime`.
+"""
+import importlib
+import sys
+import threading
+import time
+
+from instrumentation import span
+
+
+# Modules needed by every segmentation run regardless of the engine
+BASE_MODULES = ('cv2',)
+
+
+def heavy_modules(engine=None):
+    """Lazily imported modules a segmentation with engine (default engine if None) will need"""
+    # Imported here since engines pulls in NumPy, which the window does not need
+    from engines import required_modules, DEFAULT_ENGINE
+    
+    return BASE_MODULES + tuple(required_modules(engine or DEFAULT_ENGINE))
+
+
+def import_modules(module_names):
+    """Import modules now, each timed as a startup span"""
+    for name in module_names:
+        with span(f"import {name}", category='startup'):
+            importlib.import_module(name)
+
+
+def preload_modules(module_names, on_done=None):
+    """
+    Import modules on a daemon thread. on_done() is called on that thread
+    once all of them are loaded. Returns the thread.
+    """
+    def run():
+        import_modules(module_names)
+        if on_done is not None:
+            on_done()
+    
+    thread = threading.Thread(target=run, name='preload', daemon=True)
+    thread.start()
+    return thread
+
+
+class StartupProfile:
+    """
+    Instrumentation subscriber that collects the 'startup' spans and marks
+    milestones, then reports them relative to the start time.
+    """
+    
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.phases = []
+        self.marks = []
+        self._lock = threading.Lock()
+    
+    def __call__(self, event):
+        if event['category'] != 'startup':
+            return
+        with self._lock:
+            self.phases.append((event['name'], event['start'] - self.start,
+                                event['wall_seconds'], threading.current_thread().name))
+    
+    def mark(self, name):
+        """Record a milestone such as first paint"""
+        with self._lock:
+            self.marks.append((name, time.perf_counter() - self.start))
+    
+    def report(self):
+        """Format the collected phases and milestones as text lines"""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase[1])
+            marks = list(self.marks)
+        lines = ["Startup profile (ms since start):"]
+        for name, offset, seconds, thread in phases:
+            lines.append(f"  {offset * 1000:8.1f}  {name:<28} {seconds * 1000:8.1f} ms  [{thread}]")
+        for name, offset in marks:
+            lines.append(f"  {offset * 1000:8.1f}  * {name}")
+        return lines
+    
+    def print_report(self, file=None):
+        """Write the report to file, stderr by default"""
+        print("\n".join(self.report()), file=file or sys.stderr)
@@ -0,0 +1,72 @@
+import os
+import queue
+import sys
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+
+# The application modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# Seeds inside the green background and the red object of sample_array
+BACKGROUND_SEEDS = [(5, 5), (150, 110), (10, 100)]
+OBJECT_SEEDS = [(80, 60), (60, 45)]
+
+
+@pytest.fixture
+def sample_array():
+    """A 160x120 RGB image: a red rectangle with a ragged edge on green"""
+    image = np.zeros((120, 160, 3), np.uint8)
+    image[:] = (20, 200, 30)
+    image[30:90, 40:120] = (220, 30, 20)
+    image[30:90:4, 120:124] = (220, 30, 20)
+    return image
+
+
+@pytest.fixture
+def sample_image(tmp_path, sample_array):
+    """sample_array saved as a PNG file"""
+    path = tmp_path / "sample.png"
+    Image.fromarray(sample_array).save(path)
+    return str(path)
+
+
+class FakeView:
+    """Records view calls and runs UI callbacks when pumped"""
+    
+    result_size = (350, 350)
+    
+    def __init__(self):
+        self.calls = []
+        self._callbacks = queue.Queue()
+    
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.calls.append((name, args))
+    
+    def canvas_size(self):
+        return 400, 300
+    
+    def morphology_settings(self):
+        return {}
+    
+    def run_on_ui_thread(self, callback):
+        self._callbacks.put(callback)
+    
+    def pump(self, until, timeout=10):
+        """Run UI callbacks until until() holds"""
+        deadline = time.monotonic() + timeout
+        while not until():
+            assert time.monotonic() < deadline, "timed out waiting for the UI"
+            try:
+                self._callbacks.get(timeout=0.01)()
+            except queue.Empty:
+                pass
+    
+    def called(self, name):
+        return [args for call, args in self.calls if call == name]
@@ -0,0 +1,135 @@
+import json
+import os
+import tracemalloc
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import batch
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from batch import output_stems, run_batch, OUTPUT_TYPES
+from layers import load_layers
+
+
+SEEDS = {'background': BACKGROUND_SEEDS, 'object': OBJECT_SEEDS}
+
+
+def test_output_stems_keep_unique_names():
+    assert output_stems(['in/a.png', 'in/b.jpg']) == {'in/a.png': 'a', 'in/b.jpg': 'b'}
+
+
+def test_output_stems_disambiguate_colliding_names():
+    stems = output_stems(['x/a/img.png', 'x/b/img.png', 'x/other.png'])
+    assert stems == {'x/a/img.png': 'a_img', 'x/b/img.png': 'b_img', 'x/other.png': 'other'}
+    
+    # Only the extension differs
+    stems = output_stems(['x/img.png', 'x/img.jpg'])
+    assert stems == {'x/img.png': 'img_png', 'x/img.jpg': 'img_jpg'}
+
+
+def test_output_stems_refuse_names_that_still_collide():
+    with pytest.raises(ValueError, match="would both be written"):
+        output_stems(['x/a/img.png', 'x/b/img.png', 'x/a_img.png'])
+
+
+def test_batch_writes_every_image_with_a_colliding_name(tmp_path, sample_array):
+    inputs = [tmp_path / 'a' / 'img.png', tmp_path / 'b' / 'img.png', tmp_path / 'a' / 'img.bmp']
+    for index, path in enumerate(inputs):
+        path.parent.mkdir(exist_ok=True)
+        # Distinct contents so an overwritten output would show
+        Image.fromarray(np.roll(sample_array, 10 * index, axis=1)).save(path)
+    
+    output_dir = tmp_path / 'out'
+    summary = run_batch([str(p) for p in inputs], SEEDS, str(output_dir), workers=1)
+    
+    assert summary['succeeded'] == 3
+    objects = sorted(name for name in os.listdir(output_dir) if name.endswith('_object.png'))
+    assert objects == ['a_img_bmp_object.png', 'a_img_png_object.png', 'b_img_png_object.png']
+
+
+@pytest.fixture
+def inputs(tmp_path, sample_array):
+    """Two images in a folder and a seed file for them"""
+    folder = tmp_path / 'in'
+    folder.mkdir()
+    Image.fromarray(sample_array).save(folder / 'one.png')
+    Image.fromarray(sample_array[::-1].copy()).save(folder / 'two.bmp')
+    seeds = tmp_path / 'seeds.json'
+    seeds.write_text(json.dumps({'background': BACKGROUND_SEEDS, 'object': OBJECT_SEEDS,
+                                 'images': {'two.bmp': {
+                                     'background': [(x, 119 - y) for x, y in BACKGROUND_SEEDS],
+                                     'object': [(x, 119 - y) for x, y in OBJECT_SEEDS]}}}))
+    return str(folder), str(seeds)
+
+
+def run_cli(inputs, output_dir, *options):
+    folder, seeds = inputs
+    return batch.main([folder, '--seeds', seeds, '--output', str(output_dir), '--quiet', *options])
+
+
+def test_cli_in_memory(inputs, tmp_path, capsys):
+    assert run_cli(inputs, tmp_path / 'out', '--workers', '2') == 0
+    names = sorted(os.listdir(tmp_path / 'out'))
+    assert names == sorted(f"{stem}_{t}.png" for stem in ('one', 'two') for t in OUTPUT_TYPES)
+    assert 'Processed 2 images' in capsys.readouterr().out
+
+
+def test_cli_tiled_matches_in_memory(inputs, tmp_path):
+    assert run_cli(inputs, tmp_path / 'memory', '--workers', '1') == 0
+    assert run_cli(inputs, tmp_path / 'tiled', '--workers', '1', '--tiled',
+                   '--memory-budget', '24') == 0
+    for name in os.listdir(tmp_path / 'memory'):
+        np.testing.assert_array_equal(np.asarray(Image.open(tmp_path / 'tiled' / name)),
+                                      np.asarray(Image.open(tmp_path / 'memory' / name)))
+
+
+def test_cli_cache_dir_serves_repeated_runs(inputs, tmp_path, capsys):
+    cache = tmp_path / 'cache'
+    report = tmp_path / 'report.json'
+    assert run_cli(inputs, tmp_path / 'first', '--workers', '1', '--cache-dir', str(cache)) == 0
+    assert run_cli(inputs, tmp_path / 'second', '--workers', '1', '--cache-dir', str(cache),
+                   '--report', str(report)) == 0
+    assert json.loads(report.read_text())['cache_hits'] == 2
+    for name in os.listdir(tmp_path / 'first'):
+        np.testing.assert_array_equal(np.asarray(Image.open(tmp_path / 'second' / name)),
+                                      np.asarray(Image.open(tmp_path / 'first' / name)))
+
+
+def test_cli_layered_results(inputs, tmp_path, sample_array):
+    assert run_cli(inputs, tmp_path / 'out', '--workers', '1', '--format', 'seg') == 0
+    assert sorted(os.listdir(tmp_path / 'out')) == ['one.seg', 'two.seg']
+    layers = load_layers(str(tmp_path / 'out' / 'one.seg'))
+    assert layers['source'] == os.path.join(inputs[0], 'one.png')
+    
+    # The layered masks rebuild the same composite as the in-memory output
+    assert run_cli(inputs, tmp_path / 'png', '--workers', '1') == 0
+    composite = sample_array.copy()
+    composite[layers['object_mask'] == 0] = 255
+    np.testing.assert_array_equal(np.asarray(Image.open(tmp_path / 'png' / 'one_object.png')),
+                                  composite)
+
+
+def test_cli_rejects_incompatible_options(inputs, tmp_path):
+    with pytest.raises(SystemExit):
+        run_cli(inputs, tmp_path / 'out', '--tiled', '--format', 'seg')
+    assert run_cli((str(tmp_path / 'nothing'), inputs[1]), tmp_path / 'out') == 2
+
+
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_cli_trace_records_allocations(inputs, tmp_path, workers):
+    trace_path = tmp_path / 'trace.json'
+    assert run_cli(inputs, tmp_path / 'out', '--workers', workers, '--trace', str(trace_path)) == 0
+    events = json.loads(trace_path.read_text())['traceEvents']
+    images = [e for e in events if e['name'] == 'batch.image']
+    assert len(images) == 2
+    assert all('alloc_bytes' in e['args'] for e in images)
+    assert not tracemalloc.is_tracing()
+
+
+def test_cli_trace_without_allocations(inputs, tmp_path):
+    trace_path = tmp_path / 'trace.json'
+    assert run_cli(inputs, tmp_path / 'out', '--workers', '1', '--trace', str(trace_path),
+                   '--no-trace-allocations') == 0
+    events = json.loads(trace_path.read_text())['traceEvents']
+    assert events and not any('alloc_bytes' in e['args'] for e in events)
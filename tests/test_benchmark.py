@@ -0,0 +1,19 @@
+import json
+
+import benchmark
+
+
+def test_report_names_the_stages_it_times(tmp_path):
+    output = tmp_path / "results.json"
+    assert benchmark.main(['--sizes', '0.02', '--repeat', '1', '--engines', 'numpy',
+                           '--output', str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert 'tracemalloc' in report['meta']['peak_bytes']
+    result = report['results'][0]
+    assert set(result['stages']) == set(benchmark.STAGES) and 'render' in result['stages']
+    assert result['accuracy']['iou'] > 0.9
+    
+    # A run compared with itself has no regressions
+    assert benchmark.main(['--sizes', '0.02', '--repeat', '1', '--engines', 'numpy',
+                           '--output', str(tmp_path / "again.json"), '--baseline', str(output),
+                           '--tolerance', '10']) == 0
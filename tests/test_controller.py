@@ -0,0 +1,173 @@
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS, FakeView
+from controller import ImageSegmentationController
+from model import ImageProcessingModel
+from parallel import Cancelled
+
+
+@pytest.fixture
+def controller(sample_image):
+    view = FakeView()
+    controller = ImageSegmentationController(ImageProcessingModel(), view)
+    controller.load_image(sample_image)
+    view.pump(lambda: not controller._loading)
+    yield controller
+    controller._preview_executor.shutdown()
+
+
+def process(controller):
+    """Run the pipeline on the current seeds and wait for the result"""
+    view = controller.view
+    done = len(view.called('show_message'))
+    controller.process_image()
+    view.pump(lambda: len(view.called('show_message')) > done)
+    return view.called('show_message')[-1]
+
+
+def add_seeds(controller):
+    for x, y in BACKGROUND_SEEDS:
+        controller.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        controller.add_object_point(x, y)
+
+
+def blocking_preview(model):
+    """Make compute_preview wait for an event; returns (event, list of computed seed counts)"""
+    release = threading.Event()
+    computed = []
+    compute = model.compute_preview
+    
+    def compute_preview(background_points, object_points, **kwargs):
+        release.wait(10)
+        computed.append(len(background_points) + len(object_points))
+        return compute(background_points, object_points, **kwargs)
+    
+    model.compute_preview = compute_preview
+    return release, computed
+
+
+def test_previews_coalesce_onto_one_worker(controller):
+    view = controller.view
+    release, computed = blocking_preview(controller.model)
+    controller.add_background_point(*BACKGROUND_SEEDS[0])
+    controller.set_live_preview(True)
+    threads = threading.active_count()
+    add_seeds(controller)
+    assert threading.active_count() <= threads + 1
+    
+    release.set()
+    view.pump(lambda: len(view.called('display_preview_mask')) == 1)
+    controller._preview_executor.submit(lambda: None).result()
+    # The first request, then only the newest of those made while it ran
+    assert computed == [1, 1 + len(BACKGROUND_SEEDS) + len(OBJECT_SEEDS)]
+
+
+def test_preview_of_previous_image_is_dropped(controller, tmp_path, sample_array):
+    view = controller.view
+    add_seeds(controller)
+    release, computed = blocking_preview(controller.model)
+    controller.set_live_preview(True)
+    
+    other = tmp_path / "other.png"
+    Image.fromarray(sample_array[:60, :80]).save(other)
+    controller.load_image(str(other))
+    view.pump(lambda: not controller._loading)
+    release.set()
+    controller._preview_executor.submit(lambda: None).result()
+    view.pump(lambda: view._callbacks.empty())
+    
+    assert computed and not view.called('display_preview_mask')
+    assert controller.model.preview_centroids is None
+
+
+def test_compute_preview_ignores_an_image_replaced_during_the_fit(sample_array):
+    model = ImageProcessingModel()
+    model.set_image(sample_array)
+    create_engine = model.create_engine
+    
+    def create_switching_engine():
+        engine = create_engine()
+        fit = engine.fit
+        
+        def fit_then_switch(*args, **kwargs):
+            fitted = fit(*args, **kwargs)
+            model.set_image(np.zeros((10, 10, 3), np.uint8))
+            return fitted
+        
+        engine.fit = fit_then_switch
+        return engine
+    
+    model.create_engine = create_switching_engine
+    assert model.compute_preview(BACKGROUND_SEEDS, OBJECT_SEEDS) is None
+    assert model.preview_centroids is None
+
+
+def test_masks_stay_in_memory_without_a_cache_dir(controller):
+    add_seeds(controller)
+    assert process(controller)[0] == "Success"
+    assert controller.cache.cache_dir is None
+    
+    assert process(controller)[0] == "Success"
+    assert controller.cache.stats()['hits'] == 1
+
+
+def test_masks_are_kept_in_the_cache_dir(sample_image, tmp_path):
+    cache_dir = tmp_path / "cache"
+    view = FakeView()
+    controller = ImageSegmentationController(ImageProcessingModel(), view, str(cache_dir))
+    controller.load_image(sample_image)
+    view.pump(lambda: not controller._loading)
+    add_seeds(controller)
+    assert process(controller)[0] == "Success"
+    assert controller.cache.disk_bytes() > 0
+    controller._preview_executor.shutdown()
+
+
+def test_superseded_job_stops_before_labeling(controller, monkeypatch):
+    view = controller.view
+    fitting, release = threading.Event(), threading.Event()
+    labeled, outcomes = [], []
+    fit_engine = ImageProcessingModel.fit_engine
+    label = ImageProcessingModel._label
+    segment = ImageProcessingModel.perform_kmeans_segmentation
+    
+    def slow_first_fit(model):
+        if not fitting.is_set():
+            fitting.set()
+            release.wait(10)
+        return fit_engine(model)
+    
+    def record_label(model, *args, **kwargs):
+        labeled.append(len(model.object_points))
+        return label(model, *args, **kwargs)
+    
+    def record_outcome(model, *args, **kwargs):
+        try:
+            outcomes.append(segment(model, *args, **kwargs))
+        except Cancelled:
+            outcomes.append('cancelled')
+            raise
+        return outcomes[-1]
+    
+    monkeypatch.setattr(ImageProcessingModel, 'fit_engine', slow_first_fit)
+    monkeypatch.setattr(ImageProcessingModel, '_label', record_label)
+    monkeypatch.setattr(ImageProcessingModel, 'perform_kmeans_segmentation', record_outcome)
+    add_seeds(controller)
+    controller.process_image()
+    assert fitting.wait(10)
+    
+    # The newer job finishes while the first one is still fitting
+    controller.add_object_point(100, 70)
+    assert process(controller)[0] == "Success"
+    release.set()
+    view.pump(lambda: len(outcomes) == 2)
+    
+    assert outcomes == [True, 'cancelled']
+    assert labeled == [len(OBJECT_SEEDS) + 1]
+    assert len(view.called('display_results')) == 1
+    assert controller.model.result_key == controller.model.stage_keys()['erode']
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from engines import get_engine, available_engines, required_modules, DEFAULT_ENGINE
+
+
+def seed_colors(image):
+    background = [image[y, x] for x, y in BACKGROUND_SEEDS]
+    objects = [image[y, x] for x, y in OBJECT_SEEDS]
+    return background, objects
+
+
+def noisy(sample_array):
+    image = sample_array.astype(np.int16)
+    image += np.random.default_rng(2).integers(-50, 50, image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def test_registry_lists_and_creates_engines():
+    assert available_engines() == ['kmeans', 'minibatch', 'numpy']
+    assert DEFAULT_ENGINE in available_engines()
+    for name in available_engines():
+        engine = get_engine(name)
+        assert engine.name == name and engine.params()['engine'] == name
+    assert get_engine('kmeans', n_init=3).params()['n_init'] == 3
+    assert required_modules('kmeans') == ('sklearn.cluster',)
+    assert required_modules('numpy') == ()
+
+
+def test_unknown_engine_names_the_available_ones():
+    with pytest.raises(ValueError, match="Unknown segmentation engine 'nosuch'.*kmeans, minibatch, numpy"):
+        get_engine('nosuch')
+    with pytest.raises(ValueError):
+        get_engine('numpy', dtype='float16')
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'int'])
+def test_numpy_engine_matches_kmeans_on_uint8(sample_array, dtype):
+    image = noisy(sample_array)
+    background, objects = seed_colors(sample_array)
+    kmeans = get_engine('kmeans').fit(background, objects)
+    engine = get_engine('numpy', dtype=dtype).fit(background, objects)
+    # Uniform seed colors make the KMeans centroids the seed means
+    np.testing.assert_allclose(engine.centroids[engine.object_cluster],
+                               kmeans.centroids[kmeans.object_cluster])
+    np.testing.assert_array_equal(engine.object_mask(image), kmeans.object_mask(image))
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'int'])
+def test_numpy_engine_handles_16_bit_images(sample_array, dtype):
+    eight_bit = noisy(sample_array)
+    image = eight_bit.astype(np.uint16) * 257
+    background, objects = seed_colors(sample_array.astype(np.uint16) * 257)
+    engine = get_engine('numpy', dtype=dtype).fit(background, objects)
+    
+    pixels = image.reshape(-1, 3).astype(np.float64)
+    distances = ((pixels[:, np.newaxis] - engine.centroids) ** 2).sum(axis=2)
+    expected = distances.argmin(axis=1).reshape(image.shape[:2])
+    np.testing.assert_array_equal(engine.label(image), expected)
+    # The same image in 8 bits gives the same mask
+    eight_bit_engine = get_engine('numpy', dtype=dtype).fit(*seed_colors(sample_array))
+    np.testing.assert_array_equal(engine.object_mask(image), eight_bit_engine.object_mask(eight_bit))
+
+
+def test_state_restores_the_color_model(sample_array):
+    image = noisy(sample_array)
+    for name in available_engines():
+        engine = get_engine(name).fit(*seed_colors(sample_array))
+        restored = get_engine(name).restore(**engine.state())
+        np.testing.assert_array_equal(restored.object_mask(image), engine.object_mask(image))
+    with pytest.raises(ValueError):
+        get_engine('numpy').restore([[1, 2, 3]], 0)
+    with pytest.raises(ValueError):
+        get_engine('numpy').restore([[1, 2, 3], [4, 5, 6]], 2)
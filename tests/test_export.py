@@ -0,0 +1,86 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from export import ExportQueue, EncoderSettings, format_name, save_image, supports_alpha
+
+
+def export_all(jobs, settings=None, workers=3):
+    """Run one export group and return its results"""
+    queue = ExportQueue(workers)
+    done = threading.Event()
+    results = []
+    
+    def on_done(group):
+        results.extend(group)
+        done.set()
+    
+    queue.submit(jobs, settings, on_done)
+    assert done.wait(10)
+    queue.shutdown()
+    assert queue.pending == 0
+    return results
+
+
+def test_results_come_back_in_job_order(tmp_path, sample_array):
+    image = Image.fromarray(sample_array)
+    
+    def slow_render():
+        time.sleep(0.2)
+        return image
+    
+    paths = [str(tmp_path / name) for name in ('slow.png', 'a.jpg', 'b.webp')]
+    results = export_all([(slow_render, paths[0]), (lambda: image, paths[1]),
+                          (lambda: image, paths[2])])
+    assert [r['path'] for r in results] == paths
+    assert all(r['success'] and r['error'] is None for r in results)
+    assert results[0]['seconds'] >= 0.2
+    np.testing.assert_array_equal(np.asarray(Image.open(paths[0])), sample_array)
+    assert Image.open(paths[1]).format == 'JPEG' and Image.open(paths[2]).format == 'WEBP'
+
+
+def test_failures_are_reported_per_job(tmp_path, sample_array):
+    image = Image.fromarray(sample_array)
+    
+    def broken_render():
+        raise RuntimeError("renderer crashed")
+    
+    results = export_all([(lambda: None, str(tmp_path / 'none.png')),
+                          (broken_render, str(tmp_path / 'broken.png')),
+                          (lambda: image, str(tmp_path / 'image.nosuch')),
+                          (lambda: image, str(tmp_path / 'ok.png'))])
+    assert [r['success'] for r in results] == [False, False, False, True]
+    assert results[0]['error'] == "No result to export"
+    assert results[1]['error'] == "renderer crashed"
+    assert "Unsupported file extension" in results[2]['error']
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['ok.png']
+
+
+def test_encoder_settings(tmp_path, sample_array):
+    rgba = Image.fromarray(np.dstack([sample_array, np.full(sample_array.shape[:2], 128, np.uint8)]))
+    save_image(rgba, str(tmp_path / 'flat.jpg'), EncoderSettings(jpeg_quality=50))
+    assert Image.open(tmp_path / 'flat.jpg').mode == 'RGB'
+    
+    save_image(rgba, str(tmp_path / 'fast.png'), EncoderSettings(png_compress_level=0))
+    save_image(rgba, str(tmp_path / 'small.png'), EncoderSettings(png_compress_level=9))
+    assert (tmp_path / 'fast.png').stat().st_size > (tmp_path / 'small.png').stat().st_size
+    assert Image.open(tmp_path / 'small.png').mode == 'RGBA'
+    
+    assert EncoderSettings(webp_lossless=True).save_options('WEBP') == {'quality': 90, 'lossless': True}
+    assert EncoderSettings().save_options('BMP') == {}
+    for options in ({'png_compress_level': 10}, {'jpeg_quality': 0}, {'webp_quality': 101}):
+        with pytest.raises(ValueError):
+            EncoderSettings(**options)
+
+
+def test_file_names_and_alpha_support():
+    assert format_name("{stem}_{type}", "shoe", "object", ".png") == "shoe_object.png"
+    assert format_name("{type}-{stem}", "shoe", "eroded", "jpg") == "eroded-shoe.jpg"
+    assert len(format_name("{date}", "shoe", "object", "png")) == len("20240101.png")
+    with pytest.raises(ValueError):
+        format_name("{size}", "shoe", "object", "png")
+    assert supports_alpha("a.png") and supports_alpha("a.WEBP") and supports_alpha("a.tif")
+    assert not supports_alpha("a.jpg") and not supports_alpha("a.bmp")
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+
+from instrumentation import Instrumentation, ChromeTraceWriter
+
+
+@pytest.fixture
+def instrumentation():
+    instrumentation = Instrumentation()
+    instrumentation.enable()
+    yield instrumentation
+    instrumentation.disable()
+
+
+def spin(seconds):
+    """Burn seconds of CPU time on the calling thread"""
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def collect(instrumentation):
+    events = []
+    instrumentation.subscribe(events.append)
+    return events
+
+
+def test_disabled_spans_publish_nothing():
+    instrumentation = Instrumentation()
+    events = collect(instrumentation)
+    with instrumentation.span('quiet'):
+        pass
+    assert events == []
+
+
+def test_span_cpu_time_is_the_thread_cpu_time(instrumentation):
+    events = collect(instrumentation)
+    # Another thread burns CPU while the span's own thread only sleeps
+    busy = threading.Thread(target=spin, args=(0.3,))
+    with instrumentation.span('waiting', stage='test'):
+        busy.start()
+        busy.join()
+    event = events[0]
+    assert event['wall_seconds'] >= 0.3
+    assert event['cpu_seconds'] < 0.1
+    assert event['process_cpu_seconds'] >= 0.2
+    assert event['args'] == {'stage': 'test'}
+
+
+def test_nested_spans_record_their_parent(instrumentation):
+    events = collect(instrumentation)
+    with instrumentation.span('outer'):
+        with instrumentation.span('inner'):
+            pass
+    assert [(e['name'], e['parent']) for e in events] == [('inner', 'outer'), ('outer', None)]
+
+
+def test_chrome_trace_carries_both_cpu_times(instrumentation):
+    writer = instrumentation.subscribe(ChromeTraceWriter())
+    with instrumentation.span('traced'):
+        spin(0.01)
+    args = writer.events[0]['args']
+    assert args['cpu_ms'] > 0 and args['process_cpu_ms'] > 0
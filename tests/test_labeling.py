@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from engines import get_engine
+from labeling import PaletteLabeler, ColorTableLabeler
+from parallel import BandPool
+
+
+def noisy_image(sample_array, height, width):
+    """sample_array scaled up with per-pixel noise, so most colors are distinct"""
+    rows = np.arange(height) * sample_array.shape[0] // height
+    cols = np.arange(width) * sample_array.shape[1] // width
+    image = sample_array[rows][:, cols].astype(np.int16)
+    image += np.random.default_rng(0).integers(-40, 40, image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture(scope='module')
+def engine():
+    image = np.zeros((120, 160, 3), np.uint8)
+    image[:] = (20, 200, 30)
+    image[30:90, 40:120] = (220, 30, 20)
+    background = [image[y, x] for x, y in BACKGROUND_SEEDS] + [(90, 120, 60)]
+    objects = [image[y, x] for x, y in OBJECT_SEEDS] + [(150, 90, 40)]
+    return get_engine('kmeans').fit(background, objects)
+
+
+def direct_labels(engine, image_array):
+    return engine.predict(image_array.reshape(-1, image_array.shape[2])).reshape(image_array.shape[:2])
+
+
+@pytest.mark.parametrize('height, width', [(120, 160), (512, 640)], ids=['unique', 'table'])
+def test_labels_match_direct_prediction(engine, sample_array, height, width):
+    image = noisy_image(sample_array, height, width)
+    uses_table = height * width >= PaletteLabeler.LUT_MIN_PIXELS
+    assert uses_table == (width == 640)
+    labels = PaletteLabeler(engine.predict).label(image)
+    assert labels.dtype == np.uint8
+    np.testing.assert_array_equal(labels, direct_labels(engine, image))
+
+
+def test_band_parallel_labels_match_direct_prediction(engine, sample_array):
+    image = noisy_image(sample_array, 300, 400)
+    pool = BandPool(4, min_band_pixels=1 << 12)
+    try:
+        assert len(pool.bands(300, 400)) == 4
+        labels = PaletteLabeler(engine.predict).label(image, pool)
+    finally:
+        pool.shutdown()
+    np.testing.assert_array_equal(labels, direct_labels(engine, image))
+
+
+def test_other_dtypes_match_direct_prediction(engine, sample_array):
+    image = noisy_image(sample_array, 60, 80).astype(np.uint16) * 257
+    labels = PaletteLabeler(lambda pixels: engine.predict(pixels / 257)).label(image)
+    np.testing.assert_array_equal(labels, direct_labels(engine, image // 257))
+
+
+def test_color_table_is_reused_across_tiles(engine, sample_array):
+    image = noisy_image(sample_array, 120, 160)
+    calls = []
+    
+    def predict(colors):
+        calls.append(len(colors))
+        return engine.predict(colors)
+    
+    labeler = ColorTableLabeler(predict)
+    np.testing.assert_array_equal(labeler.label(image), direct_labels(engine, image))
+    seen = sum(calls)
+    np.testing.assert_array_equal(labeler.label(image[:60]), direct_labels(engine, image[:60]))
+    assert sum(calls) == seen
@@ -0,0 +1,72 @@
+import os
+import stat
+
+import numpy as np
+import pytest
+
+from atomicfile import atomic_open
+from layers import encode_mask, decode_mask, save_layers, load_layers
+
+
+def expected_mode():
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+@pytest.mark.parametrize('mask', [
+    np.zeros((40, 50), np.uint8),
+    np.ones((40, 50), np.uint8),
+    np.pad(np.ones((20, 30), np.uint8), ((10, 10), (10, 10))),
+    (np.random.default_rng(0).random((40, 50)) > 0.5).astype(np.uint8),
+    np.zeros((0, 5), np.uint8),
+])
+def test_encode_decode_round_trip(mask):
+    encoding, data = encode_mask(mask)
+    np.testing.assert_array_equal(decode_mask(encoding, data, mask.shape), mask)
+
+
+def test_encoding_picks_the_smaller_form():
+    blocky = np.pad(np.ones((200, 300), np.uint8), 100)
+    assert encode_mask(blocky)[0] == 'rle'
+    noisy = (np.random.default_rng(0).random((200, 300)) > 0.5).astype(np.uint8)
+    assert encode_mask(noisy)[0] == 'packed'
+
+
+def test_decode_rejects_inconsistent_data():
+    with pytest.raises(ValueError):
+        decode_mask('rle', np.array([3, 4], np.uint32), (3, 3))
+    with pytest.raises(ValueError):
+        decode_mask('packed', np.zeros(1, np.uint8), (4, 4))
+    with pytest.raises(ValueError):
+        decode_mask('zip', np.zeros(1, np.uint8), (1, 1))
+
+
+def test_save_and_load(tmp_path, sample_image):
+    object_mask = np.zeros((120, 160), np.uint8)
+    object_mask[30:90, 40:120] = 1
+    eroded_mask = np.zeros_like(object_mask)
+    eroded_mask[31:89, 41:119] = 1
+    path = tmp_path / "results" / "sample.seg"
+    path.parent.mkdir()
+    save_layers(str(path), object_mask, eroded_mask, sample_image, 'digest')
+    
+    layers = load_layers(str(path))
+    assert layers['source'] == os.path.normpath(sample_image)
+    assert layers['digest'] == 'digest'
+    np.testing.assert_array_equal(layers['object_mask'], object_mask)
+    np.testing.assert_array_equal(layers['eroded_mask'], eroded_mask)
+    # Created like any other file, not with the owner-only mode of temporary files
+    assert stat.S_IMODE(os.stat(path).st_mode) == expected_mode()
+    assert os.listdir(path.parent) == ['sample.seg']
+
+
+def test_atomic_open_keeps_the_old_file_on_errors(tmp_path):
+    path = tmp_path / "preset.json"
+    path.write_text("old")
+    with pytest.raises(RuntimeError):
+        with atomic_open(str(path), 'w') as f:
+            f.write("partial")
+            raise RuntimeError
+    assert path.read_text() == "old"
+    assert os.listdir(tmp_path) == ['preset.json']
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from memo import StageMemo
+from model import ImageProcessingModel
+
+
+STAGES = ('fit', 'label', 'erode')
+
+
+@pytest.fixture
+def model(sample_array):
+    model = ImageProcessingModel(workers=1)
+    model.set_image(sample_array)
+    for x, y in BACKGROUND_SEEDS:
+        model.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        model.add_object_point(x, y)
+    return model
+
+
+def rerun(model):
+    """Segment again and return the stages recomputed"""
+    misses = dict(model.memo.misses)
+    assert model.perform_kmeans_segmentation()
+    return [stage for stage in STAGES if model.memo.misses.get(stage, 0) > misses.get(stage, 0)]
+
+
+def test_stage_memo_keeps_the_last_output_per_stage():
+    memo = StageMemo()
+    assert memo.get('fit', 'a') is None
+    memo.put('fit', 'a', 1)
+    assert memo.get('fit', 'a') == 1
+    memo.put('fit', 'b', 2)
+    assert memo.get('fit', 'a') is None and memo.get('fit', 'b') == 2
+    memo.clear()
+    assert memo.get('fit', 'b') is None
+    assert memo.hits == {'fit': 2} and memo.misses == {'fit': 3}
+
+
+def test_unchanged_inputs_reuse_every_stage(model):
+    assert rerun(model) == ['fit', 'label', 'erode']
+    object_mask, eroded_mask = model.object_mask, model.eroded_mask
+    assert rerun(model) == []
+    assert model.object_mask is object_mask and model.eroded_mask is eroded_mask
+
+
+def test_edge_settings_only_rerun_erosion(model):
+    rerun(model)
+    object_mask = model.object_mask
+    model.set_morphology('open', 'ellipse', 5)
+    assert rerun(model) == ['erode']
+    assert model.object_mask is object_mask
+    np.testing.assert_array_equal(model.eroded_mask, model.morphology.apply(object_mask))
+
+
+def test_coarse_to_fine_reruns_labeling(model):
+    rerun(model)
+    model.set_coarse_to_fine(2)
+    assert rerun(model) == ['label', 'erode']
+
+
+@pytest.mark.parametrize('change', [
+    lambda model: model.add_object_point(70, 50),
+    lambda model: model.set_engine('numpy'),
+    lambda model: model.set_engine('kmeans', n_init=3),
+], ids=['seed', 'engine', 'engine parameter'])
+def test_color_model_changes_rerun_every_stage(model, change):
+    rerun(model)
+    change(model)
+    assert rerun(model) == ['fit', 'label', 'erode']
+
+
+def test_new_image_reruns_every_stage(model, sample_array):
+    rerun(model)
+    model.set_image(sample_array.copy())
+    for x, y in BACKGROUND_SEEDS:
+        model.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        model.add_object_point(x, y)
+    assert rerun(model) == ['fit', 'label', 'erode']
+
+
+def test_snapshots_share_the_memo(model):
+    snapshot = model.snapshot()
+    assert snapshot.perform_kmeans_segmentation()
+    model.adopt_results(snapshot)
+    assert rerun(model) == []
+    assert model.object_mask is snapshot.object_mask
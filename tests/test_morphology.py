@@ -0,0 +1,72 @@
+import cv2
+import numpy as np
+import pytest
+
+from engines import get_engine
+from morphology import Morphology, OPERATIONS, KERNEL_SHAPES
+from parallel import BandPool
+
+
+def random_mask(shape=(97, 131), seed=0):
+    """A blobby 0/1 mask that touches the frame edge"""
+    rng = np.random.default_rng(seed)
+    mask = (rng.random(shape) > 0.35).astype(np.uint8)
+    mask[:, :10] = 0
+    mask[40:, 90:] = 1
+    return mask
+
+
+def reference(morphology, mask):
+    """Full-frame OpenCV result with the configured kernel applied iteration by iteration"""
+    kernel = cv2.getStructuringElement(getattr(cv2, KERNEL_SHAPES[morphology.shape]),
+                                       (morphology.size, morphology.size))
+    op = {'erode': cv2.MORPH_ERODE, 'open': cv2.MORPH_OPEN, 'close': cv2.MORPH_CLOSE}[morphology.operation]
+    return cv2.morphologyEx(mask, op, kernel, iterations=morphology.iterations)
+
+
+@pytest.mark.parametrize('operation', OPERATIONS)
+@pytest.mark.parametrize('shape', sorted(KERNEL_SHAPES))
+@pytest.mark.parametrize('size,iterations', [(3, 1), (5, 2), (3, 4)])
+def test_matches_full_frame_opencv(operation, shape, size, iterations):
+    morphology = Morphology(operation, shape, size, iterations)
+    mask = random_mask()
+    expected = reference(morphology, mask)
+    np.testing.assert_array_equal(morphology.apply(mask), expected)
+    
+    # Several bands with halos, and a reused output buffer with stale contents
+    pool = BandPool(workers=3, min_band_pixels=1)
+    out = np.ones_like(mask)
+    np.testing.assert_array_equal(morphology.apply(mask, pool, out=out), expected)
+    pool.shutdown()
+
+
+def test_small_object_in_large_frame():
+    mask = np.zeros((2000, 3000), np.uint8)
+    mask[1200:1260, 700:790] = 1
+    morphology = Morphology('close', 'ellipse', 5, 3)
+    np.testing.assert_array_equal(morphology.apply(mask), reference(morphology, mask))
+
+
+def test_empty_mask():
+    assert not Morphology().apply(np.zeros((10, 10), np.uint8)).any()
+
+
+@pytest.mark.parametrize('dtype', [np.int32, np.int64, np.bool_])
+def test_non_uint8_masks(dtype):
+    mask = random_mask()
+    result = Morphology('open', 'rect', 3, 2).apply(mask.astype(dtype))
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, Morphology('open', 'rect', 3, 2).apply(mask))
+
+
+def test_labels_to_mask_returns_uint8():
+    engine = get_engine('numpy').restore([[0, 0, 0], [255, 255, 255]], 1)
+    labels = np.array([[0, 1], [1, 0]], np.int32)
+    mask = engine.labels_to_mask(labels)
+    assert mask.dtype == np.uint8
+    np.testing.assert_array_equal(mask, [[0, 1], [1, 0]])
+
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        Morphology('dilate')
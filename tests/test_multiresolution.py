@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from engines import get_engine
+from model import ImageProcessingModel
+from multiresolution import coarse_to_fine_mask, boundary_cells, upsample_cells
+from pyramid import ImagePyramid
+
+
+def product_shot(height, width):
+    """A noisy round object with a stand on a light backdrop"""
+    y, x = np.mgrid[0:height, 0:width]
+    cx, cy, radius = width // 2, height * 9 // 20, min(height, width) * 3 // 10
+    image = np.empty((height, width, 3), np.int16)
+    image[:] = (235, 235, 230)
+    image[((x - cx) ** 2 + (y - cy) ** 2 < radius ** 2)
+          | ((abs(x - cx) < radius // 3) & (y > cy) & (y < height * 9 // 10))] = (150, 40, 30)
+    image += np.random.default_rng(0).integers(-40, 40, image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def seeded_model(image, engine='kmeans'):
+    h, w = image.shape[:2]
+    model = ImageProcessingModel(engine=engine, workers=1)
+    model.set_image(image)
+    for x, y in [(5, 5), (w - 5, 5), (5, h - 5)]:
+        model.add_background_point(x, y)
+    for x, y in [(w // 2, h * 9 // 20), (w // 2, h * 3 // 4)]:
+        model.add_object_point(x, y)
+    return model
+
+
+@pytest.mark.parametrize('engine', ['kmeans', 'numpy'])
+def test_coarse_to_fine_matches_full_resolution_at_4_mp(engine):
+    image = product_shot(2000, 2000)
+    model = seeded_model(image, engine)
+    assert model.perform_kmeans_segmentation()
+    full = model.object_mask
+    
+    coarse = []
+    model.set_coarse_to_fine(8)
+    model.perform_kmeans_segmentation(on_coarse=coarse.append)
+    np.testing.assert_array_equal(model.object_mask, full)
+    assert coarse[0].shape == (250, 250)
+    
+    # Only the blocks along the edge are labeled per pixel
+    engine = model.fit_engine()
+    _, fraction = coarse_to_fine_mask(engine, image, np.asarray(model.pyramid.level(3)), 8)
+    assert fraction < 0.05
+
+
+@pytest.mark.parametrize('factor', [2, 4, 8])
+def test_partial_edge_blocks_match_full_resolution(factor):
+    image = product_shot(301, 437)
+    engine = seeded_model(image).fit_engine()
+    level = factor.bit_length() - 1
+    coarse_array = np.asarray(ImagePyramid(image, min_size=16).level(level))
+    mask, fraction = coarse_to_fine_mask(engine, image, coarse_array, factor)
+    np.testing.assert_array_equal(mask, engine.object_mask(image))
+    assert 0 < fraction < 1
+
+
+def test_coarse_image_must_match_the_factor():
+    image = product_shot(64, 64)
+    engine = get_engine('numpy').fit([(235, 235, 230)], [(150, 40, 30)])
+    with pytest.raises(ValueError):
+        coarse_to_fine_mask(engine, image, image[::4, ::4][:-1], 4)
+
+
+def test_boundary_cells_surround_the_edge():
+    coarse = np.zeros((10, 10), np.uint8)
+    coarse[4:, :] = 1
+    cells = boundary_cells(coarse, margin=0)
+    assert cells[3:5].all() and not cells[:3].any() and not cells[5:].any()
+    assert boundary_cells(coarse, margin=1)[2:6].all()
+    
+    expanded = upsample_cells(coarse, 4, (38, 40))
+    assert expanded.shape == (38, 40) and expanded[15].sum() == 0 and expanded[16].all()
@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from engines import get_engine
+from model import ImageProcessingModel, composite, composite_alpha
+from morphology import Morphology
+from options import OPERATIONS
+from parallel import BandPool, Cancelled, CancellablePool
+
+
+def test_cancelled_pool_stops_between_bands():
+    pool = BandPool(4, min_band_pixels=1)
+    # A single thread runs the four bands one after another
+    pool._executor = ThreadPoolExecutor(1)
+    cancel_event = threading.Event()
+    done = []
+    
+    def band(top, bottom):
+        done.append(top)
+        cancel_event.set()
+    
+    try:
+        with pytest.raises(Cancelled):
+            CancellablePool(pool, cancel_event).map(band, 8, 8)
+    finally:
+        pool.shutdown()
+    assert done == [0]
+
+
+def test_cancelled_segmentation_memoizes_nothing(sample_array):
+    model = ImageProcessingModel(workers=1)
+    model.set_image(sample_array)
+    for x, y in BACKGROUND_SEEDS:
+        model.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        model.add_object_point(x, y)
+    cancel_event = threading.Event()
+    cancel_event.set()
+    with pytest.raises(Cancelled):
+        model.perform_kmeans_segmentation(cancel_event=cancel_event)
+    assert model.memo.get('fit', model.stage_keys()['fit']) is None
+    assert model.perform_kmeans_segmentation(cancel_event=threading.Event())
+
+
+def ragged_image(sample_array):
+    """A 300x400 noisy copy of sample_array with a ragged object edge"""
+    rows = np.arange(300) * 120 // 300
+    cols = np.arange(400) * 160 // 400
+    image = sample_array[rows][:, cols].astype(np.int16)
+    image += np.random.default_rng(1).integers(-60, 60, image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+@pytest.fixture(scope='module')
+def serial_engines():
+    image = np.zeros((120, 160, 3), np.uint8)
+    image[:] = (20, 200, 30)
+    image[30:90, 40:120] = (220, 30, 20)
+    background = [image[y, x] for x, y in BACKGROUND_SEEDS]
+    objects = [image[y, x] for x, y in OBJECT_SEEDS]
+    return [get_engine(name).fit(background, objects) for name in ('kmeans', 'numpy')]
+
+
+@pytest.mark.parametrize('workers', [1, 4, 8])
+def test_band_parallel_results_match_serial(sample_array, serial_engines, workers):
+    image = ragged_image(sample_array)
+    pool = BandPool(workers, min_band_pixels=1 << 10)
+    assert len(pool.bands(300, 400)) == workers
+    try:
+        for engine in serial_engines:
+            labels = engine.label(image, pool)
+            np.testing.assert_array_equal(labels, engine.label(image))
+            mask = engine.object_mask(image, pool)
+            serial_mask = engine.object_mask(image)
+            np.testing.assert_array_equal(mask, serial_mask)
+            
+            for operation in OPERATIONS:
+                morphology = Morphology(operation, 'ellipse', 5, 2)
+                np.testing.assert_array_equal(morphology.apply(mask, pool),
+                                              morphology.apply(serial_mask))
+            for keep in (0, 1):
+                np.testing.assert_array_equal(composite(image, mask, keep, pool),
+                                              composite(image, serial_mask, keep))
+                np.testing.assert_array_equal(composite_alpha(image, mask, keep, pool),
+                                              composite_alpha(image, serial_mask, keep))
+    finally:
+        pool.shutdown()
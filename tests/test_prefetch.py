@@ -0,0 +1,130 @@
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+from PIL import Image
+
+import prefetch
+from conftest import FakeView
+from imagefiles import collect_images
+from prefetch import ImageFolder, Prefetcher
+from controller import ImageSegmentationController
+from model import ImageProcessingModel
+
+
+def make_folder(tmp_path, sample_array, count=4):
+    for index in range(count):
+        Image.fromarray(np.roll(sample_array, index, axis=0)).save(tmp_path / f"im{index}.png")
+    return [str(tmp_path / f"im{index}.png") for index in range(count)]
+
+
+def prefetched(prefetcher):
+    return sorted(os.path.basename(key) for key in prefetcher._futures)
+
+
+def test_neighbours_leave_out_the_current_image(tmp_path, sample_array):
+    paths = make_folder(tmp_path, sample_array)
+    folder = ImageFolder(paths, 1)
+    assert folder.neighbours() == [paths[2], paths[3], paths[0]]
+    folder.move(2)
+    assert folder.neighbours() == [paths[2]]
+
+
+def test_prefetcher_decodes_scheduled_images(tmp_path, sample_array):
+    paths = make_folder(tmp_path, sample_array, 2)
+    prefetcher = Prefetcher()
+    prefetcher.schedule(paths)
+    image_array, pyramid = prefetcher.get(paths[1])
+    np.testing.assert_array_equal(image_array, np.roll(sample_array, 1, axis=0))
+    prefetcher.clear()
+    assert prefetcher.used == 0
+
+
+def shown(controller, count):
+    """Wait until count images have been shown"""
+    view = controller.view
+    view.pump(lambda: len(view.called('show_folder_position')) >= count and not controller._loading)
+    return view.called('show_folder_position')[-1]
+
+
+def test_open_images_are_not_read_ahead(tmp_path, sample_array):
+    make_folder(tmp_path, sample_array)
+    view = FakeView()
+    controller = ImageSegmentationController(ImageProcessingModel(), view)
+    controller.open_folder(str(tmp_path))
+    assert shown(controller, 1) == (1, 4, 'im0.png')
+    assert prefetched(controller.prefetcher) == ['im1.png', 'im2.png']
+    
+    controller.next_image()
+    assert shown(controller, 2) == (2, 4, 'im1.png')
+    # im0 stays open in the workspace and im1 is shown
+    assert prefetched(controller.prefetcher) == ['im2.png', 'im3.png']
+
+
+def test_prefetch_does_not_import_the_batch_tools():
+    code = "import sys, prefetch; print('batch' in sys.modules)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True,
+                            text=True, check=True).stdout
+    assert output.strip() == 'False'
+
+
+def test_folder_is_listed_off_the_ui_thread(tmp_path, sample_array, monkeypatch):
+    paths = make_folder(tmp_path, sample_array)
+    release = threading.Event()
+    listed_on = []
+    
+    def slow_collect_images(inputs):
+        listed_on.append(threading.current_thread().name)
+        release.wait(10)
+        return collect_images(inputs)
+    
+    monkeypatch.setattr(prefetch, 'collect_images', slow_collect_images)
+    view = FakeView()
+    controller = ImageSegmentationController(ImageProcessingModel(), view)
+    controller.load_image(paths[1])
+    # The image opens while its folder is still being listed
+    assert shown(controller, 1) == (1, 1, 'im1.png')
+    assert len(controller.folder) == 1
+    
+    release.set()
+    assert shown(controller, 2) == (2, 4, 'im1.png')
+    assert listed_on and listed_on[0].startswith('prefetch')
+    assert prefetched(controller.prefetcher) == ['im0.png', 'im2.png', 'im3.png']
+    controller.next_image()
+    assert shown(controller, 3) == (3, 4, 'im2.png')
+
+
+def test_only_the_newest_folder_listing_is_used(tmp_path, sample_array, monkeypatch):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    make_folder(tmp_path / "a", sample_array)
+    other = make_folder(tmp_path / "b", sample_array, 2)
+    release = threading.Event()
+    
+    def slow_collect_images(inputs):
+        if 'a' in os.path.basename(inputs[0]):
+            release.wait(10)
+        return collect_images(inputs)
+    
+    monkeypatch.setattr(prefetch, 'collect_images', slow_collect_images)
+    view = FakeView()
+    controller = ImageSegmentationController(ImageProcessingModel(), view)
+    controller.open_folder(str(tmp_path / "a"))
+    controller.load_image(other[1])
+    release.set()
+    view.pump(lambda: len(controller.folder) == 2 and controller.image_path and not controller._loading)
+    # Both listings are done once the read-ahead thread runs the next task
+    controller.prefetcher.open_folder(str(tmp_path / "b")).result()
+    view.pump(lambda: view._callbacks.empty())
+    assert controller.folder.paths == other and controller.image_path == other[1]
+
+
+def test_missing_folders_are_reported(tmp_path):
+    view = FakeView()
+    controller = ImageSegmentationController(ImageProcessingModel(), view)
+    controller.open_folder(str(tmp_path / "nothing"))
+    view.pump(lambda: view.called('show_message'))
+    assert view.called('show_message')[0][0] == "Error"
@@ -0,0 +1,91 @@
+import json
+
+import numpy as np
+import pytest
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from engines import available_engines
+from model import ImageProcessingModel
+from morphology import Morphology
+from presets import Preset, PRESET_VERSION
+
+
+def seeded_model(sample_array, engine):
+    model = ImageProcessingModel(engine=engine, workers=1)
+    model.set_image(sample_array)
+    model.set_morphology('open', 'cross', 5)
+    for x, y in BACKGROUND_SEEDS:
+        model.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        model.add_object_point(x, y)
+    return model
+
+
+@pytest.mark.parametrize('engine', available_engines())
+def test_saved_preset_reproduces_the_segmentation(tmp_path, sample_array, engine):
+    model = seeded_model(sample_array, engine)
+    path = tmp_path / "backdrop.json"
+    Preset.from_model(model).save(str(path))
+    preset = Preset.load(str(path))
+    assert preset.engine == engine
+    assert preset.morphology.params() == model.morphology.params()
+    
+    assert model.perform_kmeans_segmentation()
+    object_mask, eroded_mask = preset.apply(sample_array)
+    np.testing.assert_array_equal(object_mask, model.object_mask)
+    np.testing.assert_array_equal(eroded_mask, model.eroded_mask)
+    
+    # A model using the preset needs no seeds
+    other = ImageProcessingModel(workers=1)
+    other.set_image(sample_array)
+    other.use_preset(preset)
+    assert other.perform_kmeans_segmentation()
+    np.testing.assert_array_equal(other.eroded_mask, model.eroded_mask)
+
+
+def test_unknown_top_level_keys_are_ignored(sample_array):
+    data = Preset('numpy', [[20, 200, 30], [220, 30, 20]], 1).to_dict()
+    data['comment'] = "white sweep, studio 2"
+    preset = Preset.from_dict(data)
+    assert preset.to_dict() == Preset.from_dict(preset.to_dict()).to_dict()
+    assert preset.morphology.params() == Morphology().params()
+    assert preset.apply(sample_array)[0][60, 80] == 1
+
+
+@pytest.mark.parametrize('change', [
+    {'version': PRESET_VERSION + 1},
+    {'engine': 'nosuch'},
+    {'centroids': [[1, 2, 3]]},
+    {'object_cluster': 2},
+    {'morphology': {'operation': 'erode', 'radius': 3}},
+    {'morphology': {'operation': 'melt'}},
+], ids=['version', 'engine', 'centroids', 'object cluster', 'morphology key', 'operation'])
+def test_invalid_presets_are_rejected(change):
+    data = Preset('kmeans', [[20, 200, 30], [220, 30, 20]], 1).to_dict()
+    data.update(change)
+    with pytest.raises(ValueError):
+        Preset.from_dict(data)
+
+
+def test_missing_keys_and_bad_files_are_rejected(tmp_path):
+    data = Preset('kmeans', [[20, 200, 30], [220, 30, 20]], 1).to_dict()
+    del data['centroids']
+    with pytest.raises(ValueError):
+        Preset.from_dict(data)
+    with pytest.raises(ValueError):
+        Preset.from_dict([data])
+    
+    path = tmp_path / "broken.json"
+    path.write_text('{"version": 1, "engine": ')
+    with pytest.raises(ValueError):
+        Preset.load(str(path))
+    path.write_text(json.dumps({'engine': 'kmeans'}))
+    with pytest.raises(ValueError):
+        Preset.load(str(path))
+
+
+def test_preset_needs_seeds_to_capture(sample_array):
+    model = ImageProcessingModel(workers=1)
+    model.set_image(sample_array)
+    with pytest.raises(ValueError):
+        Preset.from_model(model)
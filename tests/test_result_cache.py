@@ -0,0 +1,80 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+import result_cache
+from result_cache import SegmentationCache
+
+
+def masks(seed, shape=(60, 80)):
+    rng = np.random.default_rng(seed)
+    object_mask = (rng.random(shape) > 0.5).astype(np.uint8)
+    return object_mask, (object_mask & (rng.random(shape) > 0.2)).astype(np.uint8)
+
+
+def test_key_ignores_seed_order_and_duplicates():
+    key = SegmentationCache.make_key('digest', [(1, 2), (3, 4)], [(5, 6)], {'k': 2})
+    assert key == SegmentationCache.make_key('digest', [(3, 4), (1, 2), (1, 2)], [(5, 6)], {'k': 2})
+    assert key != SegmentationCache.make_key('digest', [(1, 2)], [(3, 4), (5, 6)], {'k': 2})
+    assert key != SegmentationCache.make_key('other', [(1, 2), (3, 4)], [(5, 6)], {'k': 2})
+
+
+def test_key_changes_with_the_format_version(monkeypatch):
+    key = SegmentationCache.make_key('digest', [(1, 2)], [(5, 6)], {'k': 2})
+    monkeypatch.setattr(result_cache, 'CACHE_FORMAT_VERSION', result_cache.CACHE_FORMAT_VERSION + 1)
+    assert key != SegmentationCache.make_key('digest', [(1, 2)], [(5, 6)], {'k': 2})
+
+
+def test_round_trip_through_memory_and_disk(tmp_path):
+    object_mask, eroded_mask = masks(0)
+    cache = SegmentationCache(cache_dir=str(tmp_path))
+    assert cache.get('ab12') is None
+    cache.put('ab12', object_mask, eroded_mask)
+    assert cache.get('ab12')[0] is object_mask
+    
+    # A new process only has the disk tier
+    cached = SegmentationCache(cache_dir=str(tmp_path)).get('ab12')
+    np.testing.assert_array_equal(cached[0], object_mask)
+    np.testing.assert_array_equal(cached[1], eroded_mask)
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_cached_masks_are_read_only(tmp_path):
+    cache = SegmentationCache(cache_dir=str(tmp_path))
+    cache.put('cd34', *masks(0))
+    for cached in (cache.get('cd34'), SegmentationCache(cache_dir=str(tmp_path)).get('cd34')):
+        for mask in cached:
+            with pytest.raises(ValueError):
+                mask[0, 0] = 1
+
+
+def test_memory_tier_evicts_least_recently_used():
+    object_mask, eroded_mask = masks(0)
+    entry_bytes = object_mask.nbytes + eroded_mask.nbytes
+    cache = SegmentationCache(memory_budget=2 * entry_bytes)
+    for key in ('a', 'b'):
+        cache.put(key, *masks(0))
+    cache.get('a')
+    cache.put('c', *masks(0))
+    assert cache.get('b') is None and cache.get('a') is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_disk_tier_evicts_entries_read_longest_ago(tmp_path):
+    cache = SegmentationCache(cache_dir=str(tmp_path))
+    for index in range(3):
+        cache.put(f'e{index}', *masks(index))
+        age = time.time() - 30 + 10 * index
+        os.utime(cache._disk_path(f'e{index}'), (age, age))
+    cache.disk_budget = cache.disk_bytes()
+    
+    # Reading e0 from disk makes e1 the least recently used entry
+    assert SegmentationCache(cache_dir=str(tmp_path)).get('e0') is not None
+    cache.put('e3', *masks(3))
+    
+    assert cache.disk_bytes() <= cache.disk_budget
+    assert not os.path.exists(cache._disk_path('e1'))
+    assert all(os.path.exists(cache._disk_path(key)) for key in ('e0', 'e2', 'e3'))
+    assert cache.stats()['disk_evictions'] == 1
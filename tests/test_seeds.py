@@ -0,0 +1,67 @@
+import numpy as np
+
+from seeds import (SeedSet, brush_stroke, unique_seeds, stratified_sample, seed_pixels,
+                   seed_digest, STRATUM_BITS)
+
+
+def test_seed_set_grows_and_copies():
+    seeds = SeedSet([(1, 2)])
+    for i in range(100):
+        seeds.add(i, i + 1)
+    seeds.extend(np.array([[5, 6], [7, 8]], np.int64))
+    assert len(seeds) == 103
+    assert list(seeds)[:2] == [(1, 2), (0, 1)] and list(seeds)[-1] == (7, 8)
+    copy = seeds.copy()
+    copy.add(9, 9)
+    assert len(seeds) == 103 and len(copy) == 104
+    np.testing.assert_array_equal(np.asarray(seeds), seeds.array)
+
+
+def test_brush_stroke_covers_a_disk_along_the_line():
+    assert brush_stroke([], 3).shape == (0, 2)
+    np.testing.assert_array_equal(brush_stroke([(4, 5)], 0), [[4, 5]])
+    assert len(brush_stroke([(10, 10)], 2)) == 13
+    
+    stroke = brush_stroke([(0, 0), (20, 0), (20, 10)], 1)
+    assert len(np.unique(stroke, axis=0)) == len(stroke)
+    covered = {tuple(p) for p in stroke.tolist()}
+    assert {(x, 0) for x in range(21)} <= covered and {(20, y) for y in range(11)} <= covered
+    assert {(x, 1) for x in range(21)} <= covered and (10, 2) not in covered
+
+
+def test_unique_seeds_drop_duplicates_and_outside_points():
+    xs, ys = unique_seeds([(1, 2), (1, 2), (-1, 0), (3, 0), (0, 4), (2, 1)], (4, 3))
+    assert sorted(zip(xs.tolist(), ys.tolist())) == [(1, 2), (2, 1)]
+
+
+def test_stratified_sample_is_deterministic_and_covers_every_bin():
+    rng = np.random.default_rng(3)
+    # A large flat area and a few pixels of a rare color
+    flat = 40 + rng.integers(0, 8, (20000, 3), dtype=np.uint8)
+    pixels = np.concatenate([flat, np.full((30, 3), 200, np.uint8)])
+    rng.shuffle(pixels)
+    sample = stratified_sample(pixels, 500)
+    np.testing.assert_array_equal(sample, stratified_sample(pixels.copy(), 500))
+    assert 400 <= len(sample) <= 520
+    
+    bins = lambda rows: {tuple(row) for row in (rows >> (8 - STRATUM_BITS)).tolist()}
+    assert bins(sample) == bins(pixels)
+    assert (sample == 200).all(axis=1).any()
+    # Every sampled row is an input row
+    rows = {tuple(row) for row in pixels.tolist()}
+    assert all(tuple(row) in rows for row in sample.tolist())
+    
+    small = pixels[:100]
+    assert stratified_sample(small, 500) is small
+
+
+def test_seed_pixels_read_the_colors_under_the_seeds(sample_array):
+    pixels = seed_pixels(sample_array, [(80, 60), (80, 60), (5, 5), (500, 5)])
+    assert sorted(map(tuple, pixels.tolist())) == [(20, 200, 30), (220, 30, 20)]
+    assert len(seed_pixels(sample_array, brush_stroke([(80, 60)], 20), max_samples=100)) <= 110
+    assert len(seed_pixels(sample_array, brush_stroke([(80, 60)], 20), max_samples=None)) > 1000
+
+
+def test_seed_digest_ignores_order_and_duplicates():
+    assert seed_digest([(1, 2), (3, 4)]) == seed_digest(SeedSet([(3, 4), (1, 2), (3, 4)]))
+    assert seed_digest([(1, 2)]) != seed_digest([(2, 1)])
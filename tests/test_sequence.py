@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import sequence
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from sequence import SequenceSegmenter, FrameSource
+
+
+def save_gif(path, sample_array, frames=3):
+    images = [Image.fromarray(np.roll(sample_array, 4 * i, axis=1)) for i in range(frames)]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=100)
+
+
+def test_segments_every_frame(tmp_path, sample_array):
+    source = tmp_path / "clip.gif"
+    save_gif(source, sample_array)
+    result = SequenceSegmenter().segment(str(source), BACKGROUND_SEEDS, OBJECT_SEEDS,
+                                         str(tmp_path / "out"))
+    assert result['success'] and result['frames'] == 3
+    assert len(os.listdir(tmp_path / "out" / "clip_object")) == 3
+
+
+def test_inputs_with_the_same_stem_get_separate_outputs(tmp_path, sample_array):
+    for directory in ('a', 'b'):
+        (tmp_path / directory).mkdir()
+        save_gif(tmp_path / directory / "clip.gif", sample_array)
+    seeds = tmp_path / "seeds.json"
+    seeds.write_text(json.dumps({'background': BACKGROUND_SEEDS, 'object': OBJECT_SEEDS}))
+    
+    output = tmp_path / "out"
+    assert sequence.main([str(tmp_path / "a" / "clip.gif"), str(tmp_path / "b" / "clip.gif"),
+                          '--seeds', str(seeds), '--output', str(output)]) == 0
+    assert {'a_clip_object', 'b_clip_object'} <= set(os.listdir(output))
+
+
+def test_failed_encoder_does_not_hang_on_a_slow_decoder(tmp_path, sample_array, monkeypatch):
+    source = tmp_path / "clip.gif"
+    save_gif(source, sample_array, frames=4)
+    frames = FrameSource.frames
+    
+    def slow_frames(self, start=0):
+        for item in frames(self, start):
+            yield item
+            time.sleep(0.3)
+    
+    monkeypatch.setattr(FrameSource, 'frames', slow_frames)
+    results = []
+    # An extension PIL cannot write makes the encoder fail on the first frame
+    worker = threading.Thread(target=lambda: results.append(SequenceSegmenter().segment(
+        str(source), BACKGROUND_SEEDS, OBJECT_SEEDS, str(tmp_path / "out"), extension='nosuch')),
+        daemon=True)
+    worker.start()
+    worker.join(10)
+    assert not worker.is_alive()
+    assert not results[0]['success']
+
+
+def save_noisy_tiff(path, sample_array, frames=3):
+    """A static 240x320 scene whose later frames carry +-3 levels of noise"""
+    base = np.kron(sample_array, np.ones((2, 2, 1), np.uint8))
+    rng = np.random.default_rng(0)
+    images = [base] + [np.clip(base + rng.integers(-3, 4, base.shape), 0, 255).astype(np.uint8)
+                       for _ in range(frames - 1)]
+    Image.fromarray(images[0]).save(path, save_all=True,
+                                    append_images=[Image.fromarray(i) for i in images[1:]])
+    return images
+
+
+def test_compression_noise_does_not_relabel_tiles(tmp_path, sample_array):
+    source = tmp_path / "noisy.tif"
+    save_noisy_tiff(source, sample_array)
+    seeds = [(2 * x, 2 * y) for x, y in BACKGROUND_SEEDS], [(2 * x, 2 * y) for x, y in OBJECT_SEEDS]
+    result = SequenceSegmenter().segment(str(source), *seeds, str(tmp_path / "out"))
+    assert result['success'] and result['frames'] == 3
+    assert result['full_frames'] == 1 and result['unchanged_frames'] == 2
+    assert result['labeled_tiles'] == result['total_tiles'] // 3
+
+
+def test_frames_with_most_tiles_changed_are_labeled_whole(tmp_path, sample_array):
+    source = tmp_path / "noisy.tif"
+    images = save_noisy_tiff(source, sample_array)
+    seeds = [(2 * x, 2 * y) for x, y in BACKGROUND_SEEDS], [(2 * x, 2 * y) for x, y in OBJECT_SEEDS]
+    segmenter = SequenceSegmenter(change_threshold=0)
+    result = segmenter.segment(str(source), *seeds, str(tmp_path / "out"))
+    assert result['success'] and result['full_frames'] == 3
+    
+    engine = segmenter._fit(images[0], *seeds)
+    for index, image in enumerate(images):
+        expected = image.copy()
+        expected[engine.label(image) != engine.object_cluster] = 255
+        written = Image.open(tmp_path / "out" / "noisy_object" / f"frame_{index:05d}.png")
+        np.testing.assert_array_equal(np.asarray(written), expected)
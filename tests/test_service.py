@@ -0,0 +1,101 @@
+import asyncio
+import base64
+import http.client
+import io
+import json
+import threading
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from service import SegmentationService
+
+
+@pytest.fixture(scope='module')
+def server():
+    """A service with one worker listening on a free localhost port"""
+    service = SegmentationService(workers=1, timeout=60)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    address = {}
+    
+    def run():
+        asyncio.set_event_loop(loop)
+        listening = loop.run_until_complete(service.start('127.0.0.1', 0))
+        address['port'] = listening.sockets[0].getsockname()[1]
+        started.set()
+        loop.run_forever()
+    
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert started.wait(60)
+    yield address['port']
+    asyncio.run_coroutine_threadsafe(service.close(), loop).result(60)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+
+
+def request(port, method, path, payload=None):
+    """Send one request; returns (status, decoded JSON body)"""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def segment_request(sample_array, **overrides):
+    buffer = io.BytesIO()
+    Image.fromarray(sample_array).save(buffer, format='PNG')
+    payload = {'image': base64.b64encode(buffer.getvalue()).decode('ascii'),
+               'background': BACKGROUND_SEEDS, 'object': OBJECT_SEEDS}
+    payload.update(overrides)
+    return payload
+
+
+def test_health(server):
+    assert request(server, 'GET', '/health') == (200, {'status': 'ok'})
+
+
+def test_segment_returns_the_requested_outputs(server, sample_array):
+    status, body = request(server, 'POST', '/segment',
+                           segment_request(sample_array, outputs=['object', 'object_mask']))
+    assert status == 200 and body['success']
+    assert sorted(body['outputs']) == ['object', 'object_mask']
+    mask = np.asarray(Image.open(io.BytesIO(base64.b64decode(body['outputs']['object_mask']))))
+    assert mask.shape == sample_array.shape[:2]
+    assert mask[60, 80] == 255 and mask[5, 5] == 0
+
+
+@pytest.mark.parametrize('point', [[5000, 5000], [-1, 10], [160, 0], [0, 120]])
+def test_seeds_outside_the_image_are_rejected(server, sample_array, point):
+    status, body = request(server, 'POST', '/segment',
+                           segment_request(sample_array, object=OBJECT_SEEDS + [point]))
+    assert status == 422 and not body['success']
+    assert 'outside the 160x120 image' in body['error']
+
+
+@pytest.mark.parametrize('outputs', ['object', {'object': True}, ['object', 'mask']])
+def test_invalid_outputs_are_rejected(server, sample_array, outputs):
+    status, body = request(server, 'POST', '/segment', segment_request(sample_array, outputs=outputs))
+    assert status == 400 and not body['success']
+
+
+def test_malformed_requests(server, sample_array):
+    assert request(server, 'POST', '/segment', {'background': []})[0] == 400
+    assert request(server, 'POST', '/segment', segment_request(sample_array, engine='nope'))[0] == 400
+    assert request(server, 'GET', '/segment')[0] == 405
+    assert request(server, 'GET', '/nowhere')[0] == 404
+
+
+def test_metrics_count_requests(server, sample_array):
+    request(server, 'POST', '/segment', segment_request(sample_array))
+    status, metrics = request(server, 'GET', '/metrics')
+    assert status == 200
+    assert metrics['requests']['succeeded'] >= 1
+    assert metrics['queue_capacity'] > 0 and metrics['workers'] == 1
@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import main
+from startup import StartupProfile, heavy_modules, import_modules
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def imported_after(statement, modules):
+    """Which of modules a fresh interpreter has loaded after running statement"""
+    code = f"import sys; {statement}; print(' '.join(m for m in {modules!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                          text=True, check=True).stdout.split()
+
+
+def test_window_dependencies_do_not_load_the_processing_code():
+    # Everything view.py imports from the application besides Tk and PIL
+    loaded = imported_after("import export, options, viewport",
+                            ['numpy', 'engines', 'morphology', 'presets', 'layers', 'cv2', 'sklearn'])
+    assert loaded == []
+
+
+def test_heavy_modules_follow_the_engine():
+    assert 'cv2' in heavy_modules()
+    assert 'sklearn.cluster' not in heavy_modules('numpy')
+
+
+def test_profile_collects_startup_spans():
+    from instrumentation import tracer
+    
+    profile = tracer.subscribe(StartupProfile())
+    enabled = tracer.enabled
+    tracer.enable()
+    try:
+        import_modules(['json'])
+        profile.mark('done')
+    finally:
+        tracer.unsubscribe(profile)
+        if not enabled:
+            tracer.disable()
+    report = profile.report()
+    assert any('import json' in line for line in report)
+    assert report[-1].endswith('* done')
+
+
+def test_cache_settings_come_from_the_environment(tmp_path):
+    from result_cache import DEFAULT_CACHE_DIR, DEFAULT_DISK_BUDGET
+    
+    assert main.cache_settings({}) == (DEFAULT_CACHE_DIR, DEFAULT_DISK_BUDGET)
+    assert main.cache_settings({main.CACHE_DIR_ENV_VAR: 'off'}) == (None, DEFAULT_DISK_BUDGET)
+    assert main.cache_settings({main.CACHE_DIR_ENV_VAR: str(tmp_path),
+                                main.CACHE_SIZE_ENV_VAR: '1.5'}) == (str(tmp_path), 3 << 19)
+    with pytest.raises(SystemExit):
+        main.cache_settings({main.CACHE_SIZE_ENV_VAR: 'lots'})
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from chain_handlers import ProcessingPipeline
+from model import ImageProcessingModel
+from tiled import TiledSegmenter, FIXED_OVERHEAD, BYTES_PER_PIXEL, OUTPUT_TYPES
+
+
+def reference_outputs(image_path):
+    """The three outputs of the in-memory pipeline"""
+    model = ImageProcessingModel()
+    model.load_image(image_path)
+    for x, y in BACKGROUND_SEEDS:
+        model.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        model.add_object_point(x, y)
+    result = ProcessingPipeline().process(model)
+    assert result['success']
+    return {t: np.asarray(result[t]) for t in OUTPUT_TYPES}
+
+
+@pytest.mark.parametrize('name', ['raw.tif', 'image.bmp', 'image.ppm'])
+def test_streams_raw_formats_like_in_memory(tmp_path, sample_array, name):
+    source = tmp_path / name
+    Image.fromarray(sample_array).save(source)
+    outputs = {t: str(tmp_path / f"{t}.png") for t in OUTPUT_TYPES}
+    
+    # A budget of about 20 rows forces several strips with halos
+    budget = FIXED_OVERHEAD + 20 * sample_array.shape[1] * BYTES_PER_PIXEL
+    result = TiledSegmenter(memory_budget=budget).segment(
+        str(source), BACKGROUND_SEEDS, OBJECT_SEEDS, outputs)
+    
+    assert result['success'] and result['streaming'] and result['strips'] > 1
+    expected = reference_outputs(str(source))
+    for t in OUTPUT_TYPES:
+        np.testing.assert_array_equal(np.asarray(Image.open(outputs[t])), expected[t])
+
+
+def test_numpy_seed_coordinates(tmp_path, sample_array):
+    source = tmp_path / "raw.tif"
+    Image.fromarray(sample_array).save(source)
+    outputs = {t: str(tmp_path / f"{t}.ppm") for t in OUTPUT_TYPES}
+    result = TiledSegmenter().segment(str(source), np.array(BACKGROUND_SEEDS, np.int64),
+                                      np.array(OBJECT_SEEDS, np.int64), outputs)
+    assert result['success']
+
+
+def test_small_budgets_are_accepted():
+    # A few MiB above the fixed overhead fits hundreds of rows of a narrow image
+    segmenter = TiledSegmenter(memory_budget=24 * 1024 * 1024)
+    assert segmenter.rows_per_strip(400) > 100
+    with pytest.raises(ValueError, match="fixed overhead"):
+        TiledSegmenter(memory_budget=FIXED_OVERHEAD).rows_per_strip(400)
+
+
+def test_peak_memory_stays_within_budget(tmp_path):
+    import tracemalloc
+    import sklearn.cluster  # noqa: F401  (imported outside the measurement)
+    
+    # Noise has a distinct color for nearly every pixel: the worst case for the color table
+    rng = np.random.default_rng(0)
+    source = tmp_path / "noise.tif"
+    Image.fromarray(rng.integers(0, 256, (1000, 1500, 3), np.uint8)).save(source)
+    outputs = {t: str(tmp_path / f"{t}.ppm") for t in OUTPUT_TYPES}
+    budget = FIXED_OVERHEAD + 4 * 1024 * 1024
+    
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        result = TiledSegmenter(memory_budget=budget).segment(
+            str(source), [(5, 5), (100, 100)], [(700, 500), (10, 900)], outputs)
+        peak = tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+    assert result['success'] and result['strips'] > 1
+    assert peak < budget
+
+
+def test_compressed_images_must_fit_the_budget(tmp_path, sample_array):
+    source = tmp_path / "image.png"
+    Image.fromarray(sample_array).save(source)
+    outputs = {t: str(tmp_path / f"{t}.ppm") for t in OUTPUT_TYPES}
+    
+    # PNG has no row access, so the whole image is decoded when it fits...
+    result = TiledSegmenter().segment(str(source), BACKGROUND_SEEDS, OBJECT_SEEDS, outputs)
+    assert result['success'] and not result['streaming']
+    
+    # ...and refused with a clear error when it does not
+    with pytest.raises(ValueError, match="cannot be decoded in strips"):
+        TiledSegmenter(memory_budget=FIXED_OVERHEAD + 1024).segment(
+            str(source), BACKGROUND_SEEDS, OBJECT_SEEDS, outputs)
@@ -0,0 +1,57 @@
+import pytest
+
+from viewport import Viewport, MAX_ZOOM
+
+
+def test_fit_shows_the_whole_image():
+    viewport = Viewport((1600, 1200), (400, 400))
+    assert viewport.zoom == 0.25 and viewport.is_fit
+    box, offset, size = viewport.visible_region()
+    assert box == (0.0, 0.0, 1600.0, 1200.0) and offset == (0, 0) and size == (400, 300)
+    
+    # Small images are shown 1:1, never enlarged
+    assert Viewport((100, 50), (400, 400)).zoom == 1.0
+
+
+@pytest.mark.parametrize('zoom_steps', [0, 1, 3, 8])
+def test_canvas_and_image_coordinates_round_trip(zoom_steps):
+    viewport = Viewport((1600, 1200), (400, 300))
+    for _ in range(zoom_steps):
+        viewport.zoom_at(1.5, 120, 80)
+    viewport.pan(-37, 22)
+    for canvas_point in [(0, 0), (120, 80), (399.5, 299.5), (17.25, 250)]:
+        image_point = viewport.to_image(*canvas_point)
+        assert viewport.to_canvas(*image_point) == pytest.approx(canvas_point)
+    for image_point in [(0, 0), (800, 600), (1599, 1199)]:
+        assert viewport.to_image(*viewport.to_canvas(*image_point)) == pytest.approx(image_point)
+
+
+def test_zoom_keeps_the_point_under_the_cursor():
+    viewport = Viewport((1600, 1200), (400, 300))
+    before = viewport.to_image(150, 100)
+    viewport.zoom_at(4, 150, 100)
+    assert viewport.zoom == 1.0 and not viewport.is_fit
+    assert viewport.to_image(150, 100) == pytest.approx(before)
+    
+    for _ in range(10):
+        viewport.zoom_at(4, 150, 100)
+    assert viewport.zoom == MAX_ZOOM
+    viewport.zoom_at(1e-6, 0, 0)
+    assert viewport.is_fit and viewport.origin == (0.0, 0.0)
+
+
+def test_pan_stays_within_the_image():
+    viewport = Viewport((1600, 1200), (400, 300))
+    viewport.zoom_at(4, 0, 0)
+    viewport.pan(100, 100)
+    assert viewport.origin == (0.0, 0.0)
+    viewport.pan(-10000, -10000)
+    assert viewport.origin == (1200.0, 900.0)
+    box, offset, size = viewport.visible_region()
+    assert box == (1200.0, 900.0, 1600.0, 1200.0) and offset == (0, 0) and size == (400, 300)
+    
+    viewport.pan(50, 25)
+    box, offset, size = viewport.visible_region()
+    assert box == (1150.0, 875.0, 1550.0, 1175.0)
+    # Seeds placed on the canvas land on the pixel under the cursor
+    assert viewport.to_image(10.5, 20.5) == (1160.5, 895.5)
@@ -0,0 +1,103 @@
+import gc
+import os
+
+import numpy as np
+
+from conftest import BACKGROUND_SEEDS, OBJECT_SEEDS
+from model import ImageProcessingModel
+from workspace import Workspace
+
+
+def segmented_state(sample_array, shift=0):
+    """Model state of a segmented copy of sample_array"""
+    model = ImageProcessingModel(workers=1)
+    model.set_image(np.roll(sample_array, shift, axis=1))
+    for x, y in BACKGROUND_SEEDS:
+        model.add_background_point(x, y)
+    for x, y in OBJECT_SEEDS:
+        model.add_object_point(x, y)
+    assert model.perform_kmeans_segmentation()
+    return model.get_state()
+
+
+def render(state):
+    """The object view of a model switched to state"""
+    model = ImageProcessingModel(workers=1)
+    model.set_state(state)
+    return np.asarray(model.render('object'))
+
+
+def spill_files(workspace):
+    return sorted(os.listdir(workspace._spill_dir)) if workspace._spill_dir else []
+
+
+def test_spilled_image_pages_back_in_unchanged(tmp_path, sample_array):
+    workspace = Workspace(memory_budget=0, spill_dir=str(tmp_path))
+    first = segmented_state(sample_array)
+    workspace.store('first.png', first)
+    workspace.store('second.png', segmented_state(sample_array, 8), active=True)
+    workspace.trim()
+    
+    # Only the inactive image is spilled, as read-only memory maps
+    assert workspace.spills == 3
+    assert spill_files(workspace) == ['1-image_array.npy', '2-object_mask.npy', '3-eroded_mask.npy']
+    spilled = workspace._entries[os.path.abspath('first.png')].state
+    assert all(isinstance(spilled[name], np.memmap) for name in ('image_array', 'object_mask'))
+    assert spilled['pyramid'] is None
+    assert workspace.resident_bytes() == workspace._entries[os.path.abspath('second.png')].resident_bytes()
+    
+    state = workspace.open('first.png')
+    assert workspace.page_ins == 3
+    for name in ('image_array', 'object_mask', 'eroded_mask'):
+        assert not isinstance(state[name], np.memmap)
+        np.testing.assert_array_equal(state[name], first[name])
+    assert state['object_points'] == first['object_points']
+    
+    np.testing.assert_array_equal(render(state), render(first))
+
+
+def test_unchanged_arrays_are_written_only_once(tmp_path, sample_array):
+    workspace = Workspace(memory_budget=0, spill_dir=str(tmp_path))
+    workspace.store('first.png', segmented_state(sample_array))
+    workspace.trim()
+    state = workspace.open('first.png')
+    workspace.store('first.png', state)
+    workspace.trim()
+    assert workspace.spills == 3 and len(spill_files(workspace)) == 3
+    
+    # A new mask replaces its stale spill file
+    state = workspace.open('first.png')
+    state['object_mask'] = 1 - state['object_mask']
+    workspace.store('first.png', state)
+    assert spill_files(workspace) == ['1-image_array.npy', '3-eroded_mask.npy']
+    workspace.trim()
+    assert spill_files(workspace) == ['1-image_array.npy', '3-eroded_mask.npy', '4-object_mask.npy']
+    np.testing.assert_array_equal(workspace.open('first.png')['object_mask'], state['object_mask'])
+
+
+def test_images_within_the_budget_stay_in_memory(tmp_path, sample_array):
+    workspace = Workspace(spill_dir=str(tmp_path))
+    workspace.store('first.png', segmented_state(sample_array))
+    workspace.trim()
+    assert workspace.spills == 0 and workspace._spill_dir is None
+    assert workspace.open('missing.png') is None
+
+
+def test_closing_images_deletes_their_spill_files(tmp_path, sample_array):
+    workspace = Workspace(memory_budget=0, max_images=2, spill_dir=str(tmp_path))
+    for index in range(3):
+        workspace.store(f'{index}.png', segmented_state(sample_array, index), active=index == 0)
+    workspace.trim()
+    # The active image is kept open even though it is the oldest
+    assert workspace.paths() == [os.path.abspath('2.png'), os.path.abspath('0.png')]
+    assert len(spill_files(workspace)) == 3
+    
+    workspace.close('2.png')
+    assert spill_files(workspace) == [] and '2.png' not in workspace
+    workspace.clear()
+    assert len(workspace) == 0
+    
+    spill_dir = workspace._spill_dir
+    del workspace
+    gc.collect()
+    assert not os.path.exists(spill_dir)
@@ -0,0 +1,349 @@
+"""
+Tiled, bounded-memory segmentation for very large images.
+
+The image is streamed in horizontal strips: each strip is classified with
+centroids trained once on the seed pixels, eroded with a halo of neighbouring
+rows so results match a full-frame erosion, and written to disk before the
+next strip is read. Peak memory is governed by the configured budget instead
+of the image size.
+"""
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from labeling import ColorTableLabeler
+from engines import get_engine, DEFAULT_ENGINE
+from seeds import unique_seeds, stratified_sample
+from instrumentation import span
+
+
+DEFAULT_MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Approximate working bytes per pixel of a strip: input, packed codes, labels,
+# masks, three output strips and encoder buffers
+BYTES_PER_PIXEL = 32
+
+# New colors classified per predict call, and the classifier temporaries
+# (float64 copies and distances) each one costs
+PREDICT_CHUNK = 1 << 16
+BYTES_PER_PREDICTED_COLOR = 64
+
+# Fixed overhead independent of strip size: the 24-bit color table and the
+# classifier temporaries of one chunk of new colors, about 20 MiB
+FIXED_OVERHEAD = (1 << 24) + PREDICT_CHUNK * BYTES_PER_PREDICTED_COLOR
+
+OUTPUT_TYPES = ('object', 'background', 'eroded')
+
+# Bytes per pixel of the raw modes whose rows can be addressed directly
+_RAW_MODE_BYTES = {'L': 1, 'RGB': 3, 'BGR': 3, 'RGBX': 4, 'RGBA': 4, 'BGRX': 4, 'BGRA': 4}
+
+
+class StripReader:
+    """
+    Reads horizontal strips of an image file as RGB uint8 arrays. Files
+    without row access are decoded in full, which has to fit memory_budget.
+    """
+    
+    def __init__(self, path, memory_budget=None):
+        self.path = path
+        self.streaming = True
+        # Memory held for the whole reader, outside the strips
+        self.resident_bytes = 0
+        self._array = None
+        
+        if path.lower().endswith('.npy'):
+            self._array = np.load(path, mmap_mode='r')
+            self.height, self.width = self._array.shape[:2]
+            return
+        
+        with Image.open(path) as image:
+            self.width, self.height = image.size
+            self._mode = image.mode
+            self._bands = len(image.getbands())
+            self._tiles = list(image.tile)
+        
+        if not self._can_stream():
+            # Formats without row access (PNG, JPEG, compressed TIFF) have to
+            # be decoded in one go: the decoded image and its RGB conversion
+            decoded_bytes = self.width * self.height * (self._bands + 3)
+            if memory_budget is not None and decoded_bytes > memory_budget - FIXED_OVERHEAD:
+                raise ValueError(
+                    f"{os.path.basename(path)} cannot be decoded in strips and needs "
+                    f"{decoded_bytes // (1 << 20)} MiB to decode in full, more than the memory "
+                    f"budget allows; convert it to uncompressed TIFF, BMP or PPM")
+            self.streaming = False
+            with Image.open(path) as image:
+                self._array = np.asarray(image.convert('RGB'))
+            self.resident_bytes = self._array.nbytes
+    
+    def _can_stream(self):
+        """Check whether the file layout allows decoding a subset of rows"""
+        if len(self._tiles) > 1:
+            return True
+        if len(self._tiles) == 1 and self._tiles[0][0] == 'raw':
+            rawmode = self._raw_args(self._tiles[0])[0]
+            return rawmode in _RAW_MODE_BYTES
+        return False
+    
+    @staticmethod
+    def _raw_args(tile):
+        """Normalize raw decoder args to (rawmode, stride, orientation)"""
+        args = tile[3]
+        if isinstance(args, str):
+            args = (args,)
+        args = tuple(args) + (0, 1)[len(args) - 1:]
+        return args[0], args[1], args[2]
+    
+    @staticmethod
+    def _make_tile(tile, extents, offset, args):
+        """Copy a PIL tile descriptor with new extents, offset and args"""
+        if hasattr(tile, '_replace'):
+            return tile._replace(extents=extents, offset=offset, args=args)
+        return (tile[0], extents, offset, args)
+    
+    def read_rows(self, top, bottom):
+        """Return rows [top, bottom) as an (rows, width, 3) uint8 array"""
+        # PIL rejects tile extents that are not Python ints
+        top, bottom = int(top), int(bottom)
+        if self._array is not None:
+            return np.ascontiguousarray(self._array[top:bottom, :, :3])
+        
+        if len(self._tiles) == 1:
+            tile = self._tiles[0]
+            rawmode, stride, orientation = self._raw_args(tile)
+            stride = stride or self.width * _RAW_MODE_BYTES[rawmode]
+            first_row = top if orientation >= 0 else self.height - bottom
+            tiles = [self._make_tile(tile, (0, 0, self.width, bottom - top),
+                                     tile[2] + first_row * stride,
+                                     (rawmode, stride, orientation))]
+            region_top, region_bottom = top, bottom
+        else:
+            selected = [t for t in self._tiles if t[1][1] < bottom and t[1][3] > top]
+            region_top = min(t[1][1] for t in selected)
+            region_bottom = max(t[1][3] for t in selected)
+            tiles = []
+            for t in selected:
+                x0, y0, x1, y1 = t[1]
+                tiles.append(self._make_tile(t, (x0, y0 - region_top, x1, y1 - region_top),
+                                             t[2], t[3]))
+        
+        with Image.open(self.path) as image:
+            image._size = (self.width, region_bottom - region_top)
+            if hasattr(image, '_tile_size'):
+                # TIFF allocates its image memory at this size, not at _size
+                image._tile_size = image._size
+            image.tile = tiles
+            image.load()
+            strip = np.asarray(image.convert('RGB'))
+        return np.ascontiguousarray(strip[top - region_top:bottom - region_top])
+    
+    def read_pixels(self, points):
+        """Read the colors of (x, y) points, grouping reads by row"""
+        columns = {}
+        for x, y in points:
+            columns.setdefault(int(y), []).append(int(x))
+        pixels = {}
+        for y in sorted(columns):
+            row = self.read_rows(y, y + 1)[0]
+            for x in columns[y]:
+                pixels[(x, y)] = row[x]
+        return [pixels[(int(x), int(y))] for x, y in points]
+
+
+class StripWriter:
+    """Base class for writers that receive an image one strip at a time"""
+    
+    def __init__(self, path, width, height):
+        self.path = path
+        self.width = width
+        self.height = height
+    
+    def write_rows(self, rows):
+        raise NotImplementedError
+    
+    def close(self):
+        pass
+
+
+class PngStripWriter(StripWriter):
+    """Streams an 8-bit RGB PNG, compressing each strip as it arrives"""
+    
+    def __init__(self, path, width, height, compress_level=6):
+        super().__init__(path, width, height)
+        self._file = open(path, 'wb')
+        self._compressor = zlib.compressobj(compress_level)
+        self._file.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    
+    def _chunk(self, kind, data):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(kind)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+    
+    def write_rows(self, rows):
+        # Every scanline is prefixed with filter type 0 (None)
+        filtered = np.zeros((rows.shape[0], self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self._compressor.compress(filtered.tobytes())
+        if data:
+            self._chunk(b'IDAT', data)
+    
+    def close(self):
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        self._file.close()
+
+
+class PpmStripWriter(StripWriter):
+    """Streams a binary (P6) PPM file"""
+    
+    def __init__(self, path, width, height):
+        super().__init__(path, width, height)
+        self._file = open(path, 'wb')
+        self._file.write(f"P6\n{width} {height}\n255\n".encode('ascii'))
+    
+    def write_rows(self, rows):
+        self._file.write(np.ascontiguousarray(rows).tobytes())
+    
+    def close(self):
+        self._file.close()
+
+
+class NpyStripWriter(StripWriter):
+    """Writes strips into a memory-mapped .npy file"""
+    
+    def __init__(self, path, width, height):
+        super().__init__(path, width, height)
+        self._array = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                                shape=(height, width, 3))
+        self._row = 0
+    
+    def write_rows(self, rows):
+        self._array[self._row:self._row + rows.shape[0]] = rows
+        self._row += rows.shape[0]
+        self._array.flush()
+    
+    def close(self):
+        self._array.flush()
+        del self._array
+
+
+def open_strip_writer(path, width, height):
+    """Create a strip writer for the file extension of path"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.png':
+        return PngStripWriter(path, width, height)
+    if extension in ('.ppm', '.pnm'):
+        return PpmStripWriter(path, width, height)
+    if extension == '.npy':
+        return NpyStripWriter(path, width, height)
+    raise ValueError(f"Tiled mode cannot stream '{extension}' output; use .png, .ppm or .npy")
+
+
+class TiledSegmenter:
+    """
+    Segments an image strip by strip under a memory budget and writes the
+    object, background and eroded outputs incrementally. The budget covers
+    the segmentation working set, on top of the interpreter and libraries.
+    """
+    
+    def __init__(self, memory_budget=DEFAULT_MEMORY_BUDGET, erosion_iterations=1,
+                 engine=DEFAULT_ENGINE):
+        self.memory_budget = memory_budget
+        self.engine = engine
+        self.erosion_iterations = erosion_iterations
+        self.kernel = np.ones((3, 3), np.uint8)
+    
+    @property
+    def halo(self):
+        """Rows of context needed above and below a strip for the erosion"""
+        return self.erosion_iterations * (self.kernel.shape[0] // 2)
+    
+    def rows_per_strip(self, width, resident_bytes=0):
+        """
+        Strip height that keeps the working set within the memory budget,
+        besides resident_bytes already held by the reader
+        """
+        available = self.memory_budget - FIXED_OVERHEAD - resident_bytes
+        if available <= 0:
+            raise ValueError(f"Memory budget of {self.memory_budget} bytes is below the fixed "
+                             f"overhead of {FIXED_OVERHEAD} bytes of tiled mode")
+        rows = available // (width * BYTES_PER_PIXEL) - 2 * self.halo
+        if rows < 1:
+            raise ValueError(f"Memory budget of {self.memory_budget} bytes is too small "
+                             f"for an image {width} pixels wide")
+        return int(rows)
+    
+    def segment(self, image_path, background_points, object_points, output_paths):
+        """
+        Segment image_path and stream the results to output_paths, a dict
+        keyed by 'object', 'background' and 'eroded'.
+        Returns a result dictionary in the same style as the pipeline.
+        """
+        # OpenCV is imported on first use to keep it off the startup path
+        import cv2
+        
+        reader = StripReader(image_path, self.memory_budget)
+        h, w = reader.height, reader.width
+        
+        # Same seed handling as the in-memory path: inside the image, deduplicated
+        background_points = list(zip(*(c.tolist() for c in unique_seeds(background_points, (h, w)))))
+        object_points = list(zip(*(c.tolist() for c in unique_seeds(object_points, (h, w)))))
+        if not background_points or not object_points:
+            return {'success': False, 'error': 'Segmentation failed. Please ensure points are properly selected.'}
+        
+        # Train on the seed pixels only, then classify the whole image strip by strip
+        with span('tiled.fit'):
+            engine = get_engine(self.engine).fit(
+                stratified_sample(np.array(reader.read_pixels(background_points))),
+                stratified_sample(np.array(reader.read_pixels(object_points))))
+        labeler = ColorTableLabeler(engine.predict, chunk_size=PREDICT_CHUNK)
+        obj_cluster = engine.object_cluster
+        
+        rows = self.rows_per_strip(w, reader.resident_bytes)
+        halo = self.halo
+        writers = {t: open_strip_writer(output_paths[t], w, h) for t in OUTPUT_TYPES}
+        strips = 0
+        try:
+            for top in range(0, h, rows):
+                bottom = min(h, top + rows)
+                read_top = max(0, top - halo)
+                read_bottom = min(h, bottom + halo)
+                
+                with span('tiled.read', top=top):
+                    block = reader.read_rows(read_top, read_bottom)
+                with span('tiled.predict', top=top):
+                    object_mask = (labeler.label(block) == obj_cluster).astype(np.uint8)
+                with span('tiled.erode', top=top):
+                    eroded_mask = cv2.erode(object_mask, self.kernel,
+                                            iterations=self.erosion_iterations)
+                
+                # Drop the halo rows now that the erosion has seen them
+                inner = slice(top - read_top, bottom - read_top)
+                pixels = block[inner]
+                object_mask = object_mask[inner]
+                eroded_mask = eroded_mask[inner]
+                
+                with span('tiled.write', top=top):
+                    output = pixels.copy()
+                    output[object_mask == 0] = [255, 255, 255]
+                    writers['object'].write_rows(output)
+                    
+                    output[:] = pixels
+                    output[object_mask == 1] = [255, 255, 255]
+                    writers['background'].write_rows(output)
+                    
+                    output[:] = pixels
+                    output[eroded_mask == 0] = [255, 255, 255]
+                    writers['eroded'].write_rows(output)
+                strips += 1
+        finally:
+            for writer in writers.values():
+                writer.close()
+        
+        return {'success': True, 'strips': strips, 'rows_per_strip': rows,
+                'streaming': reader.streaming}
@@ -1,7 +1,13 @@
+import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from PIL import Image, ImageTk
+from PIL import Image, ImageDraw, ImageTk
+
+# Only modules without NumPy, so the window is drawn before the processing code loads
+from export import DEFAULT_NAME_TEMPLATE, EXPORT_FORMATS
+from options import OPERATIONS, KERNEL_SHAPES, PRESET_EXTENSION, LAYERS_EXTENSION
+from viewport import Viewport
 
 
 class ImageSegmentationView:
@@ -22,13 +28,29 @@ class ImageSegmentationView:
         self.display_image = None
         self.display_photo = None
         self.original_size = None
-        self.scale_factor = 1.0
+        
+        # Zoom and pan of the original image canvas; display_image is the
+        # visible region, drawn at view_offset
+        self.viewport = None
+        self.view_offset = (0, 0)
+        self._render_pending = False
+        self._pan_start = None
         
         # Point selection mode
         self.selection_mode = "background"  # "background" or "object"
         
+        # Seeds are drawn into one transparent layer over the display image;
+        # the brush stroke in progress is kept in display coordinates
+        self.seed_overlay = None
+        self.seed_draw = None
+        self.seed_photo = None
+        self.stroke = None
+        
         # Image display references
         self.result_photos = {}
+        self.preview_photo = None
+        self.preview_mask = None
+        self.result_size = (350, 350)
         
         self._create_widgets()
     
@@ -53,6 +75,27 @@ class ImageSegmentationView:
         
         ttk.Button(upload_frame, text="Browse Image", 
                    command=self._browse_image).pack(side=tk.LEFT, padx=5)
+        ttk.Button(upload_frame, text="Open Folder", 
+                   command=self._open_folder).pack(side=tk.LEFT, padx=5)
+        
+        # Stepping through the folder of the current image
+        ttk.Button(upload_frame, text="< Previous", 
+                   command=self._previous_image).pack(side=tk.LEFT, padx=5)
+        ttk.Button(upload_frame, text="Next >", 
+                   command=self._next_image).pack(side=tk.LEFT, padx=5)
+        self.folder_var = tk.StringVar(value="")
+        ttk.Label(upload_frame, textvariable=self.folder_var).pack(side=tk.LEFT, padx=5)
+        
+        # Images kept open with their seeds and results, most recent first
+        ttk.Label(upload_frame, text="Open images").pack(side=tk.LEFT, padx=5)
+        self.open_images = []
+        self.open_images_var = tk.StringVar(value="")
+        self.open_images_box = ttk.Combobox(upload_frame, textvariable=self.open_images_var,
+                                            state="readonly", width=24)
+        self.open_images_box.pack(side=tk.LEFT, padx=5)
+        self.open_images_box.bind("<<ComboboxSelected>>", self._on_open_image_selected)
+        self.root.bind("<Prior>", lambda event: self._previous_image())
+        self.root.bind("<Next>", lambda event: self._next_image())
         
         self.drop_label = ttk.Label(upload_frame, 
                                      text="Or drag and drop an image here",
@@ -75,12 +118,65 @@ class ImageSegmentationView:
                        variable=self.mode_var, value="object",
                        command=self._change_mode).pack(anchor=tk.W, pady=2)
         
+        brush_frame = ttk.Frame(selection_frame)
+        brush_frame.pack(anchor=tk.W, pady=2)
+        ttk.Label(brush_frame, text="Brush radius").pack(side=tk.LEFT)
+        self.brush_radius_var = tk.IntVar(value=3)
+        ttk.Spinbox(brush_frame, from_=1, to=50, textvariable=self.brush_radius_var,
+                    width=4).pack(side=tk.LEFT, padx=5)
+        
+        self.live_preview_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(selection_frame, text="Live Preview", 
+                        variable=self.live_preview_var,
+                        command=self._toggle_live_preview).pack(anchor=tk.W, pady=2)
+        
+        self.coarse_to_fine_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(selection_frame, text="Coarse-to-Fine", 
+                        variable=self.coarse_to_fine_var,
+                        command=self._toggle_coarse_to_fine).pack(anchor=tk.W, pady=2)
+        
+        # Morphology of the serrated edge stage
+        edge_frame = ttk.LabelFrame(selection_frame, text="Edges", padding="5")
+        edge_frame.pack(pady=5, fill=tk.X)
+        
+        self.edge_operation_var = tk.StringVar(value=OPERATIONS[0])
+        ttk.Combobox(edge_frame, textvariable=self.edge_operation_var, values=OPERATIONS,
+                     state="readonly", width=7).grid(row=0, column=0, padx=2, pady=2)
+        self.edge_shape_var = tk.StringVar(value='rect')
+        ttk.Combobox(edge_frame, textvariable=self.edge_shape_var, values=list(KERNEL_SHAPES),
+                     state="readonly", width=7).grid(row=0, column=1, padx=2, pady=2)
+        
+        ttk.Label(edge_frame, text="Size").grid(row=1, column=0, sticky=tk.W)
+        self.edge_size_var = tk.IntVar(value=3)
+        ttk.Spinbox(edge_frame, from_=1, to=31, increment=2, textvariable=self.edge_size_var,
+                    width=4).grid(row=1, column=1, padx=2, pady=2, sticky=tk.W)
+        ttk.Label(edge_frame, text="Iterations").grid(row=2, column=0, sticky=tk.W)
+        self.edge_iterations_var = tk.IntVar(value=1)
+        ttk.Spinbox(edge_frame, from_=0, to=20, textvariable=self.edge_iterations_var,
+                    width=4).grid(row=2, column=1, padx=2, pady=2, sticky=tk.W)
+        
         ttk.Button(selection_frame, text="Clear All Points", 
                    command=self._clear_points).pack(pady=10, fill=tk.X)
         
+        preset_frame = ttk.Frame(selection_frame)
+        preset_frame.pack(pady=2, fill=tk.X)
+        ttk.Button(preset_frame, text="Save Preset...", 
+                   command=self._save_preset).pack(side=tk.LEFT, expand=True, fill=tk.X)
+        ttk.Button(preset_frame, text="Load Preset...", 
+                   command=self._load_preset).pack(side=tk.LEFT, expand=True, fill=tk.X)
+        
         ttk.Button(selection_frame, text="Process Image", 
                    command=self._process_image).pack(pady=5, fill=tk.X)
         
+        ttk.Button(selection_frame, text="Cancel", 
+                   command=self._cancel_processing).pack(pady=2, fill=tk.X)
+        
+        # Progress of the background processing job
+        self.progress_bar = ttk.Progressbar(selection_frame, mode="determinate", maximum=1)
+        self.progress_bar.pack(pady=2, fill=tk.X)
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(selection_frame, textvariable=self.status_var).pack(anchor=tk.W)
+        
         # Original image display
         left_frame = ttk.LabelFrame(main_frame, text="Original Image", padding="10")
         left_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
@@ -90,6 +186,21 @@ class ImageSegmentationView:
         self.canvas = tk.Canvas(left_frame, bg="white", width=600, height=600)
         self.canvas.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         self.canvas.bind("<Button-1>", self._on_canvas_click)
+        self.canvas.bind("<B1-Motion>", self._on_canvas_drag)
+        self.canvas.bind("<ButtonRelease-1>", self._on_canvas_release)
+        
+        # Wheel zooms around the cursor, right or middle drag pans
+        self.canvas.bind("<MouseWheel>", self._on_canvas_wheel)
+        self.canvas.bind("<Button-4>", lambda event: self._zoom_at(event, 1.25))
+        self.canvas.bind("<Button-5>", lambda event: self._zoom_at(event, 0.8))
+        for button in (2, 3):
+            self.canvas.bind(f"<ButtonPress-{button}>", self._on_pan_start)
+            self.canvas.bind(f"<B{button}-Motion>", self._on_pan_drag)
+        
+        view_frame = ttk.Frame(left_frame)
+        view_frame.grid(row=1, column=0, sticky=(tk.W, tk.E))
+        ttk.Label(view_frame, text="Wheel: zoom, right-drag: pan").pack(side=tk.LEFT)
+        ttk.Button(view_frame, text="Fit", command=self._fit_view).pack(side=tk.RIGHT)
         
         # Results section
         results_frame = ttk.LabelFrame(main_frame, text="Results", padding="10")
@@ -124,6 +235,42 @@ class ImageSegmentationView:
         self.eroded_canvas.pack(pady=5)
         ttk.Button(eroded_frame, text="Download", 
                    command=lambda: self._download_image("eroded")).pack()
+        
+        # Export settings and "save all"
+        export_frame = ttk.Frame(results_frame)
+        export_frame.grid(row=1, column=0, columnspan=3, pady=10, sticky=(tk.W, tk.E))
+        
+        ttk.Label(export_frame, text="Name template").pack(side=tk.LEFT)
+        self.template_var = tk.StringVar(value=DEFAULT_NAME_TEMPLATE)
+        ttk.Entry(export_frame, textvariable=self.template_var, width=18).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(export_frame, text="Format").pack(side=tk.LEFT)
+        self.format_var = tk.StringVar(value=EXPORT_FORMATS[0])
+        ttk.Combobox(export_frame, textvariable=self.format_var, values=EXPORT_FORMATS,
+                     state="readonly", width=5).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(export_frame, text="PNG compression").pack(side=tk.LEFT)
+        self.png_level_var = tk.IntVar(value=6)
+        ttk.Spinbox(export_frame, from_=0, to=9, textvariable=self.png_level_var,
+                    width=3).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Label(export_frame, text="JPEG/WebP quality").pack(side=tk.LEFT)
+        self.quality_var = tk.IntVar(value=90)
+        ttk.Spinbox(export_frame, from_=1, to=100, textvariable=self.quality_var,
+                    width=4).pack(side=tk.LEFT, padx=5)
+        
+        self.alpha_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(export_frame, text="Transparent background", 
+                        variable=self.alpha_var).pack(side=tk.LEFT, padx=5)
+        
+        ttk.Button(export_frame, text="Save All", 
+                   command=self._save_all).pack(side=tk.RIGHT, padx=5)
+        
+        # Masks only, in one small file that refers back to the source image
+        ttk.Button(export_frame, text="Load Layers...", 
+                   command=self._load_layers).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(export_frame, text="Save Layers...", 
+                   command=self._save_layers).pack(side=tk.RIGHT, padx=5)
     
     def _browse_image(self):
         """Open file dialog to browse for image"""
@@ -135,6 +282,12 @@ class ImageSegmentationView:
         if file_path and self.controller:
             self.controller.load_image(file_path)
     
+    def _open_folder(self):
+        """Open a folder of images to step through"""
+        directory = filedialog.askdirectory(title="Select Image Folder")
+        if directory and self.controller:
+            self.controller.open_folder(directory)
+    
     def _on_drop(self, event):
         """Handle drag and drop event"""
         file_path = event.data
@@ -142,61 +295,262 @@ class ImageSegmentationView:
         if file_path.startswith('{') and file_path.endswith('}'):
             file_path = file_path[1:-1]
         if self.controller:
-            self.controller.load_image(file_path)
+            if os.path.isdir(file_path):
+                self.controller.open_folder(file_path)
+            else:
+                self.controller.load_image(file_path)
+    
+    def _on_open_image_selected(self, event):
+        """Switch back to an image that is still open"""
+        index = self.open_images_box.current()
+        if self.controller and 0 <= index < len(self.open_images):
+            self.controller.load_image(self.open_images[index])
+    
+    def _previous_image(self):
+        """Go to the previous image of the folder"""
+        if self.controller:
+            self.controller.previous_image()
+    
+    def _next_image(self):
+        """Go to the next image of the folder"""
+        if self.controller:
+            self.controller.next_image()
     
     def _change_mode(self):
         """Change point selection mode"""
         self.selection_mode = self.mode_var.get()
     
     def _on_canvas_click(self, event):
-        """Handle canvas click for point selection"""
-        if self.controller and self.display_image:
-            # Convert display coordinates to original image coordinates
-            x = int(event.x / self.scale_factor)
-            y = int(event.y / self.scale_factor)
-            
+        """Start a seed stroke; a click without dragging adds a single point"""
+        if self.controller and self.display_image and self.viewport:
+            self.stroke = [(event.x, event.y)]
+            self._draw_seeds([(event.x, event.y)], 3)
+    
+    def _on_canvas_drag(self, event):
+        """Extend the brush stroke in progress"""
+        if self.stroke is not None:
+            self.stroke.append((event.x, event.y))
+            self._draw_seeds(self.stroke[-2:], self._brush_radius())
+    
+    def _on_canvas_release(self, event):
+        """Hand the finished point or stroke to the controller in image coordinates"""
+        stroke, self.stroke = self.stroke, None
+        if not stroke or not self.controller:
+            return
+        
+        # Convert canvas coordinates to original image coordinates
+        points = [tuple(int(v) for v in self.viewport.to_image(x, y)) for x, y in stroke]
+        if len(stroke) == 1:
             if self.selection_mode == "background":
-                self.controller.add_background_point(x, y)
-                # Draw red point
-                self.canvas.create_oval(event.x-3, event.y-3, event.x+3, event.y+3, 
-                                       fill="red", outline="red")
+                self.controller.add_background_point(*points[0])
             else:
-                self.controller.add_object_point(x, y)
-                # Draw blue point
-                self.canvas.create_oval(event.x-3, event.y-3, event.x+3, event.y+3, 
-                                       fill="blue", outline="blue")
+                self.controller.add_object_point(*points[0])
+        else:
+            radius = self._brush_radius() / self.viewport.zoom
+            if self.selection_mode == "background":
+                self.controller.add_background_stroke(points, radius)
+            else:
+                self.controller.add_object_stroke(points, radius)
+    
+    def _brush_radius(self):
+        """Brush radius in display pixels"""
+        try:
+            return max(1, self.brush_radius_var.get())
+        except tk.TclError:
+            return 3
+    
+    def _draw_seeds(self, points, radius):
+        """Paint a dot or a stroke segment in the current mode's color into the seed layer"""
+        if self.seed_overlay is None:
+            return
+        color = "red" if self.selection_mode == "background" else "blue"
+        points = [(x - self.view_offset[0], y - self.view_offset[1]) for x, y in points]
+        if len(points) > 1:
+            self.seed_draw.line(points, fill=color, width=2 * radius + 1)
+        for x, y in points:
+            self.seed_draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill=color)
+        self.seed_photo.paste(self.seed_overlay)
+    
+    def _reset_seed_overlay(self):
+        """Start an empty seed layer the size of the display image"""
+        self.seed_overlay = Image.new("RGBA", self.display_image.size, (0, 0, 0, 0))
+        self.seed_draw = ImageDraw.Draw(self.seed_overlay)
+        self.seed_photo = ImageTk.PhotoImage(self.seed_overlay)
+    
+    def _on_canvas_wheel(self, event):
+        """Zoom with the mouse wheel (Windows and macOS)"""
+        self._zoom_at(event, 1.25 if event.delta > 0 else 0.8)
+    
+    def _zoom_at(self, event, factor):
+        """Zoom the original image around the cursor"""
+        if self.viewport is not None and self.stroke is None:
+            self.viewport.zoom_at(factor, event.x, event.y)
+            self._schedule_render()
+    
+    def _on_pan_start(self, event):
+        """Start panning the original image"""
+        self._pan_start = (event.x, event.y)
+    
+    def _on_pan_drag(self, event):
+        """Pan the original image with the pointer"""
+        if self.viewport is None or self._pan_start is None:
+            return
+        self.viewport.pan(event.x - self._pan_start[0], event.y - self._pan_start[1])
+        self._pan_start = (event.x, event.y)
+        self._schedule_render()
+    
+    def _fit_view(self):
+        """Show the whole original image again"""
+        if self.viewport is not None:
+            self.viewport.fit()
+            self._schedule_render()
+    
+    def _schedule_render(self):
+        """Render the viewport once the pending pan and zoom events are handled"""
+        if not self._render_pending:
+            self._render_pending = True
+            self.root.after_idle(self._render_viewport)
+    
+    def _render_viewport(self):
+        """Draw the visible region of the original image, its seeds and the preview"""
+        self._render_pending = False
+        if self.viewport is None or not self.controller:
+            return
+        box, offset, size = self.viewport.visible_region()
+        # Magnified pixels stay sharp so seeds can be placed on exact pixels
+        resample = Image.Resampling.NEAREST if self.viewport.zoom > 1 else Image.Resampling.BILINEAR
+        rendered = self.controller.render_view(box, size, resample)
+        if rendered is None:
+            return
+        
+        self.display_image, self.seed_overlay = rendered
+        self.view_offset = offset
+        self.display_photo = ImageTk.PhotoImage(self.display_image)
+        self.seed_draw = ImageDraw.Draw(self.seed_overlay)
+        self.seed_photo = ImageTk.PhotoImage(self.seed_overlay)
+        self._redraw_original_image()
+        if self.preview_mask is not None:
+            self.display_preview_mask(self.preview_mask)
+    
+    def _toggle_live_preview(self):
+        """Enable or disable the live preview overlay"""
+        if self.controller:
+            self.controller.set_live_preview(self.live_preview_var.get())
+    
+    def _toggle_coarse_to_fine(self):
+        """Enable or disable coarse-to-fine processing"""
+        if self.controller:
+            self.controller.set_coarse_to_fine(self.coarse_to_fine_var.get())
     
     def _clear_points(self):
         """Clear all selected points"""
         if self.controller:
             self.controller.clear_points()
-            self.display_original_image(self.display_image)
+            self.preview_mask = None
+            if self.display_image is not None:
+                self._reset_seed_overlay()
+            self._redraw_original_image()
     
     def _process_image(self):
         """Process the image with selected points"""
         if self.controller:
             self.controller.process_image()
     
+    def _cancel_processing(self):
+        """Cancel the processing job in flight"""
+        if self.controller:
+            self.controller.cancel_processing()
+    
+    def _save_preset(self):
+        """Save the trained color model and edge settings as a preset file"""
+        if self.controller:
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=PRESET_EXTENSION,
+                filetypes=[("Presets", f"*{PRESET_EXTENSION}"), ("All files", "*.*")]
+            )
+            if file_path:
+                self.controller.save_preset(file_path)
+    
+    def _load_preset(self):
+        """Segment with a preset file instead of seed points"""
+        if self.controller:
+            file_path = filedialog.askopenfilename(
+                title="Load Preset",
+                filetypes=[("Presets", f"*{PRESET_EXTENSION}"), ("All files", "*.*")]
+            )
+            if file_path:
+                self.controller.load_preset(file_path)
+    
     def _download_image(self, image_type):
         """Download a result image"""
         if self.controller:
             file_path = filedialog.asksaveasfilename(
                 defaultextension=".png",
                 filetypes=[("PNG files", "*.png"), ("JPEG files", "*.jpg"), 
-                          ("All files", "*.*")]
+                          ("WebP files", "*.webp"), ("All files", "*.*")]
             )
             if file_path:
                 self.controller.save_image(image_type, file_path)
     
-    def display_original_image(self, image):
-        """Display the original image on canvas"""
-        if not image:
-            return
-        
-        self.display_image = image
-        self.original_size = image.size
-        
-        # Calculate scale factor to fit canvas
+    def _save_all(self):
+        """Save all three result images to a directory"""
+        if self.controller:
+            directory = filedialog.askdirectory(mustexist=True)
+            if directory:
+                self.controller.save_all(directory, self.template_var.get(), self.format_var.get())
+    
+    def _save_layers(self):
+        """Save the masks as a layered result file"""
+        if self.controller:
+            file_path = filedialog.asksaveasfilename(
+                defaultextension=LAYERS_EXTENSION,
+                filetypes=[("Layered results", f"*{LAYERS_EXTENSION}"), ("All files", "*.*")]
+            )
+            if file_path:
+                self.controller.save_layers(file_path)
+    
+    def _load_layers(self):
+        """Show a saved layered result together with its source image"""
+        if self.controller:
+            file_path = filedialog.askopenfilename(
+                title="Load Layers",
+                filetypes=[("Layered results", f"*{LAYERS_EXTENSION}"), ("All files", "*.*")]
+            )
+            if file_path:
+                self.controller.load_layers(file_path)
+    
+    def export_alpha(self):
+        """Whether exports keep removed pixels transparent instead of white"""
+        return self.alpha_var.get()
+    
+    def encoder_settings(self):
+        """Encoder options chosen in the export settings"""
+        try:
+            png_level = self.png_level_var.get()
+            quality = self.quality_var.get()
+        except tk.TclError:
+            raise ValueError("compression level and quality must be whole numbers")
+        return {'png_compress_level': png_level, 'jpeg_quality': quality, 'webp_quality': quality}
+    
+    def morphology_settings(self):
+        """Edge stage options chosen in the edge settings"""
+        try:
+            size = self.edge_size_var.get()
+            iterations = self.edge_iterations_var.get()
+        except tk.TclError:
+            raise ValueError("kernel size and iterations must be whole numbers")
+        return {'operation': self.edge_operation_var.get(), 'shape': self.edge_shape_var.get(),
+                'size': size, 'iterations': iterations}
+    
+    def set_morphology_settings(self, morphology):
+        """Show the edge stage options of a morphology.Morphology"""
+        self.edge_operation_var.set(morphology.operation)
+        self.edge_shape_var.set(morphology.shape)
+        self.edge_size_var.set(morphology.size)
+        self.edge_iterations_var.set(morphology.iterations)
+    
+    def canvas_size(self):
+        """Current size of the original image canvas"""
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
         
@@ -204,21 +558,79 @@ class ImageSegmentationView:
             canvas_width = 600
         if canvas_height <= 1:
             canvas_height = 600
+        return canvas_width, canvas_height
+    
+    def display_original_image(self, image, original_size=None):
+        """
+        Display the original image on canvas.
+        When original_size is given, image is an already fitted display
+        rendition of an image of that full size and is drawn as is.
+        """
+        if not image:
+            return
         
-        width_scale = canvas_width / image.size[0]
-        height_scale = canvas_height / image.size[1]
-        self.scale_factor = min(width_scale, height_scale, 1.0)
+        if original_size is not None:
+            self.original_size = tuple(original_size)
+            self.display_image = image
+        else:
+            self.original_size = image.size
+            
+            # Calculate scale factor to fit canvas
+            canvas_width, canvas_height = self.canvas_size()
+            width_scale = canvas_width / image.size[0]
+            height_scale = canvas_height / image.size[1]
+            scale_factor = min(width_scale, height_scale, 1.0)
+            
+            # Resize image for display; only the display-size copy is kept
+            new_size = (int(image.size[0] * scale_factor), 
+                       int(image.size[1] * scale_factor))
+            self.display_image = image.resize(new_size, Image.Resampling.LANCZOS)
         
-        # Resize image for display
-        new_size = (int(image.size[0] * self.scale_factor), 
-                   int(image.size[1] * self.scale_factor))
-        display_img = image.resize(new_size, Image.Resampling.LANCZOS)
+        # A new image starts fitted to the canvas, without the old preview
+        self.preview_mask = None
+        self.viewport = Viewport(self.original_size, self.canvas_size())
+        self.viewport.zoom = self.display_image.size[0] / self.original_size[0]
+        self.view_offset = (0, 0)
+        self.display_photo = ImageTk.PhotoImage(self.display_image)
+        self._reset_seed_overlay()
+        self._redraw_original_image()
+    
+    def _redraw_original_image(self):
+        """Clear the canvas and draw the display image without resampling it"""
+        if self.display_photo is None:
+            return
+        self.canvas.delete("all")
+        x, y = self.view_offset
+        self.canvas.create_image(x, y, anchor=tk.NW, image=self.display_photo, tags="base")
+        if self.seed_photo is not None:
+            self.canvas.create_image(x, y, anchor=tk.NW, image=self.seed_photo, tags="seeds")
+    
+    def display_preview_mask(self, mask):
+        """Overlay a preview object mask on the original image canvas"""
+        self.preview_mask = mask
+        if self.display_photo is None or self.viewport is None:
+            return
         
-        self.display_photo = ImageTk.PhotoImage(display_img)
+        # The mask covers the whole image; show the part in view
+        box, _, size = self.viewport.visible_region()
+        sx = mask.shape[1] / self.original_size[0]
+        sy = mask.shape[0] / self.original_size[1]
+        alpha = Image.fromarray(mask * 110).resize(
+            size, Image.Resampling.NEAREST, box=(box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy))
+        overlay = Image.new("RGBA", size, (0, 120, 255, 0))
+        overlay.putalpha(alpha)
+        self.preview_photo = ImageTk.PhotoImage(overlay)
         
-        # Clear canvas and display image
-        self.canvas.delete("all")
-        self.canvas.create_image(0, 0, anchor=tk.NW, image=self.display_photo)
+        # Keep the overlay between the image and the seed points
+        self.canvas.delete("preview")
+        self.canvas.create_image(*self.view_offset, anchor=tk.NW, image=self.preview_photo, tags="preview")
+        self.canvas.tag_raise("preview", "base")
+    
+    def clear_preview(self):
+        """Remove the preview overlay"""
+        self.canvas.delete("preview")
+        self.preview_photo = None
+        self.preview_mask = None
     
     def display_results(self, object_img, background_img, eroded_img):
         """Display the three result images"""
@@ -249,6 +661,39 @@ class ImageSegmentationView:
         new_size = (int(image.size[0] * scale), int(image.size[1] * scale))
         return image.resize(new_size, Image.Resampling.LANCZOS)
     
+    def run_on_ui_thread(self, callback):
+        """Schedule a callback on the Tk main loop (safe to call from worker threads)"""
+        self.root.after(0, callback)
+    
+    def show_progress(self, stage_name, step, total_steps):
+        """Show the current processing stage"""
+        self.progress_bar.configure(maximum=max(total_steps, 1), value=max(step - 1, 0))
+        self.status_var.set(f"{stage_name}... ({step}/{total_steps})" if step else f"{stage_name}...")
+    
+    def hide_progress(self, status=""):
+        """Reset the progress display once a job has finished"""
+        self.progress_bar.configure(value=0)
+        self.status_var.set(status)
+    
+    def show_folder_position(self, position, count, name):
+        """Show which image of the folder is displayed"""
+        self.folder_var.set(f"{position} / {count}  {name}")
+    
+    def show_open_images(self, paths):
+        """List the open images, the current one first"""
+        self.open_images = list(paths)
+        self.open_images_box.configure(values=[os.path.basename(p) for p in self.open_images])
+        if self.open_images:
+            self.open_images_box.current(0)
+    
+    def refresh_view(self):
+        """Redraw the visible region with the model's seeds, e.g. after reopening an image"""
+        self._schedule_render()
+    
+    def show_status(self, status):
+        """Show a short non-blocking status line"""
+        self.status_var.set(status)
+    
     def show_message(self, title, message, msg_type="info"):
         """Show a message dialog"""
         if msg_type == "error":
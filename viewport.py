@@ -0,0 +1,82 @@
+"""
+Zoom and pan state of the original image canvas.
+
+The viewport maps between canvas pixels and full-resolution image pixels.
+Rendering asks it for the visible region only, so the cost of a redraw
+depends on the canvas size and not on the image size. Seeds placed on the
+canvas go through the same transform, so they land on the pixel under the
+cursor at any zoom.
+"""
+
+
+# Largest magnification, in canvas pixels per image pixel
+MAX_ZOOM = 16.0
+
+
+class Viewport:
+    """Zoomable, pannable window of an image shown on a canvas"""
+    
+    def __init__(self, image_size, canvas_size):
+        self.image_size = tuple(image_size)
+        self.canvas_size = tuple(canvas_size)
+        self.fit()
+    
+    @property
+    def min_zoom(self):
+        """Zoom at which the whole image fits the canvas, never above 1:1"""
+        return min(self.canvas_size[0] / self.image_size[0],
+                   self.canvas_size[1] / self.image_size[1], 1.0)
+    
+    @property
+    def is_fit(self):
+        """Whether the whole image is shown"""
+        return self.zoom <= self.min_zoom
+    
+    def fit(self):
+        """Show the whole image at the top left of the canvas"""
+        self.zoom = self.min_zoom
+        self.origin = (0.0, 0.0)
+        self._clamp()
+    
+    def zoom_at(self, factor, canvas_x, canvas_y):
+        """Zoom by factor, keeping the image point under (canvas_x, canvas_y) in place"""
+        x, y = self.to_image(canvas_x, canvas_y)
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), MAX_ZOOM)
+        self.origin = (x - canvas_x / self.zoom, y - canvas_y / self.zoom)
+        self._clamp()
+    
+    def pan(self, dx, dy):
+        """Move the view by (dx, dy) canvas pixels"""
+        self.origin = (self.origin[0] - dx / self.zoom, self.origin[1] - dy / self.zoom)
+        self._clamp()
+    
+    def to_image(self, canvas_x, canvas_y):
+        """Image coordinates (floats) of a canvas point"""
+        return (self.origin[0] + canvas_x / self.zoom, self.origin[1] + canvas_y / self.zoom)
+    
+    def to_canvas(self, x, y):
+        """Canvas coordinates of an image point"""
+        return ((x - self.origin[0]) * self.zoom, (y - self.origin[1]) * self.zoom)
+    
+    def visible_region(self):
+        """
+        The visible part of the image as (box, offset, size): box is
+        (left, top, right, bottom) in image pixels, drawn at canvas offset
+        (x, y) with size (width, height) in canvas pixels
+        """
+        left, top = max(0.0, self.origin[0]), max(0.0, self.origin[1])
+        right = min(float(self.image_size[0]), self.origin[0] + self.canvas_size[0] / self.zoom)
+        bottom = min(float(self.image_size[1]), self.origin[1] + self.canvas_size[1] / self.zoom)
+        x, y = self.to_canvas(left, top)
+        width = max(1, int(round((right - left) * self.zoom)))
+        height = max(1, int(round((bottom - top) * self.zoom)))
+        return (left, top, right, bottom), (int(round(x)), int(round(y))), (width, height)
+    
+    def _clamp(self):
+        """Keep the image against the top left when it is smaller than the canvas, in view otherwise"""
+        origin = []
+        for axis in (0, 1):
+            extent = self.canvas_size[axis] / self.zoom
+            limit = self.image_size[axis] - extent
+            origin.append(0.0 if limit <= 0 else min(max(self.origin[axis], 0.0), limit))
+        self.origin = tuple(origin)
@@ -0,0 +1,201 @@
+"""
+Workspace of open images.
+
+Switching to another image keeps the previous one open with its seeds and
+results, so revisiting it needs neither a decode nor a new segmentation.
+The pixel data of every open image counts against a memory budget; when
+it is exceeded, the least recently used images are spilled to .npy files
+in a temporary directory and kept as read-only memory maps, which the
+operating system can drop without swapping. Opening a spilled image pages
+its arrays back in. Images never change once loaded, so an array is
+written to disk only once and later evictions just drop it from memory.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+
+# Memory for the pixel data and masks of all open images
+DEFAULT_WORKSPACE_BUDGET = 4 << 30
+
+# Open images kept at most; the least recently used are closed beyond that
+DEFAULT_MAX_IMAGES = 64
+
+# State entries holding large arrays that can be spilled to disk
+SPILLABLE = ('image_array', 'object_mask', 'eroded_mask')
+
+
+class WorkspaceEntry:
+    """One open image: the model state saved by ImageProcessingModel.get_state"""
+    
+    def __init__(self, key):
+        self.key = key
+        self.state = {}
+        # (spill file, weak reference to the array it mirrors) of each array
+        # that has an up-to-date copy on disk
+        self.spilled = {}
+    
+    def resident_bytes(self):
+        """Memory held by the arrays and pyramid that are not spilled"""
+        total = sum(array.nbytes for name, array in self._arrays() if not isinstance(array, np.memmap))
+        pyramid = self.state.get('pyramid')
+        return total + (pyramid.nbytes if pyramid is not None else 0)
+    
+    def _arrays(self):
+        return [(name, self.state[name]) for name in SPILLABLE if self.state.get(name) is not None]
+
+
+class Workspace:
+    """
+    Open images with their seeds and results, least recently used first,
+    within a memory budget
+    """
+    
+    def __init__(self, memory_budget=DEFAULT_WORKSPACE_BUDGET, max_images=DEFAULT_MAX_IMAGES,
+                 spill_dir=None):
+        self.memory_budget = memory_budget
+        self.max_images = max_images
+        self._spill_root = spill_dir
+        self._spill_dir = None
+        self._entries = OrderedDict()
+        self._active = None
+        self._lock = threading.Lock()
+        self.spills = 0
+        self.page_ins = 0
+    
+    def store(self, path, state, active=False):
+        """
+        Keep the state of an open image, replacing what was stored for it.
+        The active image is the one shown by the model; it is never spilled.
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key) or WorkspaceEntry(key)
+            for name, (spill_path, mirrored) in list(entry.spilled.items()):
+                # A spilled copy stays valid only while the array is unchanged
+                if state.get(name) is not mirrored():
+                    del entry.spilled[name]
+                    _remove(spill_path)
+            entry.state = dict(state)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if active:
+                self._active = key
+            elif self._active == key:
+                self._active = None
+    
+    def open(self, path):
+        """
+        The stored state of an open image with its spilled arrays paged back
+        into memory, or None if the image is not open
+        """
+        key = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            for name, array in entry._arrays():
+                if isinstance(array, np.memmap):
+                    paged_in = np.array(array)
+                    entry.state[name] = paged_in
+                    entry.spilled[name] = (entry.spilled[name][0], weakref.ref(paged_in))
+                    self.page_ins += 1
+            return dict(entry.state)
+    
+    def trim(self):
+        """
+        Spill the least recently used images until the open images fit the
+        budget, and close the oldest ones beyond max_images. Writes to disk,
+        so it is meant for worker threads.
+        """
+        with self._lock:
+            while len(self._entries) > self.max_images:
+                oldest = next((k for k in self._entries if k != self._active), None)
+                if oldest is None:
+                    break
+                self._drop(self._entries.pop(oldest))
+            
+            resident = self._resident_bytes()
+            for key, entry in self._entries.items():
+                if resident <= self.memory_budget:
+                    break
+                if key != self._active:
+                    before = entry.resident_bytes()
+                    self._spill(entry)
+                    resident -= before - entry.resident_bytes()
+    
+    def close(self, path):
+        """Forget an open image and delete its spill files"""
+        with self._lock:
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self._drop(entry)
+    
+    def paths(self):
+        """Paths of the open images, most recently used first"""
+        with self._lock:
+            return list(reversed(self._entries))
+    
+    def resident_bytes(self):
+        """Memory held by all open images"""
+        with self._lock:
+            return self._resident_bytes()
+    
+    def _resident_bytes(self):
+        return sum(entry.resident_bytes() for entry in self._entries.values())
+    
+    def clear(self):
+        """Close every image"""
+        with self._lock:
+            for entry in self._entries.values():
+                self._drop(entry)
+            self._entries.clear()
+            self._active = None
+    
+    def __contains__(self, path):
+        with self._lock:
+            return os.path.abspath(path) in self._entries
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def _spill(self, entry):
+        """Replace the arrays of an entry with memory maps of their spill files"""
+        for name, array in entry._arrays():
+            if isinstance(array, np.memmap):
+                continue
+            if name not in entry.spilled:
+                self.spills += 1
+                spill_path = os.path.join(self._get_spill_dir(), f"{self.spills}-{name}.npy")
+                np.save(spill_path, array)
+                entry.spilled[name] = (spill_path, weakref.ref(array))
+            entry.state[name] = np.load(entry.spilled[name][0], mmap_mode='r')
+        # The display pyramid is rebuilt from the image when it is opened again
+        entry.state['pyramid'] = None
+    
+    def _drop(self, entry):
+        entry.state = {}
+        for spill_path, _ in entry.spilled.values():
+            _remove(spill_path)
+        entry.spilled.clear()
+    
+    def _get_spill_dir(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='image-decomposer-', dir=self._spill_root)
+            # Spill files do not outlive the workspace or the process
+            weakref.finalize(self, shutil.rmtree, self._spill_dir, True)
+        return self._spill_dir
+
+
+def _remove(path):
+    """Delete a spill file, ignoring one that is already gone or still mapped"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass